@@ -1,11 +1,14 @@
 # multi_agent/agents/legal_agents.py
 
 from crewai import Agent
-from config import llm
+from config import get_llm
 
 # 直接从工具文件导入由装饰器生成的、可用的工具列表
 from tools.legal_tools import available_tools
 
+# Agent 需要在创建时绑定 LLM，因此 LLM 在导入本模块时创建；工作流 (workflow/legal_workflow.py) 在首次构建 Crew 模板时才导入本模块
+llm = get_llm()
+
 # --- Agent 定义 ---
 
 # 1. 法律咨询协调员 Agent
@@ -1,97 +1,400 @@
 # config.py (配置Y)
+# 导入本模块没有副作用：只读取环境变量生成 settings，不创建 LLM、不写环境变量、不打印。
+# LLM 在首次调用 get_llm() (或首次访问 config.llm) 时才创建，LiteLLM 所需的环境变量也在那时写入。
 
 import os
+import threading
 import traceback
-# 从 langchain_openai 更改为从 langchain_ollama 导入 ChatOllama
-from langchain_ollama import ChatOllama # <--- 修改点 1
+from dataclasses import dataclass, field
 
-# --- 设置环境变量 ---
-# 确保这些环境变量被设置，供 LiteLLM 使用
-# 根据您的第一个代码片段，这里使用 Ollama 的默认端口 11434
-LLM_BASE_URL_FOR_ENV = os.getenv("LLM_BASE_URL", "http://localhost:8000") # <--- 修改点 2: 更改为 11434
-LLM_API_KEY_FOR_ENV = os.getenv("LLM_API_KEY", "ollama") # Ollama通常不需要API Key，但LiteLLM可能需要非空字符串，这里可以用'ollama'或其他任意字符串
+_project_root = os.path.dirname(os.path.abspath(__file__))
 
-print(f"--- INFO: 正在设置 OPENAI_API_BASE 环境变量为: '{LLM_BASE_URL_FOR_ENV}' ---")
-os.environ["OPENAI_API_BASE"] = LLM_BASE_URL_FOR_ENV
 
-print(f"--- INFO: 正在设置 OPENAI_API_KEY 环境变量为: '{LLM_API_KEY_FOR_ENV}' ---")
-os.environ["OPENAI_API_KEY"] = LLM_API_KEY_FOR_ENV
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
 
-# --- LLM 配置 ---
-# !!! 关键：模型名称必须带有 'ollama/' 前缀给 LiteLLM !!!
-LLM_MODEL_FOR_LITELLM_PROVIDER_ID = os.getenv("LLM_MODEL", "ollama/qwen3:8b") # <--- 修改点 3: 确保是 'ollama/你的模型名称'
 
+def _env_list(name: str, default: str = "") -> frozenset:
+    """逗号分隔的环境变量 -> 大写字符串集合。"""
+    return frozenset(t.strip().upper() for t in os.getenv(name, default).split(",") if t.strip())
+
+
+@dataclass(frozen=True)
+class Settings:
+    """所有运行配置的只读快照，由环境变量生成 (见 Settings.from_env)。"""
+
+    # --- LLM 连接 ---
+    # 根据您的第一个代码片段，这里使用 Ollama 的默认端口 11434
+    llm_base_url: str = "http://localhost:8000"
+    # Ollama通常不需要API Key，但LiteLLM可能需要非空字符串，这里可以用'ollama'或其他任意字符串
+    llm_api_key: str = "ollama"
+    # !!! 关键：模型名称必须带有 'ollama/' 前缀给 LiteLLM !!!
+    llm_model: str = "ollama/qwen3:8b"
+
+    # --- 日志 ---
+    log_level: str = "INFO"           # 'DEBUG' 时打印 LLM 连接等调试信息
+    litellm_log: str = "ERROR"        # 传给 LiteLLM 的 LITELLM_LOG (调试时可设为 DEBUG)
+
+    # --- 工作流 ---
+    # 快速路由模式: 'hybrid' (规则 + 嵌入分类器), 'rules' (仅规则), 'off' (总是由 LLM 协调员决策)
+    router_mode: str = "hybrid"
+    # 工具执行模式: 'python' (由 Python 直接解析指令并调用工具), 'agent' (由工具执行专员 Agent 以 ReAct 方式执行)
+    tool_executor_mode: str = "python"
+    # python 工具执行模式下，以 LAS / SCM 开头的分支先由 LLM 将用户口语化的提问改写为结构化事实陈述再检索
+    # (与工具执行专员 Agent 的查询重写一致)；关闭后直接使用原始提问，省去一次 LLM 调用
+    query_rewrite_enabled: bool = True
+    # 是否在命令行中流式输出最终回复 (仅 python 工具执行模式下可逐 token 输出)
+    stream_output: bool = True
+
+    # --- 回答缓存 ---
+    response_cache_enabled: bool = True
+    response_cache_path: str = os.path.join(_project_root, ".cache", "response_cache.sqlite3")
+    response_cache_similarity_threshold: float = 0.95   # 余弦相似度阈值
+    response_cache_max_entries: int = 2000
+    response_cache_max_age_seconds: float = 7 * 24 * 3600
+    response_cache_history_turns: int = 2              # 原样参与指纹计算的最近历史条数 (更早对话中的关键事实也计入指纹)
+
+    # --- HTTP 服务 (server.py) ---
+    server_host: str = "127.0.0.1"
+    server_port: int = 8080
+    server_workers: int = 8                # 执行工作流的线程数
+    server_max_concurrency: int = 8        # 同时执行的工作流数量上限
+    server_queue_timeout: float = 30       # 排队等待执行的最长秒数，超时返回 503
+    server_session_ttl: float = 3600       # 会话空闲过期时间 (秒)
+    server_max_sessions: int = 1000
+    server_shutdown_timeout: float = 60    # 优雅停机时等待进行中请求的最长秒数
+
+    # --- 端到端时间预算 (每轮请求，见 tools/deadline.py) ---
+    request_deadline_seconds: float = 90.0      # 单轮请求的总预算 (秒)，0 表示不限制
+    deadline_synthesis_reserve: float = 20.0    # 预留给回复整合的秒数；工具阶段的剩余时间低于该值时不再执行工具
+    deadline_low_watermark: float = 40.0        # 剩余时间低于该值时跳过可选工具、减少检索数量
+    deadline_optional_tools: frozenset = frozenset({"WEB", "SCM"})
+    deadline_low_k: int = 2                     # 时间紧张时 LAS / SCM 的检索数量上限
+    deadline_low_fetch_k: int = 5               # 时间紧张时 LAS 的 MMR 候选数量上限
+    deadline_low_max_iter: int = 2              # 时间紧张时 CrewAI Agent 的最大迭代次数
+
+    # --- 工具级 LLM 结果缓存 (LCP/LER/LED/LTS、检索查询重写 QRW、对话摘要 MEM) ---
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = os.path.join(_project_root, ".cache", "llm_cache.sqlite3")
+    llm_cache_memory_entries: int = 512
+    llm_cache_disabled_tools: frozenset = field(default_factory=frozenset)  # 不使用缓存的工具缩写，例如 {"LTS", "LED"}
+
+    # --- 对话记忆 (传给 Agent 的对话历史视图) ---
+    memory_token_budget: int = 1500        # 历史视图的 token 预算 (估算值)
+    memory_recent_turns: int = 3           # 原样保留的最近对话轮数 (一问一答为一轮)
+    memory_entry_max_tokens: int = 300     # 最近对话中单条 (当前提问除外) 的 token 上限
+    memory_summary_max_tokens: int = 400   # 早先对话摘要的 token 上限
+    # 摘要方式: 'llm' (由 LLM 增量更新摘要，失败时回退到抽取式), 'extractive' (不调用 LLM，截取各条对话的开头)
+    memory_summary_mode: str = "llm"
+
+    # --- 法条检索 (LAS) ---
+    # 检索方式: 'hybrid' (词法 BM25 + 向量检索，倒数排名融合), 'dense' (仅向量 MMR), 'lexical' (仅词法)
+    las_retrieval_mode: str = "hybrid"
+    las_rrf_k: int = 60                    # RRF 融合常数
+    las_keyword_max_chars: int = 12        # 不超过该长度的关键词式查询在 hybrid 模式下只走词法检索
+
+    # --- 查询编码器 (LAS/SCM/路由共用的嵌入模型) ---
+    # 'torch' (sentence-transformers，自动使用 GPU) 或 'onnx' (scripts/export_onnx_encoder.py 导出的动态 int8 量化模型，
+    # 仅 CPU、不导入 torch，编码延迟与内存更低)。建库仍使用 torch 编码器，两者向量维度相同、可混用。
+    embedding_backend: str = "torch"
+    embedding_onnx_path: str = ""          # ONNX 模型目录，空表示 <EMBEDDING_MODEL_PATH>-onnx-int8
+    embedding_onnx_threads: int = 0        # ONNX Runtime 计算线程数，0 表示由 ONNX Runtime 决定
+
+    # --- 相似案例检索 (SCM) ---
+    # 案例向量库后端: 'chroma' (默认)、'mmap' (建库脚本导出的内存映射只读矩阵，见 tools/mmap_store.py)
+    # 或 'ann' (在内存映射库之上构建的 faiss 近似最近邻索引，见 tools/ann_index.py)
+    case_store_backend: str = "chroma"
+    case_ann_index: str = "hnsw"          # 'ann' 后端加载的索引名 (建库脚本 --build-ann 生成的 hnsw / ivfpq)
+    case_ann_ef_search: int = 64          # HNSW 查询时的候选列表大小，越大召回越高、越慢
+    case_ann_nprobe: int = 16             # IVF-PQ 查询时探查的倒排桶数，越大召回越高、越慢
+
+    # --- 互联网搜索 (WEB) ---
+    # 搜索后端: 'duckduckgo'、'local' (离线部署 / 测试用的本地结果文件，见 web_search_local_path)
+    # 或 'package.module:factory' 形式的自定义后端 (见 tools/web_search_service.py)
+    web_search_backend: str = "duckduckgo"
+    web_search_local_path: str = os.path.join(_project_root, "docs", "web_search_local.jsonl")
+    web_search_deadline: float = 8.0       # 单次调用的截止时间 (秒)，超时返回缓存或已完成的部分结果
+    web_search_max_results: int = 3        # 每条查询返回的结果数
+    web_search_max_workers: int = 4        # 并发执行子查询的线程数
+    web_cache_enabled: bool = True
+    web_cache_path: str = os.path.join(_project_root, ".cache", "web_cache.sqlite3")
+    web_cache_ttl_seconds: float = 6 * 3600            # 缓存结果视为新鲜的时长
+    web_cache_max_stale_seconds: float = 7 * 24 * 3600  # 过期结果保留多久，用于超时 / 失败时降级
+
+    # --- 追踪与指标 (见 tools/tracing.py) ---
+    # 开启后记录每个任务、工具、LLM 调用、嵌入与向量检索的耗时 span (含 token 数)，
+    # 写入 JSON Lines 文件并汇总为 Prometheus 指标 (HTTP 服务的 GET /metrics)；关闭时开销可以忽略
+    tracing_enabled: bool = False
+    trace_jsonl_path: str = os.path.join(_project_root, ".cache", "traces.jsonl")  # 空表示不写文件，只汇总指标
+
+    # --- 后台预热 (嵌入模型与向量库) ---
+    warmup_enabled: bool = True
+    warmup_query: str = "借款到期后对方拒不还款怎么办"   # 预热时执行的示例查询
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        d = cls()
+        return cls(
+            llm_base_url=os.getenv("LLM_BASE_URL", d.llm_base_url),
+            llm_api_key=os.getenv("LLM_API_KEY", d.llm_api_key),
+            llm_model=os.getenv("LLM_MODEL", d.llm_model),
+            log_level=os.getenv("LEGAL_LOG_LEVEL", d.log_level).upper(),
+            litellm_log=os.getenv("LITELLM_LOG", d.litellm_log),
+            router_mode=os.getenv("LEGAL_ROUTER_MODE", d.router_mode),
+            tool_executor_mode=os.getenv("LEGAL_TOOL_EXECUTOR", d.tool_executor_mode),
+            query_rewrite_enabled=_env_bool("LEGAL_QUERY_REWRITE", "true"),
+            stream_output=_env_bool("LEGAL_STREAM_OUTPUT", "true"),
+            response_cache_enabled=_env_bool("RESPONSE_CACHE_ENABLED", "true"),
+            response_cache_path=os.getenv("RESPONSE_CACHE_PATH", d.response_cache_path),
+            response_cache_similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", str(d.response_cache_similarity_threshold))),
+            response_cache_max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", str(d.response_cache_max_entries))),
+            response_cache_max_age_seconds=float(os.getenv("RESPONSE_CACHE_MAX_AGE_SECONDS", str(d.response_cache_max_age_seconds))),
+            response_cache_history_turns=int(os.getenv("RESPONSE_CACHE_HISTORY_TURNS", str(d.response_cache_history_turns))),
+            server_host=os.getenv("SERVER_HOST", d.server_host),
+            server_port=int(os.getenv("SERVER_PORT", str(d.server_port))),
+            server_workers=int(os.getenv("SERVER_WORKERS", str(d.server_workers))),
+            server_max_concurrency=int(os.getenv("SERVER_MAX_CONCURRENCY", str(d.server_max_concurrency))),
+            server_queue_timeout=float(os.getenv("SERVER_QUEUE_TIMEOUT", str(d.server_queue_timeout))),
+            server_session_ttl=float(os.getenv("SERVER_SESSION_TTL", str(d.server_session_ttl))),
+            server_max_sessions=int(os.getenv("SERVER_MAX_SESSIONS", str(d.server_max_sessions))),
+            server_shutdown_timeout=float(os.getenv("SERVER_SHUTDOWN_TIMEOUT", str(d.server_shutdown_timeout))),
+            request_deadline_seconds=float(os.getenv("REQUEST_DEADLINE_SECONDS", str(d.request_deadline_seconds))),
+            deadline_synthesis_reserve=float(os.getenv("DEADLINE_SYNTHESIS_RESERVE", str(d.deadline_synthesis_reserve))),
+            deadline_low_watermark=float(os.getenv("DEADLINE_LOW_WATERMARK", str(d.deadline_low_watermark))),
+            deadline_optional_tools=_env_list("DEADLINE_OPTIONAL_TOOLS", ",".join(sorted(d.deadline_optional_tools))),
+            deadline_low_k=int(os.getenv("DEADLINE_LOW_K", str(d.deadline_low_k))),
+            deadline_low_fetch_k=int(os.getenv("DEADLINE_LOW_FETCH_K", str(d.deadline_low_fetch_k))),
+            deadline_low_max_iter=int(os.getenv("DEADLINE_LOW_MAX_ITER", str(d.deadline_low_max_iter))),
+            llm_cache_enabled=_env_bool("LLM_CACHE_ENABLED", "true"),
+            llm_cache_path=os.getenv("LLM_CACHE_PATH", d.llm_cache_path),
+            llm_cache_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", str(d.llm_cache_memory_entries))),
+            llm_cache_disabled_tools=_env_list("LLM_CACHE_DISABLED_TOOLS"),
+            memory_token_budget=int(os.getenv("MEMORY_TOKEN_BUDGET", str(d.memory_token_budget))),
+            memory_recent_turns=int(os.getenv("MEMORY_RECENT_TURNS", str(d.memory_recent_turns))),
+            memory_entry_max_tokens=int(os.getenv("MEMORY_ENTRY_MAX_TOKENS", str(d.memory_entry_max_tokens))),
+            memory_summary_max_tokens=int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", str(d.memory_summary_max_tokens))),
+            memory_summary_mode=os.getenv("MEMORY_SUMMARY_MODE", d.memory_summary_mode),
+            las_retrieval_mode=os.getenv("LAS_RETRIEVAL_MODE", d.las_retrieval_mode),
+            las_rrf_k=int(os.getenv("LAS_RRF_K", str(d.las_rrf_k))),
+            las_keyword_max_chars=int(os.getenv("LAS_KEYWORD_MAX_CHARS", str(d.las_keyword_max_chars))),
+            embedding_backend=os.getenv("EMBEDDING_BACKEND", d.embedding_backend).lower(),
+            embedding_onnx_path=os.getenv("EMBEDDING_ONNX_PATH", d.embedding_onnx_path),
+            embedding_onnx_threads=int(os.getenv("EMBEDDING_ONNX_THREADS", str(d.embedding_onnx_threads))),
+            case_store_backend=os.getenv("CASE_STORE_BACKEND", d.case_store_backend).lower(),
+            case_ann_index=os.getenv("CASE_ANN_INDEX", d.case_ann_index),
+            case_ann_ef_search=int(os.getenv("CASE_ANN_EF_SEARCH", str(d.case_ann_ef_search))),
+            case_ann_nprobe=int(os.getenv("CASE_ANN_NPROBE", str(d.case_ann_nprobe))),
+            web_search_backend=os.getenv("WEB_SEARCH_BACKEND", d.web_search_backend),
+            web_search_local_path=os.getenv("WEB_SEARCH_LOCAL_PATH", d.web_search_local_path),
+            web_search_deadline=float(os.getenv("WEB_SEARCH_DEADLINE", str(d.web_search_deadline))),
+            web_search_max_results=int(os.getenv("WEB_SEARCH_MAX_RESULTS", str(d.web_search_max_results))),
+            web_search_max_workers=int(os.getenv("WEB_SEARCH_MAX_WORKERS", str(d.web_search_max_workers))),
+            web_cache_enabled=_env_bool("WEB_CACHE_ENABLED", "true"),
+            web_cache_path=os.getenv("WEB_CACHE_PATH", d.web_cache_path),
+            web_cache_ttl_seconds=float(os.getenv("WEB_CACHE_TTL_SECONDS", str(d.web_cache_ttl_seconds))),
+            web_cache_max_stale_seconds=float(os.getenv("WEB_CACHE_MAX_STALE_SECONDS", str(d.web_cache_max_stale_seconds))),
+            tracing_enabled=_env_bool("TRACING_ENABLED", "false"),
+            trace_jsonl_path=os.getenv("TRACE_JSONL_PATH", d.trace_jsonl_path),
+            warmup_enabled=_env_bool("LEGAL_WARMUP", "true"),
+            warmup_query=os.getenv("LEGAL_WARMUP_QUERY", d.warmup_query),
+        )
+
+    @property
+    def debug(self) -> bool:
+        return self.log_level == "DEBUG"
+
+
+settings = Settings.from_env()
+
+# --- 模块级常量 (与 settings 一致，供各模块按名称导入) ---
+LLM_BASE_URL_FOR_ENV = settings.llm_base_url
+LLM_API_KEY_FOR_ENV = settings.llm_api_key
+LLM_MODEL_FOR_LITELLM_PROVIDER_ID = settings.llm_model
 # ChatOllama 实例的参数
-LLM_BASE_URL_FOR_CHATOLLAMA = LLM_BASE_URL_FOR_ENV # <--- 修改点 4: 对应 ChatOllama 的参数
-LLM_API_KEY_FOR_CHATOLLAMA = LLM_API_KEY_FOR_ENV # <--- 修改点 5: 对应 ChatOllama 的参数
-
-# 打印调试信息
-# 这部分调试信息主要是针对vLLM的路径，对于Ollama可以直接看LLM_MODEL_FOR_LITELLM_PROVIDER_ID
-_actual_model_path_for_ollama = ( # <--- 修改点 6: 变量名更清晰
-    LLM_MODEL_FOR_LITELLM_PROVIDER_ID.split('ollama/', 1)[-1]
-    if LLM_MODEL_FOR_LITELLM_PROVIDER_ID.startswith("ollama/")
-    else LLM_MODEL_FOR_LITELLM_PROVIDER_ID
-)
-
-print(f"--- DEBUG: LLM_MODEL environment variable = {os.getenv('LLM_MODEL')} ( defaulting to: {LLM_MODEL_FOR_LITELLM_PROVIDER_ID} for LiteLLM provider ID) ---")
-print(f"--- DEBUG: (Actual model name for Ollama: {_actual_model_path_for_ollama}) ---") # <--- 修改点 7
-print(f"--- DEBUG: LLM_BASE_URL used for ChatOllama = {LLM_BASE_URL_FOR_CHATOLLAMA} ---") # <--- 修改点 8
-print(f"--- DEBUG: LLM_API_KEY used for ChatOllama = '{LLM_API_KEY_FOR_CHATOLLAMA}' ---") # <--- 修改点 9
-print(f"--- DEBUG: OPENAI_API_BASE environment variable is set to: '{os.environ.get('OPENAI_API_BASE')}' ---")
-print(f"--- DEBUG: OPENAI_API_KEY environment variable is set to: '{os.environ.get('OPENAI_API_KEY')}' ---")
-
-# --- 使用 LangChain 实例化 LLM ---
-llm = None
-
-try:
-    # !!! 关键：直接使用 ChatOllama !!!
-    print(f"--- 正在初始化 LangChain ChatOllama LLM (连接到 {LLM_BASE_URL_FOR_CHATOLLAMA}, 模型 {LLM_MODEL_FOR_LITELLM_PROVIDER_ID}) ---") # <--- 修改点 10
-    llm = ChatOllama( # <--- 修改点 11: 改为 ChatOllama
-        model=LLM_MODEL_FOR_LITELLM_PROVIDER_ID,  # <-- 使用带前缀的名称
-        base_url=LLM_BASE_URL_FOR_CHATOLLAMA, # <--- 修改点 12: ChatOllama 使用 base_url
-        # api_key 参数对于 ChatOllama 通常不是必须的，因为Ollama通常不需要API Key
-        # 如果需要，请根据LiteLLM文档或Ollama配置添加
-        # request_timeout=60 # ChatOllama 默认没有这个参数，如果需要可能要在 LiteLLM 层配置
-        temerature=0.1
-    )
-    print("✅ LangChain ChatOllama LLM 初始化成功!") # <--- 修改点 13
-    print(f" 实例模型名称 (llm.model): {getattr(llm, 'model', 'N/A')}") # <--- 修改点 14: ChatOllama 用 .model
-    print(f" 实例API Base (llm.base_url): {getattr(llm, 'base_url', 'N/A')}") # <--- 修改点 15: ChatOllama 用 .base_url
-except Exception as e:
-    print(f"❌ 初始化 LangChain ChatOllama LLM 时出错: {e}") # <--- 修改点 16
-    print(f" 错误类型: {type(e).__name__}")
-    print(" 请检查:")
-    print(f" 1. Ollama API 服务 ({LLM_BASE_URL_FOR_CHATOLLAMA}) 是否正在运行且可访问?") # <--- 修改点 17
-    print(f" 2. 环境变量 OPENAI_API_BASE 和 OPENAI_API_KEY 是否已正确设置 (尽管 Ollama 不强制要求 API KEY)?") # <--- 修改点 18
-    print(f" 3. 模型名称 '{LLM_MODEL_FOR_LITELLM_PROVIDER_ID}' 是否适合 LiteLLM 识别 provider (即 'ollama/qwen3:8b' 格式)?")
-    print("详细错误追踪信息:")
-    traceback.print_exc()
-    print("⚠️ LLM 实例未能创建，后续 CrewAI 工作流将无法运行。")
-
-# --- 打印最终配置概览 ---
-print("-" * 40)
-print("LLM 配置加载完成 (使用 LangChain)")
-
-if llm:
-    model_used_in_instance = getattr(llm, 'model', 'N/A') # <--- 修改点 19
-    base_url_used_in_instance = getattr(llm, 'base_url', 'N/A') # <--- 修改点 20
-    api_key_in_env = os.environ.get("OPENAI_API_KEY", "未设置")
-    api_base_in_env = os.environ.get("OPENAI_API_BASE", "未设置")
-    env_var_status_desc = f"环境变量 OPENAI_API_KEY='{api_key_in_env}', OPENAI_API_BASE='{api_base_in_env}'"
+LLM_BASE_URL_FOR_CHATOLLAMA = LLM_BASE_URL_FOR_ENV
+LLM_API_KEY_FOR_CHATOLLAMA = LLM_API_KEY_FOR_ENV
+
+ROUTER_MODE = settings.router_mode
+TOOL_EXECUTOR_MODE = settings.tool_executor_mode
+QUERY_REWRITE_ENABLED = settings.query_rewrite_enabled
+STREAM_OUTPUT = settings.stream_output
 
-    print(f" LLM实例模型名 (llm.model): {model_used_in_instance}")
-    print(f" LLM实例基础URL (llm.base_url): {base_url_used_in_instance}")
-    print(f" 环境变量状态: {env_var_status_desc}")
-    print(" 状态: 初始化成功")
-else:
-    model_to_print = LLM_MODEL_FOR_LITELLM_PROVIDER_ID
-    print(f" 尝试使用模型 (Model for LiteLLM): {model_to_print} (尝试配置)")
-    print(f" 基础 URL (Base URL): {LLM_BASE_URL_FOR_CHATOLLAMA} (尝试配置)") # <--- 修改点 21
+RESPONSE_CACHE_ENABLED = settings.response_cache_enabled
+RESPONSE_CACHE_PATH = settings.response_cache_path
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = settings.response_cache_similarity_threshold
+RESPONSE_CACHE_MAX_ENTRIES = settings.response_cache_max_entries
+RESPONSE_CACHE_MAX_AGE_SECONDS = settings.response_cache_max_age_seconds
+RESPONSE_CACHE_HISTORY_TURNS = settings.response_cache_history_turns
+
+SERVER_HOST = settings.server_host
+SERVER_PORT = settings.server_port
+SERVER_WORKERS = settings.server_workers
+SERVER_MAX_CONCURRENCY = settings.server_max_concurrency
+SERVER_QUEUE_TIMEOUT = settings.server_queue_timeout
+SERVER_SESSION_TTL = settings.server_session_ttl
+SERVER_MAX_SESSIONS = settings.server_max_sessions
+SERVER_SHUTDOWN_TIMEOUT = settings.server_shutdown_timeout
+
+REQUEST_DEADLINE_SECONDS = settings.request_deadline_seconds
+DEADLINE_SYNTHESIS_RESERVE = settings.deadline_synthesis_reserve
+DEADLINE_LOW_WATERMARK = settings.deadline_low_watermark
+DEADLINE_OPTIONAL_TOOLS = settings.deadline_optional_tools
+DEADLINE_LOW_K = settings.deadline_low_k
+DEADLINE_LOW_FETCH_K = settings.deadline_low_fetch_k
+DEADLINE_LOW_MAX_ITER = settings.deadline_low_max_iter
+
+LLM_CACHE_ENABLED = settings.llm_cache_enabled
+LLM_CACHE_PATH = settings.llm_cache_path
+LLM_CACHE_MEMORY_ENTRIES = settings.llm_cache_memory_entries
+LLM_CACHE_DISABLED_TOOLS = settings.llm_cache_disabled_tools
+
+MEMORY_TOKEN_BUDGET = settings.memory_token_budget
+MEMORY_RECENT_TURNS = settings.memory_recent_turns
+MEMORY_ENTRY_MAX_TOKENS = settings.memory_entry_max_tokens
+MEMORY_SUMMARY_MAX_TOKENS = settings.memory_summary_max_tokens
+MEMORY_SUMMARY_MODE = settings.memory_summary_mode
+
+LAS_RETRIEVAL_MODE = settings.las_retrieval_mode
+LAS_RRF_K = settings.las_rrf_k
+LAS_KEYWORD_MAX_CHARS = settings.las_keyword_max_chars
+
+EMBEDDING_BACKEND = settings.embedding_backend
+EMBEDDING_ONNX_PATH = settings.embedding_onnx_path
+EMBEDDING_ONNX_THREADS = settings.embedding_onnx_threads
+
+CASE_STORE_BACKEND = settings.case_store_backend
+CASE_ANN_INDEX = settings.case_ann_index
+CASE_ANN_EF_SEARCH = settings.case_ann_ef_search
+CASE_ANN_NPROBE = settings.case_ann_nprobe
+
+WEB_SEARCH_BACKEND = settings.web_search_backend
+WEB_SEARCH_LOCAL_PATH = settings.web_search_local_path
+WEB_SEARCH_DEADLINE = settings.web_search_deadline
+WEB_SEARCH_MAX_RESULTS = settings.web_search_max_results
+WEB_SEARCH_MAX_WORKERS = settings.web_search_max_workers
+WEB_CACHE_ENABLED = settings.web_cache_enabled
+WEB_CACHE_PATH = settings.web_cache_path
+WEB_CACHE_TTL_SECONDS = settings.web_cache_ttl_seconds
+WEB_CACHE_MAX_STALE_SECONDS = settings.web_cache_max_stale_seconds
+
+TRACING_ENABLED = settings.tracing_enabled
+TRACE_JSONL_PATH = settings.trace_jsonl_path
+
+WARMUP_ENABLED = settings.warmup_enabled
+WARMUP_QUERY = settings.warmup_query
+
+
+# --- LLM 的延迟创建 ---
+_llm = None
+_llm_initialized = False
+_llm_lock = threading.Lock()
+
+
+def export_llm_environment():
+    """设置 LiteLLM 使用的环境变量 (OPENAI_API_BASE / OPENAI_API_KEY)。在创建 LLM 时调用。"""
+    if settings.debug:
+        print(f"--- INFO: 正在设置 OPENAI_API_BASE 环境变量为: '{LLM_BASE_URL_FOR_ENV}' ---")
+        print(f"--- INFO: 正在设置 OPENAI_API_KEY 环境变量为: '{LLM_API_KEY_FOR_ENV}' ---")
+    os.environ["OPENAI_API_BASE"] = LLM_BASE_URL_FOR_ENV
+    os.environ["OPENAI_API_KEY"] = LLM_API_KEY_FOR_ENV
+
+
+def _create_llm():
+    """创建 ChatOllama 实例，失败时打印排查提示并返回 None。"""
+    export_llm_environment()
+
+    if settings.debug:
+        # 这部分调试信息主要是针对vLLM的路径，对于Ollama可以直接看LLM_MODEL_FOR_LITELLM_PROVIDER_ID
+        actual_model_path_for_ollama = (
+            LLM_MODEL_FOR_LITELLM_PROVIDER_ID.split('ollama/', 1)[-1]
+            if LLM_MODEL_FOR_LITELLM_PROVIDER_ID.startswith("ollama/")
+            else LLM_MODEL_FOR_LITELLM_PROVIDER_ID
+        )
+        print(f"--- DEBUG: LLM_MODEL environment variable = {os.getenv('LLM_MODEL')} ( defaulting to: {LLM_MODEL_FOR_LITELLM_PROVIDER_ID} for LiteLLM provider ID) ---")
+        print(f"--- DEBUG: (Actual model name for Ollama: {actual_model_path_for_ollama}) ---")
+        print(f"--- DEBUG: LLM_BASE_URL used for ChatOllama = {LLM_BASE_URL_FOR_CHATOLLAMA} ---")
+        print(f"--- DEBUG: LLM_API_KEY used for ChatOllama = '{LLM_API_KEY_FOR_CHATOLLAMA}' ---")
+
+    try:
+        # 从 langchain_openai 更改为从 langchain_ollama 导入 ChatOllama (延迟导入，避免拖慢启动)
+        from langchain_ollama import ChatOllama
+        # !!! 关键：直接使用 ChatOllama !!!
+        if settings.debug:
+            print(f"--- 正在初始化 LangChain ChatOllama LLM (连接到 {LLM_BASE_URL_FOR_CHATOLLAMA}, 模型 {LLM_MODEL_FOR_LITELLM_PROVIDER_ID}) ---")
+        instance = ChatOllama(
+            model=LLM_MODEL_FOR_LITELLM_PROVIDER_ID,  # <-- 使用带前缀的名称
+            base_url=LLM_BASE_URL_FOR_CHATOLLAMA, # ChatOllama 使用 base_url
+            # api_key 参数对于 ChatOllama 通常不是必须的，因为Ollama通常不需要API Key
+            # 如果需要，请根据LiteLLM文档或Ollama配置添加
+            # request_timeout=60 # ChatOllama 默认没有这个参数，如果需要可能要在 LiteLLM 层配置
+            temerature=0.1
+        )
+        if settings.debug:
+            print("✅ LangChain ChatOllama LLM 初始化成功!")
+            print(f" 实例模型名称 (llm.model): {getattr(instance, 'model', 'N/A')}")
+            print(f" 实例API Base (llm.base_url): {getattr(instance, 'base_url', 'N/A')}")
+        return instance
+    except Exception as e:
+        print(f"❌ 初始化 LangChain ChatOllama LLM 时出错: {e}")
+        print(f" 错误类型: {type(e).__name__}")
+        print(" 请检查:")
+        print(f" 1. Ollama API 服务 ({LLM_BASE_URL_FOR_CHATOLLAMA}) 是否正在运行且可访问?")
+        print(f" 2. 环境变量 OPENAI_API_BASE 和 OPENAI_API_KEY 是否已正确设置 (尽管 Ollama 不强制要求 API KEY)?")
+        print(f" 3. 模型名称 '{LLM_MODEL_FOR_LITELLM_PROVIDER_ID}' 是否适合 LiteLLM 识别 provider (即 'ollama/qwen3:8b' 格式)?")
+        print("详细错误追踪信息:")
+        traceback.print_exc()
+        print("⚠️ LLM 实例未能创建，后续 CrewAI 工作流将无法运行。")
+        return None
+
+
+def get_llm():
+    """返回共享的 LLM 实例，首次调用时创建 (线程安全)。创建失败时返回 None。"""
+    global _llm, _llm_initialized
+    if not _llm_initialized:
+        with _llm_lock:
+            if not _llm_initialized:
+                _llm = _create_llm()
+                _llm_initialized = True
+    return _llm
+
+
+def __getattr__(name):
+    # 兼容 `from config import llm`：访问时才创建 LLM
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def print_config_summary():
+    """打印配置概览 (由 main.py / server.py 在启动时调用)。"""
+    llm = get_llm()
+    print("-" * 40)
+    print("LLM 配置加载完成 (使用 LangChain)")
     api_key_in_env = os.environ.get("OPENAI_API_KEY", "未设置")
     api_base_in_env = os.environ.get("OPENAI_API_BASE", "未设置")
     env_var_status_desc = f"环境变量 OPENAI_API_KEY='{api_key_in_env}', OPENAI_API_BASE='{api_base_in_env}'"
-    print(f" 环境变量状态: {env_var_status_desc}")
-    print(" 状态: 初始化失败 ❌")
+    if llm:
+        print(f" LLM实例模型名 (llm.model): {getattr(llm, 'model', 'N/A')}")
+        print(f" LLM实例基础URL (llm.base_url): {getattr(llm, 'base_url', 'N/A')}")
+        print(f" 环境变量状态: {env_var_status_desc}")
+        print(" 状态: 初始化成功")
+        print(f" 快速路由模式 (ROUTER_MODE): {ROUTER_MODE}")
+        print(f" 工具执行模式 (TOOL_EXECUTOR_MODE): {TOOL_EXECUTOR_MODE}, 检索查询重写: {QUERY_REWRITE_ENABLED}, 流式输出: {STREAM_OUTPUT}")
+        print(f" 回答缓存 (RESPONSE_CACHE_ENABLED): {RESPONSE_CACHE_ENABLED}, 相似度阈值: {RESPONSE_CACHE_SIMILARITY_THRESHOLD}")
+        print(f" 单轮时间预算 (REQUEST_DEADLINE_SECONDS): {REQUEST_DEADLINE_SECONDS:g}s" + (f", 回复预留 {DEADLINE_SYNTHESIS_RESERVE:g}s, 紧张阈值 {DEADLINE_LOW_WATERMARK:g}s, 可选工具: {sorted(DEADLINE_OPTIONAL_TOOLS)}" if REQUEST_DEADLINE_SECONDS > 0 else " (不限制)"))
+        print(f" LLM 结果缓存 (LLM_CACHE_ENABLED): {LLM_CACHE_ENABLED}, 关闭缓存的工具: {sorted(LLM_CACHE_DISABLED_TOOLS) or '无'}")
+        print(f" 法条检索方式 (LAS_RETRIEVAL_MODE): {LAS_RETRIEVAL_MODE}")
+        print(f" 查询编码器 (EMBEDDING_BACKEND): {EMBEDDING_BACKEND}")
+        print(f" 案例向量库后端 (CASE_STORE_BACKEND): {CASE_STORE_BACKEND}" + (f", ANN 索引: {CASE_ANN_INDEX} (efSearch={CASE_ANN_EF_SEARCH}, nprobe={CASE_ANN_NPROBE})" if CASE_STORE_BACKEND == "ann" else ""))
+        print(f" 网络搜索后端 (WEB_SEARCH_BACKEND): {WEB_SEARCH_BACKEND}, 截止时间: {WEB_SEARCH_DEADLINE}s, 结果缓存: {WEB_CACHE_ENABLED} (TTL {WEB_CACHE_TTL_SECONDS:g}s)")
+        print(f" 追踪与指标 (TRACING_ENABLED): {TRACING_ENABLED}" + (f", span 文件: {TRACE_JSONL_PATH or '不写入'}" if TRACING_ENABLED else ""))
+        print(f" 后台预热 (WARMUP_ENABLED): {WARMUP_ENABLED}")
+        print(f" 对话记忆预算 (MEMORY_TOKEN_BUDGET): {MEMORY_TOKEN_BUDGET} tokens, 保留最近 {MEMORY_RECENT_TURNS} 轮, 摘要方式: {MEMORY_SUMMARY_MODE}")
+    else:
+        print(f" 尝试使用模型 (Model for LiteLLM): {LLM_MODEL_FOR_LITELLM_PROVIDER_ID} (尝试配置)")
+        print(f" 基础 URL (Base URL): {LLM_BASE_URL_FOR_CHATOLLAMA} (尝试配置)")
+        print(f" 环境变量状态: {env_var_status_desc}")
+        print(" 状态: 初始化失败 ❌")
     print("-" * 40)
 
-# --- 文件结束 ---
\ No newline at end of file
+# --- 文件结束 ---
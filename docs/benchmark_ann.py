@@ -0,0 +1,198 @@
+# docs/benchmark_ann.py
+# 案例库 ANN 索引基准：对同一份内存映射案例库 (docs/case_db/mmap) 构建多组 HNSW / IVF-PQ 索引，
+# 与精确检索对比 recall@k，并给出 QPS、查询延迟、建索引耗时与内存占用，用于选择 SCM 的运行参数。
+#
+# 用法:
+#   python docs/benchmark_ann.py --queries 500 --k 10
+#   python docs/benchmark_ann.py --hnsw 16:100,32:200 --ef-search 16,32,64,128 --ivfpq 0:48,0:96 --nprobe 4,16,64 --rerank 0,4
+#   python docs/benchmark_ann.py --query-file queries.txt --json ann_report.json
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.mmap_store import MmapVectorStore  # noqa: E402
+from tools.ann_index import build_index, resolve_build_params, search_parameters, load_faiss  # noqa: E402
+
+# 计算精确结果时每次参与矩阵乘的库行数
+EXACT_BLOCK_ROWS = 16384
+
+
+def _rss_mb() -> float:
+    """当前进程常驻内存 (MB)。Linux 读取 /proc，其他平台退回峰值 RSS。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _int_list(text: str) -> list:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _pairs(text: str) -> list:
+    """'16:100,32:200' -> [(16, 100), (32, 200)]。"""
+    return [tuple(int(v) for v in item.split(":")) for item in text.split(",") if item.strip()]
+
+
+def load_queries(store: MmapVectorStore, args) -> tuple:
+    """
+    查询向量：给定 --query-file 时用嵌入模型编码其中的案情描述 (每行一条)；
+    否则从库中随机抽取文本块作为查询，并在计算召回时排除查询自身所在的行。
+    :return: (查询矩阵 float32, 各查询对应的库内行号或 None)
+    """
+    if args.query_file:
+        from sentence_transformers import SentenceTransformer
+        with open(args.query_file, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.queries]
+        model = SentenceTransformer(args.model_path, device="cpu")
+        vectors = model.encode(texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True).astype(np.float32)
+        self_rows = None
+    else:
+        rows = np.sort(np.random.default_rng(args.seed).choice(len(store), size=min(args.queries, len(store)), replace=False))
+        vectors, self_rows = store.take_rows(rows), rows
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return np.ascontiguousarray(vectors), self_rows
+
+
+def exact_neighbours(store: MmapVectorStore, queries: np.ndarray, k: int, self_rows) -> np.ndarray:
+    """分块计算全部查询的精确 top-k (余弦相似度)，作为召回的基准。"""
+    n, fetch = len(store), k + (1 if self_rows is not None else 0)
+    best_scores = np.full((len(queries), fetch), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), fetch), dtype=np.int64)
+    for start in range(0, n, EXACT_BLOCK_ROWS):
+        scores = queries @ store.float_rows(start, start + EXACT_BLOCK_ROWS).T
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)], axis=1)
+        top = np.argpartition(-merged_scores, fetch - 1, axis=1)[:, :fetch]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_rows = np.take_along_axis(merged_rows, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return _drop_self(np.take_along_axis(best_rows, order, axis=1), self_rows, k)
+
+
+def _drop_self(rows: np.ndarray, self_rows, k: int) -> np.ndarray:
+    if self_rows is None:
+        return rows[:, :k]
+    return np.array([[r for r in row if r != own][:k] for row, own in zip(rows, self_rows)])
+
+
+def run_queries(search, queries: np.ndarray, k: int, self_rows, truth: np.ndarray) -> dict:
+    """逐条查询 (与在线 SCM 一样一次一条)，统计召回、QPS 与延迟分位数。"""
+    fetch = k + (1 if self_rows is not None else 0)
+    latencies, found = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        found.append(search(vector, fetch))
+        latencies.append(time.perf_counter() - start)
+    found = _drop_self(np.array([(row + [-1] * fetch)[:fetch] for row in found]), self_rows, k)
+    recall = np.mean([len(set(got) & set(want)) / k for got, want in zip(found, truth)])
+    total = sum(latencies)
+    return {
+        "recall": round(float(recall), 4),
+        "qps": round(len(queries) / total, 1) if total else 0.0,
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+    }
+
+
+def benchmark(args) -> list:
+    faiss = load_faiss()
+    faiss.omp_set_num_threads(args.threads)
+    store = MmapVectorStore(args.mmap_dir, embedding_function=None)
+    count, dim = len(store), store.vectors.shape[1]
+    print(f"📚 案例库: {count} 条, 维度 {dim}, {store.header['dtype']}  |  k={args.k}, 线程数={args.threads}")
+
+    queries, self_rows = load_queries(store, args)
+    start = time.perf_counter()
+    truth = exact_neighbours(store, queries, args.k, self_rows)
+    print(f"🎯 精确结果: {len(queries)} 条查询, 耗时 {time.perf_counter() - start:.1f}s")
+
+    store_bytes = sum(os.path.getsize(os.path.join(args.mmap_dir, name))
+                      for name in os.listdir(args.mmap_dir) if os.path.isfile(os.path.join(args.mmap_dir, name)))
+    results = [{
+        "index": "exact (mmap)", "build": {}, "search": {}, "build_secs": 0.0,
+        "index_mb": round(store_bytes / 1024 / 1024, 1), "rss_delta_mb": 0.0,
+        **run_queries(lambda v, n: [i for i, _ in store.search_by_vector(v, n)], queries, args.k, self_rows, truth),
+    }]
+    _print_row(results[-1])
+
+    configs = [("hnsw", {"m": m, "ef_construction": efc}) for m, efc in _pairs(args.hnsw)]
+    configs += [("ivfpq", {"nlist": nlist, "pq_m": pq_m}) for nlist, pq_m in _pairs(args.ivfpq)]
+    for kind, overrides in configs:
+        params = resolve_build_params(kind, count, dim, **overrides)
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        index = build_index(store, kind, params, seed=args.seed)
+        build_secs = time.perf_counter() - start
+        build = {
+            "build_secs": round(build_secs, 2),
+            "index_mb": round(faiss.serialize_index(index).nbytes / 1024 / 1024, 1),
+            "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+        }
+        if kind == "hnsw":
+            sweep = [{"ef_search": ef} for ef in _int_list(args.ef_search)]
+        else:
+            sweep = [{"nprobe": nprobe, "rerank": rerank} for nprobe in _int_list(args.nprobe) for rerank in _int_list(args.rerank)]
+        for search in sweep:
+            results.append({
+                "index": kind, "build": params, "search": search, **build,
+                **run_queries(_ann_search(store, index, kind, **search), queries, args.k, self_rows, truth),
+            })
+            _print_row(results[-1])
+        del index
+    store.close()
+    return results
+
+
+def _ann_search(store: MmapVectorStore, index, kind: str, ef_search: int = 0, nprobe: int = 0, rerank: int = 0):
+    """与 AnnVectorStore.search_by_vector 相同的查询流程 (含可选的精确重排)，只是索引不从文件加载。"""
+    def search(vector, n):
+        fetch = min(len(store), n * rerank if rerank > 1 else n)
+        params = search_parameters(kind, max(ef_search, fetch) if kind == "hnsw" else None, nprobe)
+        _, rows = index.search(vector.reshape(1, -1), fetch, params=params)
+        rows = [int(i) for i in rows[0] if i >= 0]
+        if fetch > n and rows:
+            candidates = sorted(rows)
+            exact = store.take_rows(candidates) @ vector
+            rows = [candidates[i] for i in np.argsort(-exact)]
+        return rows[:n]
+    return search
+
+
+def _print_row(row: dict):
+    label = row["index"] + (f" {row['build']}" if row["build"] else "") + (f" {row['search']}" if row["search"] else "")
+    print(f"  {label:<72} recall@k={row['recall']:.4f}  QPS={row['qps']:>8.1f}  "
+          f"p50={row['p50_ms']:.2f}ms  p99={row['p99_ms']:.2f}ms  "
+          f"建索引={row['build_secs']:.1f}s  索引={row['index_mb']:.1f}MB  RSS+{row['rss_delta_mb']:.1f}MB")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="案例库 ANN 索引的召回 / 延迟 / 建索引开销基准。")
+    parser.add_argument('--mmap-dir', default=os.path.join(script_dir, "case_db", "mmap"), help="内存映射案例库目录 (建库脚本 --export-mmap 生成)。")
+    parser.add_argument('--queries', type=int, default=500, help="查询条数。")
+    parser.add_argument('--query-file', default=None, help="查询文本文件 (每行一条案情描述)；不指定时从库中抽样文本块作为查询。")
+    parser.add_argument('--model-path', default=os.path.join(os.path.dirname(os.path.dirname(script_dir)), "models", "m3e-base"), help="编码 --query-file 用的嵌入模型。")
+    parser.add_argument('--k', type=int, default=10, help="recall@k 的 k。")
+    parser.add_argument('--hnsw', default="16:100,32:200", help="HNSW 建索引参数 M:efConstruction，逗号分隔；空字符串表示跳过。")
+    parser.add_argument('--ef-search', default="16,32,64,128,256", help="HNSW 查询参数 efSearch 列表。")
+    parser.add_argument('--ivfpq', default="0:48", help="IVF-PQ 建索引参数 nlist:pq_m (nlist=0 自动)，逗号分隔；空字符串表示跳过。")
+    parser.add_argument('--nprobe', default="1,4,16,64", help="IVF-PQ 查询参数 nprobe 列表。")
+    parser.add_argument('--rerank', default="0,4", help="IVF-PQ 精确重排倍数列表 (0 表示不重排)。")
+    parser.add_argument('--threads', type=int, default=1, help="faiss 计算线程数 (默认 1，与在线逐条查询一致)。")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help="把全部结果写入该 JSON 文件。")
+    args = parser.parse_args()
+
+    report = benchmark(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 结果已写入 {args.json}")
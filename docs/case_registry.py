@@ -0,0 +1,84 @@
+# docs/case_registry.py
+# CAIL2019-SCM 案例去重登记表：同一份判决书会出现在许多 (A, B, C) 三元组中，按内容哈希只嵌入一次。
+# 登记表记录每个规范案例 ID 对应的全部出现位置，以及负责存储该案例文本块的“归属文件”。
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+CASE_REGISTRY_FILENAME = "case_registry.json"
+REGISTRY_FORMAT_VERSION = 1
+
+
+def canonical_case_id(text: str) -> str:
+    """规范案例 ID：案件文书内容 (去掉首尾空白) 的哈希，相同文书在任何三元组中得到相同 ID。"""
+    return "case_" + hashlib.sha1((text or "").strip().encode("utf-8")).hexdigest()[:16]
+
+
+class CaseRegistry:
+    """
+    {规范案例 ID: {"owner": 归属文件名, "occurrences": [[文件名, 行号, 'A'/'B'/'C'], ...]}}。
+    一个案例的文本块只由其归属文件写入向量库 (并记在该文件的建库清单条目下)，其他出现位置只登记不嵌入。
+    """
+
+    def __init__(self, db_dir: str = None, cases: Dict[str, dict] = None):
+        self.db_dir = db_dir
+        self.cases = cases or {}
+        self.occurrences_seen = 0
+        self.duplicates_skipped = 0
+
+    @property
+    def path(self) -> Optional[str]:
+        return os.path.join(self.db_dir, CASE_REGISTRY_FILENAME) if self.db_dir else None
+
+    @classmethod
+    def load(cls, db_dir: str) -> "CaseRegistry":
+        path = os.path.join(db_dir, CASE_REGISTRY_FILENAME)
+        if not os.path.exists(path):
+            return cls(db_dir)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != REGISTRY_FORMAT_VERSION:
+            raise ValueError(f"案例登记表版本不匹配 (文件: {data.get('version')}, 期望: {REGISTRY_FORMAT_VERSION})。")
+        return cls(db_dir, data.get("cases"))
+
+    def save(self):
+        os.makedirs(self.db_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": REGISTRY_FORMAT_VERSION, "cases": self.cases}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def forget_files(self, file_names):
+        """
+        重新处理 (或删除) 某些文件之前调用：移除这些文件中的出现位置，并释放它们归属的案例，
+        使这些案例在本次运行中由第一个再次出现它们的文件重新认领。
+        """
+        file_names = set(file_names)
+        if not file_names:
+            return
+        for case_id in list(self.cases):
+            entry = self.cases[case_id]
+            entry["occurrences"] = [occ for occ in entry["occurrences"] if occ[0] not in file_names]
+            if entry.get("owner") in file_names:
+                entry["owner"] = None
+            if not entry["occurrences"]:
+                del self.cases[case_id]
+
+    def record(self, case_id: str, file_name: str, line_no: int, key: str) -> bool:
+        """登记一次出现。返回 True 表示该案例需要由当前文件嵌入 (首次出现，或原归属文件已变化/删除)。"""
+        self.occurrences_seen += 1
+        entry = self.cases.setdefault(case_id, {"owner": None, "occurrences": []})
+        entry["occurrences"].append([file_name, line_no, key])
+        if entry["owner"] is None:
+            entry["owner"] = file_name
+            return True
+        self.duplicates_skipped += 1
+        return False
+
+    def occurrences(self, case_id: str) -> List[list]:
+        return list((self.cases.get(case_id) or {}).get("occurrences") or [])
+
+    def orphaned(self) -> List[str]:
+        """没有归属文件的案例：原归属文件已删除，且本次运行中没有其他被处理的文件再次出现它们。"""
+        return [case_id for case_id, entry in self.cases.items() if entry.get("owner") is None]
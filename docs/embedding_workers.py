@@ -0,0 +1,75 @@
+# docs/embedding_workers.py
+# 多进程 CPU 嵌入：没有 GPU 的建库机器上，把文本块分片交给多个嵌入进程并行编码。
+# 每个进程只加载一次嵌入模型，并固定自己的计算线程数，避免多个进程的线程池互相争抢 CPU。
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+
+_model = None
+_batch_size = None
+
+
+def _init_worker(model_path: str, threads: int, batch_size: int):
+    """进程初始化：固定线程数后加载模型 (每个进程只执行一次)。"""
+    global _model, _batch_size
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 进程中已经执行过并行计算时不能再修改，保持默认即可
+        pass
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(model_path, device="cpu")
+    _batch_size = batch_size
+
+
+def _encode(texts: list):
+    """在嵌入进程中编码一批文本，返回 (向量 float32 数组, 编码耗时秒数)。"""
+    start = time.perf_counter()
+    # 与 SentenceTransformerEmbeddings.embed_documents 的默认行为一致 (不做归一化)，保证与单进程建库的向量相同
+    vectors = _model.encode(texts, batch_size=_batch_size, show_progress_bar=False, convert_to_numpy=True)
+    return vectors.astype("float32", copy=False), time.perf_counter() - start
+
+
+def default_threads_per_worker(workers: int) -> int:
+    """把本机 CPU 核数平均分给各嵌入进程。"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+class EmbeddingWorkerPool:
+    """
+    嵌入进程池。submit 立即返回 Future，结果为 (向量数组, 编码耗时)；调用方按提交顺序取结果即可保持顺序，
+    因此向量可以交给单一的写库线程写入。
+    用法:
+        with EmbeddingWorkerPool(model_path, workers=8) as pool:
+            future = pool.submit(texts)
+    """
+
+    def __init__(self, model_path: str, workers: int, threads_per_worker: int = None, batch_size: int = 64):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+        # spawn：子进程不继承父进程中已初始化的 torch 线程池 / CUDA 状态
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, self.threads_per_worker, batch_size),
+        )
+
+    def submit(self, texts: list) -> Future:
+        return self._executor.submit(_encode, texts)
+
+    def shutdown(self, cancel: bool = False):
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(cancel=exc_type is not None)
+        return False
@@ -1,9 +1,13 @@
 # docs/index_docs.py
 import os
+import sys
 import glob
 import traceback
 import argparse
 import json
+import time
+from collections import defaultdict
+from concurrent.futures import Future
 from tqdm import tqdm
 import torch
 
@@ -14,27 +18,57 @@ from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
+# 词法索引与在线检索共用同一份实现 (tools/lexical_index.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.lexical_index import LexicalIndex  # noqa: E402
+from tools.statute_index import ArticleTable, ARTICLE_TABLE_FILENAME, parse_statute, format_location  # noqa: E402
+from docs.indexing_pipeline import Batcher, PipelineStage, run_pipeline, format_stats  # noqa: E402
+from docs.embedding_workers import EmbeddingWorkerPool, default_threads_per_worker  # noqa: E402
+from tools.mmap_store import DTYPES as MMAP_DTYPES, export_collection, fingerprint_file  # noqa: E402
+from tools.ann_index import ANN_KINDS  # noqa: E402
+from tools.batch_retrieval import search_articles_many, search_cases_many  # noqa: E402
+from docs.case_registry import CaseRegistry, canonical_case_id  # noqa: E402
+from docs.index_manifest import (  # noqa: E402
+    IndexManifest, ChunkIdAssigner, LEGACY_LOG_FILENAME, MANIFEST_FILENAME, file_sha256, migrate_legacy_log
+)
+
 # --- 默认配置 ---
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 ADD_BATCH_SIZE = 100
 # --- 嵌入模型的批处理大小，用于GPU计算。可根据显存大小调整以提升性能。---
 EMBED_BATCH_SIZE = 1024
+# --- 法条词法 (BM25) 索引文件名，保存在法条向量库目录下 ---
+LEXICAL_INDEX_FILENAME = "lexical_index.npz"
+GET_BATCH_SIZE = 5000
+# --- 离线评测：每批一起编码、一起检索的查询数 ---
+EVAL_BATCH_SIZE = 32
+# --- 法条切分方式：chunk (按长度切块) 或 article (按“第X条”逐条切分，并生成条文查找表) ---
+SPLIT_MODES = ("chunk", "article")
+# --- 案例流水线建库：相邻阶段之间最多缓存的批数 (每批 EMBED_BATCH_SIZE 个文本块) ---
+PIPELINE_QUEUE_SIZE = 4
+# --- 多进程 CPU 嵌入 (--workers)：每个分片的文本块数与进程内 encode 的批大小 ---
+WORKER_SHARD_SIZE = 256
+WORKER_ENCODE_BATCH_SIZE = 32
 
-# --- JSON 文件加载器 (无变动) ---
-def load_cail_scm_from_json(files_to_process: list) -> list:
+# --- JSON 文件加载器 ---
+def iter_cail_scm_documents(files_to_process: list, failed_files: list = None, registry: CaseRegistry = None):
     """
-    从给定的文件列表加载 CAIL-SCM 格式的 JSON 文件,
-    并将每个案件的 A, B, C 文书解析为独立的 LangChain Document 对象。
+    逐行读取 CAIL-SCM 格式的 JSON 文件，把每个案件的 A, B, C 文书依次 yield 为独立的 LangChain Document 对象。
+    生成器形式：任何时刻只有当前一行在内存中，供流水线建库使用。
+    同一份文书会出现在多个三元组中：按内容哈希去重，只在首次出现时 yield，元数据中的 doc_id 为规范案例 ID，
+    全部出现位置登记在 registry 中。
 
     :param files_to_process: 需要处理的JSON文件路径列表。
-    :return: 一个包含所有解析出的 Document 对象的列表。
+    :param failed_files: 传入列表时，读取或解析出错的文件名会被追加到其中 (这些文件的内容可能只处理了一部分)。
+    :param registry: 案例去重登记表；为 None 时只在本次调用的文件之间去重。
     """
-    documents = []
-    doc_id_counter = 0
+    if registry is None:
+        registry = CaseRegistry()
     for file_path in files_to_process:
         file_name = os.path.basename(file_path)
         print(f"  - 正在处理新文件: {file_name}")
+        i = 0
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 for i, line in enumerate(tqdm(f, desc=f"  解析 {file_name}", unit="行")):
@@ -45,27 +79,262 @@ def load_cail_scm_from_json(files_to_process: list) -> list:
                     
                     for key in ['A', 'B', 'C']:
                         if key in data and data[key]:
-                            doc = Document(
+                            case_id = canonical_case_id(data[key])
+                            if not registry.record(case_id, file_name, i + 1, key):
+                                continue
+                            yield Document(
                                 page_content=data[key],
                                 metadata={
                                     "source": file_name,
-                                    "doc_id": f"case_{doc_id_counter}"
+                                    "doc_id": case_id
                                 }
                             )
-                            documents.append(doc)
-                            doc_id_counter += 1
         except json.JSONDecodeError as e:
             print(f"❌ 错误: 解析 JSON 文件 '{file_path}' 的第 {i+1} 行时出错: {e}")
+            if failed_files is not None:
+                failed_files.append(file_name)
         except Exception as e:
             print(f"❌ 错误: 读取或处理文件 '{file_path}' 时出错: {e}")
-            
-    return documents
+            if failed_files is not None:
+                failed_files.append(file_name)
+    if registry.occurrences_seen:
+        print(f"🧬 案例去重: 读取 {registry.occurrences_seen} 篇文书，跳过重复 {registry.duplicates_skipped} 篇。")
 
 
-def create_vector_store(source_dir: str, db_dir: str, model_path: str, doc_type: str):
+def load_cail_scm_from_json(files_to_process: list) -> list:
+    """
+    从给定的文件列表加载 CAIL-SCM 格式的 JSON 文件,
+    并将每个案件的 A, B, C 文书解析为独立的 LangChain Document 对象 (按内容去重)。
+
+    :param files_to_process: 需要处理的JSON文件路径列表。
+    :return: 一个包含所有解析出的 Document 对象的列表。
+    """
+    return list(iter_cail_scm_documents(files_to_process))
+
+
+def _make_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, 
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=["\n\n", "\n", "。", "！", "？", "，", "、", " ", ""],
+        keep_separator=False
+    )
+
+
+def _load_embeddings(model_path: str) -> SentenceTransformerEmbeddings:
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print(f"\n🧠 自动检测到可用设备: {device.upper()}")
+    # --- 修正：移除与LangChain内部调用冲突的 'show_progress_bar' 参数 ---
+    return SentenceTransformerEmbeddings(
+        model_name=model_path, 
+        model_kwargs={'device': device},
+        encode_kwargs={'batch_size': EMBED_BATCH_SIZE}
+    )
+
+
+def index_cases_streaming(files_to_process: list, vector_store, embeddings=None, pool=None,
+                          known_ids: dict = None, failed_files: list = None, registry: CaseRegistry = None) -> dict:
+    """
+    以流水线方式为案例建库：解析 -> 切块 -> 嵌入 -> 写入 Chroma。
+    各阶段在各自线程中运行，由有界队列连接，解析、嵌入与写库互相重叠；
+    内存中最多只有几批文本块，与语料规模无关。结束时打印各阶段吞吐。
+    文本块使用稳定 ID (见 ChunkIdAssigner)，known_ids 中已存在的文本块直接跳过，不重新嵌入。
+
+    :param embeddings: 进程内嵌入模型 (单进程模式，每批 EMBED_BATCH_SIZE 个文本块)。
+    :param pool: EmbeddingWorkerPool (多进程模式，每片 WORKER_SHARD_SIZE 个文本块)。给出时忽略 embeddings。
+    :param known_ids: {文件名: 库中已有的文本块 ID 集合}。
+    :param failed_files: 见 iter_cail_scm_documents。
+    :param registry: 案例去重登记表，见 iter_cail_scm_documents。
+    :return: {"written": 写入的文本块数, "skipped": 未变化而跳过的文本块数, "chunk_ids": {文件名: 本次切出的全部文本块 ID}}
+    """
+    text_splitter = _make_text_splitter()
+    batcher = Batcher(WORKER_SHARD_SIZE if pool is not None else EMBED_BATCH_SIZE)
+    collection = vector_store._collection
+    worker_stats = {"encode_seconds": 0.0, "result_wait": 0.0}
+    known_ids = known_ids or {}
+    assigners = {}
+    chunk_ids = defaultdict(list)
+    skipped = [0]
+
+    def _chunk(document):
+        name = document.metadata["source"]
+        if name not in assigners:
+            assigners[name] = ChunkIdAssigner(name)
+        known = known_ids.get(name, ())
+        fresh = []
+        for chunk in text_splitter.split_documents([document]):
+            chunk_id = assigners[name](chunk.page_content)
+            chunk_ids[name].append(chunk_id)
+            if chunk_id in known:
+                skipped[0] += 1
+            else:
+                fresh.append((chunk_id, chunk))
+        return batcher.add(fresh)
+
+    def _embed(batch):
+        vectors = embeddings.embed_documents([doc.page_content for _, doc in batch])
+        return [(batch, vectors)]
+
+    def _dispatch(batch):
+        # 只提交、不等待；Future 按提交顺序流向写库阶段，队列容量决定了同时在算的分片数
+        return [(batch, pool.submit([doc.page_content for _, doc in batch]))]
+
+    def _write(embedded):
+        batch, vectors = embedded
+        if isinstance(vectors, Future):
+            wait_start = time.perf_counter()
+            vectors, encode_seconds = vectors.result()
+            worker_stats["result_wait"] += time.perf_counter() - wait_start
+            worker_stats["encode_seconds"] += encode_seconds
+            vectors = vectors.tolist()
+        # 直接写入已算好的向量，避免 Chroma 再次调用嵌入模型；upsert 使中断后重跑不会产生重复
+        collection.upsert(
+            ids=[chunk_id for chunk_id, _ in batch],
+            embeddings=vectors,
+            documents=[doc.page_content for _, doc in batch],
+            metadatas=[doc.metadata for _, doc in batch],
+        )
+
+    if pool is not None:
+        embed_stage = PipelineStage("分发", _dispatch, unit="文本块", size=len)
+        # 写库阶段前的队列要能容纳足够多的在途分片，才能让所有嵌入进程同时工作
+        queue_size = max(PIPELINE_QUEUE_SIZE, 2 * pool.workers)
+    else:
+        embed_stage = PipelineStage("嵌入", _embed, unit="文本块", size=len)
+        queue_size = PIPELINE_QUEUE_SIZE
+
+    start = time.perf_counter()
+    stats = run_pipeline(
+        iter_cail_scm_documents(files_to_process, failed_files, registry),
+        [
+            PipelineStage("切块", _chunk, unit="文档", flush=batcher.flush),
+            embed_stage,
+            PipelineStage("写库", _write, unit="文本块", size=lambda embedded: len(embedded[0])),
+        ],
+        queue_size=queue_size,
+        source_name="解析",
+        source_unit="文档",
+    )
+    wall_seconds = time.perf_counter() - start
+    written = stats[-1].units
+    if pool is not None:
+        # 写库阶段等待嵌入结果的时间计为阻塞而非工作
+        stats[-1].busy_seconds -= worker_stats["result_wait"]
+        stats[-1].wait_seconds += worker_stats["result_wait"]
+    print(format_stats(stats, wall_seconds))
+    if pool is not None and written:
+        per_worker = written / worker_stats["encode_seconds"] if worker_stats["encode_seconds"] > 0 else float("inf")
+        utilization = worker_stats["encode_seconds"] / (wall_seconds * pool.workers) if wall_seconds > 0 else 0.0
+        print(f"🧮 嵌入进程: {pool.workers} 个 × {pool.threads_per_worker} 线程 | "
+              f"整体 {written / wall_seconds:,.1f} 文本块/秒 | 单进程 {per_worker:,.1f} 文本块/秒 | 进程利用率 {utilization:.0%}")
+    return {"written": written, "skipped": skipped[0], "chunk_ids": dict(chunk_ids)}
+
+
+def split_statutes_by_article(documents: list, db_dir: str, removed_files: list = ()) -> list:
+    """
+    把法律全文按 编/章/节/第X条 结构逐条切分，每条一个 Document，元数据包含法律名称、所属章节与条号；
+    同时把条文写入 db_dir/article_table.json (法律, 条号) -> 条文 查找表，供 LAS 直接回答明确的条文引用。
+    法律简称取文件名 (如 '劳动合同法.docx' -> '劳动合同法')，全称取正文第一行。
+
+    :param documents: Docx2txtLoader 加载的文档 (每个文件一个)。
+    :param removed_files: 已从源目录删除的文件名，其条文从查找表中移除。
+    :return: 逐条切分后的 Document 列表。
+    """
+    table_path = os.path.join(db_dir, ARTICLE_TABLE_FILENAME)
+    table = ArticleTable.load(table_path) if os.path.exists(table_path) else ArticleTable()
+    for name in removed_files:
+        table.remove_law(os.path.splitext(name)[0])
+    docs_splitted = []
+    for document in documents:
+        source = document.metadata.get("source", "")
+        law = os.path.splitext(os.path.basename(source))[0]
+        title = next((line.strip() for line in document.page_content.splitlines() if line.strip()), law)
+        # 先移除旧条文：新版本解析失败时也不会继续用旧条文回答引用
+        table.remove_law(law)
+        records = parse_statute(document.page_content, law)
+        if not records:
+            print(f"⚠️ 警告：未能从 '{os.path.basename(source)}' 中识别出任何条文，已跳过。")
+            continue
+        table.add_law(law, title, records)
+        for record in records:
+            docs_splitted.append(Document(
+                page_content=f"《{law}》{record['text']}",
+                metadata={
+                    "source": source,
+                    "law": law,
+                    "part": record["part"],
+                    "chapter": record["chapter"],
+                    "section": record["section"],
+                    "article": record["label"],
+                    "article_no": record["number"] or 0,
+                    "location": format_location(record),
+                }
+            ))
+        print(f"  - {law}: 识别出 {len(records)} 条")
+    os.makedirs(db_dir, exist_ok=True)
+    table.save(table_path)
+    print(f"📑 条文查找表已更新: {table_path} ({len(table.laws)} 部法律, {len(table)} 条)")
+    return docs_splitted
+
+
+def prune_article_table(db_dir: str, file_names: list):
+    """
+    chunk 模式下增量建库时，从已有的条文查找表中移除变化或删除的法律 (它们不会按条重新写入)，
+    避免 LAS 继续用查找表中的旧条文回答对这些法律的明确引用。没有查找表时不做任何事。
+    """
+    table_path = os.path.join(db_dir, ARTICLE_TABLE_FILENAME)
+    if not file_names or not os.path.exists(table_path):
+        return
+    table = ArticleTable.load(table_path)
+    laws = [law for law in (os.path.splitext(name)[0] for name in file_names) if law in table.laws]
+    if not laws:
+        return
+    for law in laws:
+        table.remove_law(law)
+    table.save(table_path)
+    print(f"⚠️ 警告：已从条文查找表中移除 {laws} (chunk 模式不生成逐条记录)，这些法律的条文引用将改走检索。"
+          f"如需继续直接查表，请用 --split-mode article 重新建库。")
+
+
+def build_lexical_index(db_dir: str, vector_store=None) -> bool:
+    """
+    从 Chroma 中的全部文本块重建词法 (BM25) 索引，保存到 db_dir/lexical_index.npz。
+    每次都基于库中完整内容重建，因此与增量添加的结果保持一致。
+    :param vector_store: 已打开的 Chroma 实例；为 None 时以只读方式打开 db_dir (无需加载嵌入模型)。
+    :return: 是否成功。
+    """
+    try:
+        if vector_store is None:
+            vector_store = Chroma(persist_directory=os.path.abspath(db_dir))
+        texts, metadatas = [], []
+        offset = 0
+        while True:
+            batch = vector_store.get(include=["documents", "metadatas"], limit=GET_BATCH_SIZE, offset=offset)
+            documents = batch.get("documents") or []
+            if not documents:
+                break
+            texts.extend(documents)
+            metadatas.extend(batch.get("metadatas") or [{} for _ in documents])
+            offset += len(documents)
+        index = LexicalIndex.build(texts, metadatas)
+        index_path = os.path.join(db_dir, LEXICAL_INDEX_FILENAME)
+        index.save(index_path)
+        print(f"🔤 词法索引已更新: {index_path} ({len(index)} 个文本块, {index.vocabulary_size} 个词项)")
+        return True
+    except Exception as e:
+        print(f"❌ 错误：构建词法索引时出错: {e}"); traceback.print_exc()
+        return False
+
+
+def create_vector_store(source_dir: str, db_dir: str, model_path: str, doc_type: str, split_mode: str = "chunk",
+                        workers: int = 0, threads_per_worker: int = None):
     """
     通用函数：根据文档类型加载文档, 分割, 创建向量存储。
-    现在支持增量更新。
+    按建库清单 (index_manifest.json) 增量更新：只处理内容哈希变化的文件，且只嵌入其中新增/变化的文本块，
+    已不存在的文本块 (包括已删除文件的全部文本块) 从 Chroma 中删除，未变化的文本块保持不动。
+    :param split_mode: 法条的切分方式，见 SPLIT_MODES (案例文档总是按长度切块)。
+    :param workers: 案例建库时的 CPU 嵌入进程数；0 表示在本进程内嵌入 (有 GPU 时使用 GPU)。
+    :param threads_per_worker: 每个嵌入进程的计算线程数，默认平均分配本机 CPU 核数。
     """
     if not os.path.isdir(source_dir):
         print(f"❌ 错误：源目录 '{source_dir}' 不存在。")
@@ -74,85 +343,129 @@ def create_vector_store(source_dir: str, db_dir: str, model_path: str, doc_type:
         print(f"❌ 错误：指定的本地模型路径不存在: '{model_path}'")
         return
 
-    log_file_path = os.path.join(db_dir, 'processed_files.log')
-    processed_files = set()
-    if os.path.exists(log_file_path):
-        with open(log_file_path, 'r', encoding='utf-8') as f:
-            processed_files = set(line.strip() for line in f)
-    print(f"📖 已处理文件日志找到 {len(processed_files)} 条记录。")
-
-    # 1. 加载文档 (只加载新文件)
-    print(f"\n📚 正在从 '{source_dir}' 检查并加载新的 {doc_type} 文档...")
-    
-    files_to_process = []
     if doc_type == 'legal':
         all_files = glob.glob(os.path.join(source_dir, '*.docx'))
-        files_to_process = [f for f in all_files if os.path.basename(f) not in processed_files]
-    elif doc_type == 'case':
+    else:
         all_files = glob.glob(os.path.join(source_dir, '**', '*.json'), recursive=True)
-        files_to_process = [f for f in all_files if os.path.basename(f) not in processed_files]
+    source_paths = {os.path.basename(f): f for f in sorted(all_files)}
+
+    # 1. 读取建库清单；旧版只有 processed_files.log 时先迁移
+    abs_db_dir = os.path.abspath(db_dir)
+    try:
+        manifest = IndexManifest.load(abs_db_dir)
+        if manifest is None:
+            if os.path.exists(os.path.join(abs_db_dir, LEGACY_LOG_FILENAME)):
+                print(f"📖 未找到建库清单，正在从 {LEGACY_LOG_FILENAME} 迁移...")
+                manifest = migrate_legacy_log(abs_db_dir, Chroma(persist_directory=abs_db_dir)._collection, source_paths, GET_BATCH_SIZE)
+                manifest.save()
+            else:
+                manifest = IndexManifest(abs_db_dir)
+    except Exception as e:
+        print(f"❌ 错误：读取建库清单时出错: {e}"); traceback.print_exc(); return
+    print(f"📖 建库清单记录了 {len(manifest.files)} 个文件、{manifest.total_chunks()} 个文本块。")
+    if doc_type == 'legal' and split_mode == 'article' and manifest.files and not os.path.exists(os.path.join(db_dir, ARTICLE_TABLE_FILENAME)):
+        print("⚠️ 警告：现有法条库是按 chunk 模式建立的，只有新增或变化的文件会按条切分。如需整体切换，请删除 legal_db 后重新建库。")
 
-    if not files_to_process:
-        print("✅ 未发现需要处理的新文件。数据库已是最新。")
+    # 2. 按内容哈希找出新增/变化/删除的文件
+    print(f"\n📚 正在从 '{source_dir}' 检查新增或变化的 {doc_type} 文档...")
+    changed_files = {}
+    for name, path in tqdm(source_paths.items(), desc="  计算文件哈希", unit="个"):
+        sha256 = file_sha256(path)
+        if not manifest.is_unchanged(name, sha256):
+            changed_files[name] = (path, sha256)
+    removed_files = [name for name in manifest.files if name not in source_paths]
+
+    if not changed_files and not removed_files:
+        print("✅ 未发现新增、变化或删除的文件。数据库已是最新。")
+        if doc_type == 'legal' and manifest.files and not os.path.exists(os.path.join(db_dir, LEXICAL_INDEX_FILENAME)):
+            print("🔤 法条库缺少词法索引，正在根据现有向量库生成...")
+            build_lexical_index(db_dir)
         return
 
-    print(f"📂 发现 {len(files_to_process)} 个新文件需要处理: {[os.path.basename(f) for f in files_to_process]}")
-    
+    print(f"📂 发现 {len(changed_files)} 个新增或变化的文件: {list(changed_files)}")
+    if removed_files:
+        print(f"🗑️ 发现 {len(removed_files)} 个已删除的文件: {removed_files}")
+
+    os.makedirs(abs_db_dir, exist_ok=True)
+    if doc_type == 'case':
+        # 案例语料很大，走流式流水线，不把全部文档读入内存
+        _index_cases(changed_files, removed_files, manifest, abs_db_dir, model_path, workers, threads_per_worker, source_paths)
+    else:
+        _index_statutes(changed_files, removed_files, manifest, abs_db_dir, model_path, split_mode)
+
+
+def _delete_chunks(collection, chunk_ids: list):
+    for i in range(0, len(chunk_ids), GET_BATCH_SIZE):
+        collection.delete(ids=chunk_ids[i:i + GET_BATCH_SIZE])
+
+
+def _index_statutes(changed_files: dict, removed_files: list, manifest: IndexManifest, db_dir: str,
+                    model_path: str, split_mode: str):
+    """法条建库：加载变化的文件，切分后按稳定 ID 与清单比较，只嵌入新文本块、删除过期文本块。"""
     documents = []
     try:
-        if doc_type == 'legal':
-            for file_path in files_to_process:
-                 loader = Docx2txtLoader(file_path)
-                 documents.extend(loader.load())
-        elif doc_type == 'case':
-            documents = load_cail_scm_from_json(files_to_process)
+        for path, _ in changed_files.values():
+             loader = Docx2txtLoader(path)
+             documents.extend(loader.load())
     except Exception as e:
         print(f"❌ 错误：加载新文档时出错: {e}"); traceback.print_exc(); return
-    
-    if not documents:
+
+    if changed_files and not documents:
         print(f"⚠️ 警告：未能从新文件中加载任何文档内容。")
         return
-        
     print(f"✅ 成功从新文件中加载了 {len(documents)} 个文档对象。")
 
-    # 2. 分割文档
-    print("\n✂️ 正在将新文档分割成块...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE, 
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", "。", "！", "？", "，", "、", " ", ""],
-        keep_separator=False
-    )
-    docs_splitted = text_splitter.split_documents(documents)
+    # 切分文档并分配稳定 ID
+    if split_mode == 'article':
+        print("\n✂️ 正在按条文结构 (编/章/节/第X条) 切分新文档...")
+        docs_splitted = split_statutes_by_article(documents, db_dir, removed_files)
+    else:
+        print("\n✂️ 正在将新文档分割成块...")
+        prune_article_table(db_dir, list(changed_files) + list(removed_files))
+        docs_splitted = _make_text_splitter().split_documents(documents)
     print(f"✅ 已将新文档分割成 {len(docs_splitted)} 个文本块。")
 
-    # 3. 初始化嵌入模型
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"\n🧠 自动检测到可用设备: {device.upper()}")
-    # --- 修正：移除与LangChain内部调用冲突的 'show_progress_bar' 参数 ---
-    embeddings = SentenceTransformerEmbeddings(
-        model_name=model_path, 
-        model_kwargs={'device': device},
-        encode_kwargs={'batch_size': EMBED_BATCH_SIZE}
-    )
+    assigners = {name: ChunkIdAssigner(name) for name in changed_files}
+    known_ids = {name: set(manifest.chunk_ids(name)) for name in changed_files}
+    new_ids = {name: [] for name in changed_files}
+    to_add = []
+    for doc in docs_splitted:
+        name = os.path.basename(doc.metadata.get("source", ""))
+        chunk_id = assigners[name](doc.page_content)
+        new_ids[name].append(chunk_id)
+        if chunk_id not in known_ids[name]:
+            to_add.append((chunk_id, doc))
+    to_delete = [chunk_id for name in changed_files for chunk_id in known_ids[name] - set(new_ids[name])]
+    to_delete += [chunk_id for name in removed_files for chunk_id in manifest.chunk_ids(name)]
+    unchanged = len(docs_splitted) - len(to_add)
+    print(f"🧮 增量对比: 新增/变化 {len(to_add)} 个文本块，删除 {len(to_delete)} 个，未变化 {unchanged} 个。")
 
-    # 4. 更新向量存储
-    abs_db_dir = os.path.abspath(db_dir)
-    print(f"\n💾 准备向向量存储库添加新数据: {abs_db_dir}")
-    os.makedirs(abs_db_dir, exist_ok=True)
+    # 只有需要嵌入时才加载嵌入模型
+    embeddings = _load_embeddings(model_path) if to_add else None
+    vector_store = None
+    print(f"\n💾 准备更新向量存储库: {db_dir}")
     try:
-        vector_store = Chroma(persist_directory=abs_db_dir, embedding_function=embeddings)
-        print(f"⏳ 开始分批添加 {len(docs_splitted)} 个新文本块 (批大小: {ADD_BATCH_SIZE})...")
-        for i in tqdm(range(0, len(docs_splitted), ADD_BATCH_SIZE), desc="嵌入并存储", unit="批"):
-            batch = docs_splitted[i:i + ADD_BATCH_SIZE]
-            vector_store.add_documents(documents=batch)
+        vector_store = Chroma(persist_directory=db_dir, embedding_function=embeddings)
+        if to_add:
+            print(f"⏳ 开始分批添加 {len(to_add)} 个文本块 (批大小: {ADD_BATCH_SIZE})...")
+            for i in tqdm(range(0, len(to_add), ADD_BATCH_SIZE), desc="嵌入并存储", unit="批"):
+                batch = to_add[i:i + ADD_BATCH_SIZE]
+                vector_store.add_documents(documents=[doc for _, doc in batch], ids=[chunk_id for chunk_id, _ in batch])
+        # 先写入新文本块再删除旧文本块，更新过程中库里始终有可用内容
+        if to_delete:
+            print(f"🗑️ 正在删除 {len(to_delete)} 个过期文本块...")
+            _delete_chunks(vector_store._collection, to_delete)
         print("\n⏳ 正在持久化数据库...")
         vector_store.persist()
-        
-        print(f"✍️ 正在更新处理日志: {log_file_path}")
-        with open(log_file_path, 'a', encoding='utf-8') as f:
-            for file_path in files_to_process:
-                f.write(os.path.basename(file_path) + '\n')
+
+        for name, (_, sha256) in changed_files.items():
+            manifest.set_file(name, sha256, new_ids[name])
+        for name in removed_files:
+            manifest.remove_file(name)
+        print(f"✍️ 正在更新建库清单: {manifest.path}")
+        manifest.save()
+
+        build_lexical_index(db_dir, vector_store)
 
         print(f"🎉 向量存储更新成功！")
     except Exception as e:
@@ -160,10 +473,218 @@ def create_vector_store(source_dir: str, db_dir: str, model_path: str, doc_type:
     finally:
         vector_store = None; embeddings = None; import gc; gc.collect()
 
+def _index_cases(changed_files: dict, removed_files: list, manifest: IndexManifest, db_dir: str, model_path: str,
+                 workers: int = 0, threads_per_worker: int = None, source_paths: dict = None):
+    """案例建库：打开向量库后交给 index_cases_streaming，全部写入成功后删除过期文本块并更新建库清单与案例登记表。"""
+    try:
+        registry = CaseRegistry.load(db_dir)
+    except Exception as e:
+        print(f"❌ 错误：读取案例登记表时出错: {e}"); traceback.print_exc(); return
+    registry.forget_files(list(changed_files) + removed_files)
+    # 归属文件变化或删除、但仍出现在未变化文件中的案例：重新扫描这些文件以认领它们 (未变化的文本块不会重新嵌入)
+    rescan = {occ[0] for case_id in registry.orphaned() for occ in registry.occurrences(case_id)} - set(changed_files)
+    rescan = sorted(name for name in rescan if name in (source_paths or {}))
+    if rescan:
+        print(f"🔁 以下文件包含需要重新认领的重复案例，将一并扫描: {rescan}")
+        for name in rescan:
+            changed_files[name] = (source_paths[name], file_sha256(source_paths[name]))
+        registry.forget_files(rescan)
+
+    # 多进程模式下主进程不加载模型：向量由嵌入进程计算，Chroma 只负责写入
+    embeddings = _load_embeddings(model_path) if changed_files and workers <= 0 else None
+    print(f"\n💾 准备向向量存储库流式添加新数据: {db_dir}")
+    vector_store = None
+    pool = None
+    try:
+        vector_store = Chroma(persist_directory=db_dir, embedding_function=embeddings)
+        known_ids = {name: set(manifest.chunk_ids(name)) for name in changed_files}
+        failed_files = []
+        result = {"written": 0, "skipped": 0, "chunk_ids": {}}
+        files_to_process = [path for path, _ in changed_files.values()]
+        if files_to_process and workers > 0:
+            threads = threads_per_worker or default_threads_per_worker(workers)
+            print(f"⏳ 启动 {workers} 个 CPU 嵌入进程 (每进程 {threads} 线程，分片大小: {WORKER_SHARD_SIZE})...")
+            pool = EmbeddingWorkerPool(model_path, workers, threads, WORKER_ENCODE_BATCH_SIZE)
+            result = index_cases_streaming(files_to_process, vector_store, pool=pool, known_ids=known_ids,
+                                           failed_files=failed_files, registry=registry)
+        elif files_to_process:
+            print(f"⏳ 流水线启动 (嵌入批大小: {EMBED_BATCH_SIZE}, 队列容量: {PIPELINE_QUEUE_SIZE} 批)...")
+            result = index_cases_streaming(files_to_process, vector_store, embeddings, known_ids=known_ids,
+                                           failed_files=failed_files, registry=registry)
+
+        to_delete = []
+        for name, (_, sha256) in changed_files.items():
+            new_ids = result["chunk_ids"].get(name, [])
+            if name in failed_files:
+                # 文件只处理了一部分：保留旧文本块，哈希置空以便下次重试
+                manifest.set_file(name, "", sorted(known_ids[name] | set(new_ids)))
+                continue
+            to_delete.extend(known_ids[name] - set(new_ids))
+            manifest.set_file(name, sha256, new_ids)
+        for name in removed_files:
+            to_delete.extend(manifest.chunk_ids(name))
+            manifest.remove_file(name)
+        if to_delete:
+            print(f"🗑️ 正在删除 {len(to_delete)} 个过期文本块...")
+            _delete_chunks(vector_store._collection, to_delete)
+        print("\n⏳ 正在持久化数据库...")
+        vector_store.persist()
+
+        print(f"✍️ 正在更新建库清单: {manifest.path}")
+        manifest.save()
+        registry.save()
+        print(f"🧬 案例登记表: {len(registry.cases)} 个不同案例 ({registry.path})")
+        print(f"🎉 向量存储更新成功！新增/变化 {result['written']} 个文本块，未变化 {result['skipped']} 个，删除 {len(to_delete)} 个。")
+    except Exception as e:
+        print(f"❌ 错误：在嵌入或存储到 Chroma 时出错: {e}"); traceback.print_exc()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel=True)
+        vector_store = None; embeddings = None; import gc; gc.collect()
+
+def export_case_mmap(db_dir: str, dtype: str = "float16") -> bool:
+    """
+    把案例 Chroma 库导出为内存映射只读库 (db_dir/mmap)，供 CASE_STORE_BACKEND=mmap 时的 SCM 使用。
+    导出时记录建库清单的哈希，在线加载时据此提示导出是否过期。
+    """
+    out_dir = os.path.join(os.path.abspath(db_dir), "mmap")
+    print(f"\n📦 正在导出案例内存映射库 ({dtype}): {out_dir}")
+    try:
+        start = time.perf_counter()
+        collection = Chroma(persist_directory=os.path.abspath(db_dir))._collection
+        header = export_collection(
+            collection, out_dir, dtype, GET_BATCH_SIZE,
+            source_fingerprint=fingerprint_file(os.path.join(os.path.abspath(db_dir), MANIFEST_FILENAME)),
+        )
+        size_mb = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir)) / 1024 / 1024
+        print(f"✅ 导出完成: {header['count']} 条, 维度 {header['dim']}, 共 {size_mb:.1f} MB, 耗时 {time.perf_counter() - start:.1f}s")
+        return True
+    except Exception as e:
+        print(f"❌ 错误：导出内存映射库时出错: {e}"); traceback.print_exc()
+        return False
+
+def build_case_ann(db_dir: str, kind: str, **build_params) -> bool:
+    """
+    在案例内存映射库 (db_dir/mmap) 上构建 faiss ANN 索引，供 CASE_STORE_BACKEND=ann 时的 SCM 使用。
+    索引按行号引用内存映射库，每次重新导出后都需要重新构建。
+    """
+    mmap_dir = os.path.join(os.path.abspath(db_dir), "mmap")
+    ann_dir = os.path.join(os.path.abspath(db_dir), "ann")
+    print(f"\n🧭 正在构建案例 ANN 索引 ({kind}): {ann_dir}")
+    try:
+        from tools.ann_index import build_and_save
+        info = build_and_save(mmap_dir, ann_dir, kind, **build_params)
+        print(f"✅ ANN 索引构建完成: {info['count']} 条, 参数 {info['params']}, "
+              f"索引 {info['index_bytes'] / 1024 / 1024:.1f} MB, 耗时 {info['build_secs']:.1f}s")
+        return True
+    except Exception as e:
+        print(f"❌ 错误：构建 ANN 索引时出错: {e}"); traceback.print_exc()
+        return False
+
+def _load_eval_queries(path: str) -> list:
+    """
+    评测集：JSONL (每行 {"query": ..., "expected": [...]}，expected 可省略) 或纯文本 (每行一条查询)。
+    expected 中的每一项可以是规范案例 ID、条文位置 (如 '劳动合同法 ... 第四十七条')、源文件名或应出现在结果文本中的片段。
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                expected = record.get("expected") or []
+                items.append({"query": record["query"], "expected": [expected] if isinstance(expected, str) else list(expected)})
+            else:
+                items.append({"query": line, "expected": []})
+    return items
+
+
+def _matches(expected: str, text: str, metadata: dict) -> bool:
+    metadata = metadata or {}
+    return expected in (metadata.get("doc_id"), metadata.get("location"), os.path.basename(metadata.get("source", ""))) \
+        or expected in (text or "")
+
+
+def evaluate_queries(query_file: str, db_dir: str, model_path: str, doc_type: str, k: int = 5,
+                     output_path: str = None, retrieval_mode: str = "hybrid") -> dict:
+    """
+    用与在线 LAS / SCM 相同的批量检索实现跑离线评测集：每 EVAL_BATCH_SIZE 条查询一次编码、一起检索。
+    评测集带 expected 时统计 recall@k、hit@k 与 MRR；output_path 给定时逐条写出检索结果 (JSONL)。
+    """
+    items = _load_eval_queries(query_file)
+    print(f"\n🧪 离线评测: {len(items)} 条查询, k={k}, 库: {os.path.abspath(db_dir)}")
+    if not items:
+        return {}
+    embeddings = _load_embeddings(model_path)
+    vector_store = Chroma(persist_directory=os.path.abspath(db_dir), embedding_function=embeddings)
+    lexical = article_table = None
+    if doc_type == 'legal':
+        lexical_path = os.path.join(db_dir, LEXICAL_INDEX_FILENAME)
+        if retrieval_mode != "dense" and os.path.exists(lexical_path):
+            lexical = LexicalIndex.load(lexical_path)
+        table_path = os.path.join(db_dir, ARTICLE_TABLE_FILENAME)
+        if os.path.exists(table_path):
+            article_table = ArticleTable.load(table_path)
+
+    start = time.perf_counter()
+    rows = []
+    for offset in tqdm(range(0, len(items), EVAL_BATCH_SIZE), desc="评测批次"):
+        batch = items[offset:offset + EVAL_BATCH_SIZE]
+        queries = [item["query"] for item in batch]
+        if doc_type == 'legal':
+            hits = search_articles_many(queries, lambda: (embeddings, vector_store), lexical=lexical, article_table=article_table,
+                                        k=k, fetch_k=max(10, 2 * k), mode=retrieval_mode)
+            results = [[(text, metadata, None) for text, metadata in item.results] for item in hits]
+        else:
+            results = [[(doc.page_content, doc.metadata, score) for doc, score in hits]
+                       for hits in search_cases_many(queries, embeddings, vector_store, k)]
+        for item, found in zip(batch, results):
+            ranks = [next((rank for rank, (text, metadata, _) in enumerate(found, 1) if _matches(e, text, metadata)), None)
+                     for e in item["expected"]]
+            rows.append({
+                "query": item["query"],
+                "expected": item["expected"],
+                "ranks": ranks,
+                "results": [{"rank": rank, "text": text[:200], "metadata": metadata, "score": score}
+                            for rank, (text, metadata, score) in enumerate(found, 1)],
+            })
+    elapsed = time.perf_counter() - start
+
+    labelled = [row for row in rows if row["expected"]]
+    summary = {"queries": len(rows), "labelled": len(labelled), "secs": round(elapsed, 2),
+               "qps": round(len(rows) / elapsed, 1) if elapsed else 0.0}
+    if labelled:
+        summary["recall@k"] = round(sum(sum(r is not None for r in row["ranks"]) / len(row["ranks"]) for row in labelled) / len(labelled), 4)
+        summary["hit@k"] = round(sum(any(r is not None for r in row["ranks"]) for row in labelled) / len(labelled), 4)
+        summary["mrr"] = round(sum(1 / min((r for r in row["ranks"] if r is not None), default=float("inf")) for row in labelled) / len(labelled), 4)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print(f"📝 逐条结果已写入 {output_path}")
+    print(f"✅ 评测完成: " + ", ".join(f"{key}={value}" for key, value in summary.items()))
+    return summary
+
 # --- 主程序入口 (无变动) ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="为法律或案例文档创建向量数据库。")
     parser.add_argument('--type', type=str, choices=['legal', 'case'], required=True, help="要索引的文档类型: 'legal' (法条) 或 'case' (案例)。")
+    parser.add_argument('--split-mode', type=str, choices=SPLIT_MODES, default='chunk', help="法条切分方式: 'chunk' (按长度切块，默认) 或 'article' (按条切分，并生成条文查找表)。")
+    parser.add_argument('--workers', type=int, default=0, help="案例建库时的 CPU 嵌入进程数 (默认 0：在本进程内嵌入，有 GPU 时使用 GPU)。")
+    parser.add_argument('--threads-per-worker', type=int, default=None, help="每个嵌入进程的计算线程数 (默认: CPU 核数 / 进程数)。")
+    parser.add_argument('--export-mmap', type=str, choices=MMAP_DTYPES, default=None, help="案例建库后导出内存映射只读库 (float16 或 int8)，供 CASE_STORE_BACKEND=mmap 使用。")
+    parser.add_argument('--build-ann', type=str, choices=ANN_KINDS, default=None, help="在内存映射库上构建 ANN 索引 (hnsw 或 ivfpq)，供 CASE_STORE_BACKEND=ann 使用；需要 faiss。")
+    parser.add_argument('--hnsw-m', type=int, default=None, help="HNSW 每个节点的邻居数 M (默认 32)。")
+    parser.add_argument('--hnsw-ef-construction', type=int, default=None, help="HNSW 建索引时的候选列表大小 (默认 200)。")
+    parser.add_argument('--ivf-nlist', type=int, default=None, help="IVF 倒排桶数 (默认按库大小自动选择，约 4·√n)。")
+    parser.add_argument('--pq-m', type=int, default=None, help="PQ 子空间数，须整除向量维度 (默认 48)。")
+    parser.add_argument('--pq-nbits', type=int, default=None, help="每个 PQ 子空间的编码位数 (默认 8)。")
+    parser.add_argument('--eval-queries', type=str, default=None, help="离线评测集 (JSONL 或每行一条查询)。给定时只对已有的库做批量检索评测，不建库。")
+    parser.add_argument('--eval-k', type=int, default=5, help="评测时每条查询返回的结果数。")
+    parser.add_argument('--eval-output', type=str, default=None, help="把逐条检索结果写入该 JSONL 文件。")
+    parser.add_argument('--eval-mode', type=str, choices=["hybrid", "dense", "lexical"], default="hybrid", help="法条评测的检索方式 (与 LAS_RETRIEVAL_MODE 相同)。")
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -186,14 +707,35 @@ if __name__ == "__main__":
     print(f"  - 源文件目录: {os.path.abspath(SOURCE_DIRECTORY)}")
     print(f"  - 目标数据库: {os.path.abspath(PERSIST_DIRECTORY)}")
     print(f"  - 嵌入模型:   {os.path.abspath(EMBEDDING_MODEL_PATH)}")
+    if args.type == 'legal':
+        print(f"  - 切分方式:   {args.split_mode}")
+        if args.workers:
+            print("  - 提示: --workers 只用于案例建库，法条建库仍在本进程内嵌入。")
+    elif args.workers:
+        print(f"  - 嵌入进程:   {args.workers}")
     print("-" * 60)
 
+    if args.eval_queries:
+        evaluate_queries(args.eval_queries, PERSIST_DIRECTORY, EMBEDDING_MODEL_PATH, args.type,
+                         k=args.eval_k, output_path=args.eval_output, retrieval_mode=args.eval_mode)
+        sys.exit(0)
+
     create_vector_store(
         source_dir=SOURCE_DIRECTORY,
         db_dir=PERSIST_DIRECTORY,
         model_path=EMBEDDING_MODEL_PATH,
-        doc_type=args.type
+        doc_type=args.type,
+        split_mode=args.split_mode,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker
     )
+    exported = True
+    if args.type == 'case' and (args.export_mmap or (args.build_ann and not os.path.exists(os.path.join(PERSIST_DIRECTORY, "mmap")))):
+        exported = export_case_mmap(PERSIST_DIRECTORY, args.export_mmap or "float16")
+    if args.type == 'case' and args.build_ann and exported:
+        build_params = {"m": args.hnsw_m, "ef_construction": args.hnsw_ef_construction} if args.build_ann == "hnsw" else \
+            {"nlist": args.ivf_nlist, "pq_m": args.pq_m, "nbits": args.pq_nbits}
+        build_case_ann(PERSIST_DIRECTORY, args.build_ann, **build_params)
 
     print("-" * 60)
     print("脚本执行完毕。")
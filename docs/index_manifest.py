@@ -0,0 +1,126 @@
+# docs/index_manifest.py
+# 建库清单：记录每个源文件的内容哈希及其文本块的稳定 ID，用于增量建库。
+# 重新建库时只嵌入新增/变化的文本块，删除已不存在的文本块，未变化的文本块保持不动。
+import os
+import json
+import hashlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_FORMAT_VERSION = 1
+LEGACY_LOG_FILENAME = "processed_files.log"
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    """按块计算文件内容的 SHA-256 (大文件也不会整体读入内存)。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ChunkIdAssigner:
+    """
+    为同一个源文件的文本块生成稳定 ID：sha1(文件名 + 文本)，同一文件中重复出现的相同文本依次加 '-1'、'-2' 后缀。
+    ID 只取决于文本块本身，文件其他位置的修改不会改变未变化文本块的 ID。
+    """
+
+    def __init__(self, source_name: str):
+        self.source_name = source_name
+        self._seen = Counter()
+
+    def __call__(self, text: str) -> str:
+        base = hashlib.sha1(f"{self.source_name}\n{text}".encode("utf-8")).hexdigest()
+        occurrence = self._seen[base]
+        self._seen[base] += 1
+        return base if occurrence == 0 else f"{base}-{occurrence}"
+
+
+class IndexManifest:
+    """
+    向量库目录下的 index_manifest.json：{文件名: {"sha256": 内容哈希, "chunks": [文本块 ID, ...]}}。
+    同时维护旧版的 processed_files.log (文件名列表)，兼容依赖该日志的地方。
+    """
+
+    def __init__(self, db_dir: str, files: Dict[str, dict] = None):
+        self.db_dir = db_dir
+        self.files = files or {}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.db_dir, MANIFEST_FILENAME)
+
+    @classmethod
+    def load(cls, db_dir: str) -> Optional["IndexManifest"]:
+        """读取清单；不存在时返回 None (可能是旧版建库，需要迁移)。"""
+        path = os.path.join(db_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_FORMAT_VERSION:
+            raise ValueError(f"建库清单版本不匹配 (文件: {data.get('version')}, 期望: {MANIFEST_FORMAT_VERSION})。")
+        return cls(db_dir, data.get("files"))
+
+    def save(self):
+        os.makedirs(self.db_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_FORMAT_VERSION, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        with open(os.path.join(self.db_dir, LEGACY_LOG_FILENAME), "w", encoding="utf-8") as f:
+            for name in sorted(self.files):
+                f.write(name + "\n")
+
+    def chunk_ids(self, name: str) -> List[str]:
+        return list((self.files.get(name) or {}).get("chunks") or [])
+
+    def is_unchanged(self, name: str, sha256: str) -> bool:
+        entry = self.files.get(name)
+        return entry is not None and entry.get("sha256") == sha256
+
+    def set_file(self, name: str, sha256: str, chunk_ids: List[str]):
+        self.files[name] = {"sha256": sha256, "chunks": list(chunk_ids)}
+
+    def remove_file(self, name: str):
+        self.files.pop(name, None)
+
+    def total_chunks(self) -> int:
+        return sum(len(entry.get("chunks") or []) for entry in self.files.values())
+
+
+def migrate_legacy_log(db_dir: str, collection, source_paths: Dict[str, str], page_size: int = 5000) -> IndexManifest:
+    """
+    从旧版 processed_files.log 迁移：按元数据中的 source 把库中已有文本块 (随机 ID) 归到各文件名下，
+    并记录这些文件的当前内容哈希。迁移后这些文件视为“未变化”；它们下次修改时，旧文本块会按 ID 被整体删除并以稳定 ID 重新写入。
+    :param collection: Chroma 的底层 collection。
+    :param source_paths: 当前源目录中的 {文件名: 路径}。
+    """
+    manifest = IndexManifest(db_dir)
+    log_path = os.path.join(db_dir, LEGACY_LOG_FILENAME)
+    if not os.path.exists(log_path):
+        return manifest
+    with open(log_path, "r", encoding="utf-8") as f:
+        logged = [line.strip() for line in f if line.strip()]
+
+    ids_by_file = defaultdict(list)
+    offset = 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = batch.get("ids") or []
+        if not ids:
+            break
+        for chunk_id, metadata in zip(ids, batch.get("metadatas") or [{} for _ in ids]):
+            source = os.path.basename((metadata or {}).get("source", ""))
+            ids_by_file[source].append(chunk_id)
+        offset += len(ids)
+
+    for name in logged:
+        path = source_paths.get(name)
+        # 源文件已删除：记录空哈希，稍后按“已删除文件”清理其文本块
+        manifest.set_file(name, file_sha256(path) if path else "", ids_by_file.get(name, []))
+    print(f"🔁 已从 {LEGACY_LOG_FILENAME} 迁移 {len(logged)} 个文件、{manifest.total_chunks()} 个文本块到 {MANIFEST_FILENAME}。")
+    return manifest
@@ -0,0 +1,192 @@
+# docs/indexing_pipeline.py
+# 建库用的流水线：各阶段在独立线程中运行，阶段之间用有界队列连接。
+# 解析、切块、嵌入、写库可以同时进行，内存中同时存在的数据量只取决于队列长度与批大小，与语料规模无关。
+import time
+import queue
+import threading
+from typing import Callable, Iterable, List
+
+# 队列中的结束标记
+_END = object()
+# 阻塞等待队列时检查停止信号的间隔 (秒)
+_POLL_SECONDS = 0.2
+
+
+class StageStats:
+    """单个阶段的统计：处理的单元数、实际工作耗时、因等待上游/下游而阻塞的耗时。"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.units = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """按实际工作耗时计算的吞吐 (单元/秒)，反映该阶段单独运行时的能力。"""
+        return self.units / self.busy_seconds if self.busy_seconds > 0 else float("inf")
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段。
+    :param name: 阶段名称 (用于统计报告)。
+    :param fn: 处理函数，接收上游的一个元素，返回 (或 yield) 零个或多个下游元素。
+    :param unit: 统计单位，如 '文档'、'文本块'。
+    :param size: 计算一个输入元素包含多少个单元 (默认 1；批次可传 len)。
+    :param flush: 上游结束后调用，返回需要继续下发的剩余元素 (例如未凑满的最后一批)。
+    """
+
+    def __init__(self, name: str, fn: Callable, unit: str = "条", size: Callable = None, flush: Callable = None):
+        self.name = name
+        self.fn = fn
+        self.unit = unit
+        self.size = size or (lambda item: 1)
+        self.flush = flush
+
+
+class Batcher:
+    """把逐条到达的元素攒成固定大小的批次 (list)，配合 PipelineStage 的 flush 下发最后不满的一批。"""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._buffer = []
+
+    def add(self, items: Iterable) -> List[list]:
+        self._buffer.extend(items)
+        batches = []
+        while len(self._buffer) >= self.batch_size:
+            batches.append(self._buffer[:self.batch_size])
+            self._buffer = self._buffer[self.batch_size:]
+        return batches
+
+    def flush(self) -> List[list]:
+        batch, self._buffer = self._buffer, []
+        return [batch] if batch else []
+
+
+class _Aborted(Exception):
+    """其他阶段出错时，用于让阻塞中的阶段尽快退出。"""
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Aborted()
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Aborted()
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+
+
+def run_pipeline(source: Iterable, stages: List[PipelineStage], queue_size: int = 4,
+                 source_name: str = "解析", source_unit: str = "条") -> List[StageStats]:
+    """
+    运行流水线：source 与每个阶段各占一个线程，相邻阶段之间是容量为 queue_size 的有界队列。
+    下游处理不过来时上游会阻塞，因此内存占用有上限。任一阶段出错时其余阶段停止，并在此重新抛出该异常。
+    最后一个阶段的输出被丢弃 (通常是写库阶段)。
+    :return: 各阶段 (含 source) 的统计。
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = [StageStats(source_name, source_unit)] + [StageStats(stage.name, stage.unit) for stage in stages]
+
+    def _emit(outputs, out_q, stage_stats):
+        if out_q is None:
+            for _ in outputs or ():
+                pass
+            return
+        for output in outputs or ():
+            start = time.perf_counter()
+            _put(out_q, output, stop)
+            stage_stats.wait_seconds += time.perf_counter() - start
+
+    def _run_source():
+        out_q, stage_stats = queues[0] if queues else None, stats[0]
+        try:
+            iterator = iter(source)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stage_stats.busy_seconds += time.perf_counter() - start
+                stage_stats.units += 1
+                _emit([item], out_q, stage_stats)
+            if out_q is not None:
+                _put(out_q, _END, stop)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def _run_stage(index: int):
+        stage, stage_stats = stages[index], stats[index + 1]
+        in_q = queues[index]
+        out_q = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                start = time.perf_counter()
+                item = _get(in_q, stop)
+                stage_stats.wait_seconds += time.perf_counter() - start
+                if item is _END:
+                    break
+                stage_stats.units += stage.size(item)
+                start = time.perf_counter()
+                outputs = stage.fn(item)
+                # 生成器在迭代时才真正执行，工作耗时 = 总耗时 - 等待下游的耗时
+                waited = stage_stats.wait_seconds
+                _emit(outputs, out_q, stage_stats)
+                stage_stats.busy_seconds += time.perf_counter() - start - (stage_stats.wait_seconds - waited)
+            if stage.flush is not None:
+                _emit(stage.flush(), out_q, stage_stats)
+            if out_q is not None:
+                _put(out_q, _END, stop)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=_run_source, name=f"pipeline-{source_name}", daemon=True)]
+    threads += [threading.Thread(target=_run_stage, args=(i,), name=f"pipeline-{stage.name}", daemon=True)
+                for i, stage in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(_POLL_SECONDS)
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def format_stats(stats: List[StageStats], wall_seconds: float) -> str:
+    """把各阶段统计渲染为多行报告，并标出瓶颈阶段 (工作耗时最长者)。"""
+    bottleneck = max(stats, key=lambda s: s.busy_seconds) if stats else None
+    lines = [f"📊 流水线各阶段统计 (总耗时 {wall_seconds:.1f}s):"]
+    for s in stats:
+        rate = f"{s.throughput:,.1f} {s.unit}/秒" if s.busy_seconds > 0 else "-"
+        mark = "  ← 瓶颈" if s is bottleneck else ""
+        lines.append(f"  - {s.name:<4} {s.units:>9,} {s.unit}  工作 {s.busy_seconds:7.1f}s  阻塞 {s.wait_seconds:7.1f}s  吞吐 {rate}{mark}")
+    return "\n".join(lines)
@@ -1,69 +1,194 @@
 # main.py
 import os
-os.environ['LITELLM_LOG'] = 'DEBUG'
+from config import settings, print_config_summary, TOOL_EXECUTOR_MODE, RESPONSE_CACHE_ENABLED, STREAM_OUTPUT, WARMUP_ENABLED, LLM_CACHE_ENABLED
+# LiteLLM 在导入时读取日志级别，必须在导入 crewai 之前设置；默认只输出错误 (调试时设置 LITELLM_LOG=DEBUG)
+os.environ.setdefault('LITELLM_LOG', settings.litellm_log)
 
 import traceback
 import re 
-from workflow.legal_workflow import create_legal_crew
+from workflow.legal_workflow import run_legal_crew, run_decision_crew, run_synthesis_crew, stream_synthesis
+from workflow.answer_cleaning import clean_final_answer
+from workflow.legal_router import route_request, normalize_instruction, INSTRUCTION_DIRECT
+from tools.tool_chain import parse_tool_chain, execute_tool_chain
+from tools.llm_cache import llm_cache_summary
+from tools.warmup import start_warmup
+from tools.deadline import RequestDeadline, new_request_deadline, deadline_scope, current_deadline
+from tools.tracing import span, current_span
+from workflow.response_cache import get_response_cache
+from workflow.conversation_memory import ConversationMemory, render_history
 from crewai.crews.crew_output import CrewOutput
 from crewai.tasks.task_output import TaskOutput
-import litellm
 
 # --- 设置环境变量 (保持不变) ---
 os.environ["LITELLM_SKIP_MODEL_VALIDATION"] = "TRUE"
 # os.environ["LITELLM_DISABLE_ROUTER"] = "TRUE"
 
-# --- 工作流执行封装 (修改以接收和格式化历史) ---
-def execute_workflow(user_input: str, history_list: list) -> str:
+# --- Crew 结果提取 ---
+def _extract_raw_output(result) -> str:
+    """
+    从 crew.kickoff() 的返回值中提取最后一个任务的原始文本输出。
+    :param result: CrewOutput、字符串或其他对象。
+    :return: 提取到的文本，未能提取时返回 None。
+    """
+    raw_output = None
+
+    if isinstance(result, CrewOutput) and result.tasks_output:
+        print(f"ℹ️ 工作流返回 CrewOutput 对象。尝试提取最后一个任务的输出。")
+        last_task_output = result.tasks_output[-1]
+        if isinstance(last_task_output, TaskOutput):
+            if last_task_output.raw:
+                raw_output = str(last_task_output.raw).strip()
+                print(f"  提取到的 raw_output: {raw_output[:100]}...")
+            elif last_task_output.result:
+                raw_output = str(last_task_output.result).strip()
+                print(f"  提取到的 result: {raw_output[:100]}...")
+            else:
+                print(f"⚠️ 最后一个 TaskOutput 对象中未找到 'raw' 或 'result' 内容: {last_task_output}")
+                raw_output = str(last_task_output)
+        else:
+             print(f"⚠️ 最后一个任务输出类型不是 TaskOutput: {type(last_task_output)}")
+             raw_output = str(last_task_output)
+    elif isinstance(result, str):
+         print(f"ℹ️ 工作流直接返回字符串。")
+         raw_output = result.strip()
+    elif result is None:
+         print("⚠️ 工作流返回了 None。")
+    else:
+         print(f"⚠️ 工作流返回了未知类型：{type(result)}。尝试转换为字符串。")
+         try:
+              raw_output = str(result).strip()
+         except Exception as e:
+              print(f"  转换为字符串失败: {e}")
+
+    return raw_output
+
+# --- 工作流执行封装 (带回答缓存) ---
+def execute_workflow(user_input: str, history_list: list, on_token=None, memory: ConversationMemory = None,
+                     deadline: RequestDeadline = None) -> str:
+    """
+    执行法律咨询工作流。先查询回答缓存 (精确匹配 -> 向量相似度匹配)，未命中时运行完整工作流并写入缓存。
+    整轮请求受时间预算 (REQUEST_DEADLINE_SECONDS) 约束：截止时间对本轮的 Agent、工具与 LLM 调用均可见，
+    时间不足时跳过可选工具、减少检索数量，并用已获得的证据作答；应用的降级记录在 deadline.record() 中并打印。
+    :param user_input: 用户最新的输入。
+    :param history_list: 包含过去对话内容的列表 (例如 ["User: xxx", "AI: yyy", ...])。
+    :param on_token: (可选) 流式回调。提供时最终回复会逐块传给该函数 (无法流式生成时整段传入一次)。
+    :param memory: (可选) 该会话的对话记忆，用于生成带 token 预算的历史视图 (含滚动摘要)。
+    :param deadline: (可选) 本轮的截止时间。调用方 (如 HTTP 服务) 可以在请求到达时创建并传入，以便读取降级记录；
+                     默认在这里按配置创建 (预算为 0 时不限制)。
+    :return: 面向用户的完整回复文本，或错误信息。
+    """
+    if deadline is None:
+        deadline = new_request_deadline()
+    # 追踪开启时，本轮的任务、工具、LLM 调用与检索都记录为 "workflow" 根 span 的子 span (见 tools/tracing.py)
+    with deadline_scope(deadline), span("workflow", "request", input_chars=len(user_input)) as trace:
+        answer = _execute_workflow_with_cache(user_input, history_list, on_token, memory)
+        if deadline is not None:
+            trace.set(degradations=len(deadline.degradations))
+    if deadline is not None and deadline.degradations:
+        record = deadline.record()
+        print(f"📉 [时间预算] 本轮耗时 {record['elapsed']:.1f}s / 预算 {record['budget']:g}s，已应用 {len(record['degradations'])} 项降级: "
+              + "; ".join(f"{d['step']}: {d['action']}" for d in record["degradations"]))
+    return answer
+
+
+def _execute_workflow_with_cache(user_input: str, history_list: list, on_token=None, memory: ConversationMemory = None) -> str:
+    """execute_workflow 的主体：回答缓存 + 工作流。在请求的截止时间上下文中执行。"""
+    cache = get_response_cache() if RESPONSE_CACHE_ENABLED else None
+    if cache is not None:
+        try:
+            hit = cache.lookup(user_input, history_list)
+            if hit is not None:
+                print(f"⚡ [回答缓存] 命中 ({hit.match_type}, 相似度 {hit.similarity:.3f})，原问题: {hit.question[:50]}")
+                current_span().set(response_cache=hit.match_type)
+                if on_token is not None:
+                    on_token(hit.answer)
+                return hit.answer
+        except Exception as e:
+            print(f"⚠️ [回答缓存] 查询失败，继续执行工作流: {e}")
+
+    final_answer = _execute_workflow_uncached(user_input, history_list, on_token=on_token, memory=memory)
+
+    deadline = current_deadline()
+    if deadline is not None and deadline.degradations:
+        # 降级后的回复证据不完整，不写入回答缓存，避免之后的相同提问一直得到降级结果
+        print("ℹ️ [回答缓存] 本轮回复经过降级，不写入缓存。")
+    elif cache is not None:
+        try:
+            cache.store(user_input, history_list, final_answer)
+        except Exception as e:
+            print(f"⚠️ [回答缓存] 写入失败: {e}")
+    return final_answer
+
+# --- 工作流执行 (修改以接收和格式化历史) ---
+def _execute_workflow_uncached(user_input: str, history_list: list, on_token=None, memory: ConversationMemory = None) -> str:
     """
     为给定的用户输入和对话历史初始化并运行法律咨询工作流。
     :param user_input: 用户最新的输入。
     :param history_list: 包含过去对话内容的列表 (例如 ["User: xxx", "AI: yyy", ...])。
+    :param on_token: (可选) 流式回调，见 execute_workflow。
+    :param memory: (可选) 对话记忆，见 execute_workflow。
     :return: 工作流执行后最终生成的面向用户的回复文本，或错误信息。
     """
     try:
-        # 将列表格式的历史转换为适合 Agent prompt 的字符串格式
-        formatted_history = "\n".join(history_list)
+        if WARMUP_ENABLED:
+            # 嵌入模型与向量库尚未加载时在后台开始加载，与协调员的决策过程重叠 (已启动时不做任何事)
+            start_warmup()
+
+        # 将列表格式的历史转换为适合 Agent prompt 的字符串格式：历史较长时只传入预算内的视图 (关键事实 + 摘要 + 最近几轮)
+        formatted_history = render_history(history_list, memory)
+
+        # 快速路由：能在本地确定协调员指令时，跳过协调员的 LLM 调用
+        route = route_request(user_input, history_list)
+        preset_instruction = None
+        if route is not None:
+            preset_instruction = route.instruction
+            print(f"⚡ 快速路由命中 ({route.source}, 置信度 {route.confidence:.2f}): '{preset_instruction}'")
+        else:
+            print("ℹ️ 快速路由未能确定指令，交由 LLM 协调员决策。")
 
-        # 创建 Crew 实例，传入当前用户输入和格式化后的历史
-        workflow_crew = create_legal_crew(user_input, formatted_history)
+        if TOOL_EXECUTOR_MODE == "python":
+            # Python 工具链执行模式：协调员指令由 Python 解析，工具被直接调用，省去工具执行专员的 ReAct 循环
+            instruction = preset_instruction
+            deadline = current_deadline()
+            if instruction is None and deadline is not None and deadline.exhausted():
+                # 剩余时间只够生成回复：不再请协调员决策、不调用工具，直接作答
+                instruction = INSTRUCTION_DIRECT
+                deadline.degrade("协调员决策", "时间预算不足，跳过决策与工具，直接作答")
+            if instruction is None:
+                print("\n🚀 执行协调员决策任务...")
+                instruction = normalize_instruction(_extract_raw_output(run_decision_crew(user_input, formatted_history)))
+                print(f"  协调员指令: '{instruction}'")
 
-        print("\n🚀 开始执行工作流 (Kicking off the workflow)...")
-        result = workflow_crew.kickoff()
+            tool_context = f"'{instruction}'"
+            tool_chain = parse_tool_chain(instruction)
+            if tool_chain:
+                print(f"🔧 [工具链] 开始执行: {' > '.join(tool_chain)}")
+                bundle = execute_tool_chain(tool_chain, user_input, instruction=instruction)
+                print(f"🔧 [工具链] 执行完毕，共 {len(bundle.steps)} 步，耗时 {bundle.wall_time:.2f}s (串行合计 {bundle.elapsed:.2f}s)")
+                tool_context = bundle.to_prompt_text()
+                llm_cache_stats = llm_cache_summary() if LLM_CACHE_ENABLED else None
+                if llm_cache_stats:
+                    print(f"📊 [LLM 缓存] 命中统计: {llm_cache_stats}")
+
+            if on_token is not None:
+                # 流式模式：回复整合专员的生成过程逐块输出，前缀清理在流上增量完成
+                print("\n🚀 开始流式生成回复...")
+                streamed_parts = []
+                for piece in stream_synthesis(user_input, formatted_history, tool_context):
+                    streamed_parts.append(piece)
+                    on_token(piece)
+                return "".join(streamed_parts)
+            print("\n🚀 开始执行工作流 (Kicking off the workflow)...")
+            result = run_synthesis_crew(user_input, formatted_history, tool_context)
+        else:
+            # 复用预构建的 Crew 模板，当前用户输入和格式化后的历史作为本轮的运行时输入
+            print("\n🚀 开始执行工作流 (Kicking off the workflow)...")
+            result = run_legal_crew(user_input, formatted_history, preset_instruction=preset_instruction)
         print("✅ 工作流执行完毕 (Workflow finished).")
 
         # --- 结果提取和清理逻辑 (保持你之前的改进) ---
         final_answer = ""
-        raw_output = None
-
-        # (结果提取逻辑保持不变)
-        if isinstance(result, CrewOutput) and result.tasks_output:
-            print(f"ℹ️ 工作流返回 CrewOutput 对象。尝试提取最后一个任务的输出。")
-            last_task_output = result.tasks_output[-1]
-            if isinstance(last_task_output, TaskOutput):
-                if last_task_output.raw:
-                    raw_output = str(last_task_output.raw).strip()
-                    print(f"  提取到的 raw_output: {raw_output[:100]}...")
-                elif last_task_output.result:
-                    raw_output = str(last_task_output.result).strip()
-                    print(f"  提取到的 result: {raw_output[:100]}...")
-                else:
-                    print(f"⚠️ 最后一个 TaskOutput 对象中未找到 'raw' 或 'result' 内容: {last_task_output}")
-                    raw_output = str(last_task_output)
-            else:
-                 print(f"⚠️ 最后一个任务输出类型不是 TaskOutput: {type(last_task_output)}")
-                 raw_output = str(last_task_output)
-        elif isinstance(result, str):
-             print(f"ℹ️ 工作流直接返回字符串。")
-             raw_output = result.strip()
-        elif result is None:
-             print("⚠️ 工作流返回了 None。")
-        else:
-             print(f"⚠️ 工作流返回了未知类型：{type(result)}。尝试转换为字符串。")
-             try:
-                  raw_output = str(result).strip()
-             except Exception as e:
-                  print(f"  转换为字符串失败: {e}")
+        raw_output = _extract_raw_output(result)
 
         if raw_output:
             final_answer = raw_output
@@ -74,49 +199,9 @@ def execute_workflow(user_input: str, history_list: list) -> str:
         if not isinstance(final_answer, str):
             final_answer = str(final_answer)
 
-        # --- 改进的清理逻辑 (移除了正则表达式部分) ---
-        cleaned_answer = final_answer
-        original_cleaned_answer_before_any_cleaning = cleaned_answer
-        prefixes_to_remove = [
-            "根据协调员的决策指令，我需要进行澄清。", "根据协调员的决策指令\"需要澄清\"，我将进一步询问用户以获取更多信息。",
-            "协调员，您需要我澄清什么具体信息吗？请提供更多细节，以便我能够更好地帮助您。", "根据协调员的决策指令，需要进行澄清。",
-            "根据协调员的决策指令，我需要", "根据协调员的决策指令 ",
-            "为了更好地理解用户的问题，我需要进一步了解以下信息：", "为了更好地理解您的问题，我需要进一步了解以下信息：",
-            "为了更好地帮助您，我需要了解以下信息：", "为了更好地帮助您，请您提供以下信息：",
-            "进行澄清。",
-        ]
-        prefix_removed = False # 这个变量现在可能没什么用了，但保留也无妨
-        for prefix in prefixes_to_remove:
-            # 前缀移除逻辑保持不变 (这部分不使用正则表达式)
-            if cleaned_answer.strip().startswith(prefix):
-                prefix_len = len(prefix)
-                cleaned_answer = cleaned_answer[cleaned_answer.find(prefix) + prefix_len:].strip()
-                cleaned_answer = cleaned_answer.lstrip('，').lstrip(':：').lstrip()
-                print(f"  移除了前缀 '{prefix[:30]}...'")
-                prefix_removed = True # 标记有前缀被移除
-                break
-
-        if not cleaned_answer.strip():
-             if any(kw in original_cleaned_answer_before_any_cleaning for kw in ["为了更好", "请问", "能否提供", "需要了解", "请您提供", "什么信息", "哪些细节"]):
-                 print("  ⚠️ 清理后结果为空，但原始输出似乎包含有效问题，尝试回退并仅移除首要前缀。")
-                 cleaned_answer = original_cleaned_answer_before_any_cleaning
-                 possible_prefixes = [
-                     "根据协调员的决策指令，我需要进行澄清。", "为了更好地理解用户的问题，我需要进一步了解以下信息："
-                 ]
-                 restored = False
-                 for pp in possible_prefixes:
-                     if cleaned_answer.startswith(pp):
-                         cleaned_answer = cleaned_answer[len(pp):].strip().lstrip(':：').lstrip()
-                         if cleaned_answer.strip():
-                            restored = True
-                            break
-                 if not restored or not cleaned_answer.strip():
-                    cleaned_answer = "为了更好地帮助您，请您提供更多关于情况的细节。"
-             else:
-                 cleaned_answer = "为了更好地帮助您，请您提供更多关于情况的细节。"
-
-        final_answer = cleaned_answer
-        # --- 清理逻辑结束 ---
+        final_answer = clean_final_answer(final_answer)
+        if on_token is not None:
+            on_token(final_answer)
 
         return final_answer
 
@@ -131,12 +216,17 @@ def main():
     """
     程序主入口，运行用户交互循环。
     """
+    print_config_summary()
+    if WARMUP_ENABLED:
+        # 用户输入第一个问题的同时，在后台加载嵌入模型与向量库
+        start_warmup()
     print("=" * 60)
     print("⚖️  欢迎使用 AI 法律咨询助手 (模拟版) ⚖️")
     print("   (输入 '退出' 或 'exit' 来结束程序)")
     print("=" * 60)
 
     conversation_history = [] # 初始化对话历史列表
+    conversation_memory = ConversationMemory() # 对话记忆：为 Agent 生成带 token 预算的历史视图
     is_first_turn = True      # 标记是否是第一轮对话
 
     while True:
@@ -167,13 +257,30 @@ def main():
             print("\n⏳ 正在分析并生成回复，请稍候...")
             print("-" * 60)
 
-            final_response = execute_workflow(user_input, conversation_history)
+            if STREAM_OUTPUT:
+                # 流式输出：收到第一个片段时打印标题，之后逐块输出到终端
+                stream_state = {"started": False}
 
-            conversation_history.append(f"AI: {final_response}")
+                def _print_piece(piece: str):
+                    if not stream_state["started"]:
+                        stream_state["started"] = True
+                        print("-" * 60)
+                        print("💡 AI 助手的回复:")
+                    print(piece, end="", flush=True)
 
-            print("-" * 60)
-            print("💡 AI 助手的回复:")
-            print(final_response)
+                final_response = execute_workflow(user_input, conversation_history, on_token=_print_piece, memory=conversation_memory)
+                if not stream_state["started"]:
+                    print("-" * 60)
+                    print("💡 AI 助手的回复:")
+                    print(final_response, end="")
+                print()
+            else:
+                final_response = execute_workflow(user_input, conversation_history, memory=conversation_memory)
+                print("-" * 60)
+                print("💡 AI 助手的回复:")
+                print(final_response)
+
+            conversation_history.append(f"AI: {final_response}")
             print("=" * 60)
 
         except KeyboardInterrupt:
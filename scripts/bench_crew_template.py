@@ -0,0 +1,90 @@
+# scripts/bench_crew_template.py
+# 微基准：比较“每轮重建 Task/Crew”(旧方式) 与“复用预构建 Crew 模板”(新方式) 的每轮构建开销，不调用 LLM。
+#
+# 用法:
+#   python scripts/bench_crew_template.py --turns 200
+#
+# 旧方式的开销 = 按本轮取值构建 3 个 Task + 1 个 Crew；
+# 新方式的开销 = 取当前线程的模板实例 + 插值本轮输入 (即 Crew.kickoff 在调用 LLM 之前所做的准备工作)。
+# 两种方式的 print 输出均被丢弃，只计算对象构建本身。
+import io
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crewai import Crew, Process  # noqa: E402
+from config import get_llm  # noqa: E402
+from agents.legal_agents import (  # noqa: E402
+    legal_coordinator,
+    legal_tool_executor_agent,
+    legal_response_synthesizer_agent
+)
+from workflow.legal_workflow import (  # noqa: E402
+    legal_crew_template,
+    render_template,
+    _build_decision_task,
+    _build_tool_execution_task,
+    _build_synthesis_task,
+)
+
+
+def _sample_inputs(turn: int) -> dict:
+    return {
+        "user_input": f"第{turn}轮：我借给朋友5万元，对方一直不还，我该怎么办？",
+        "conversation_history": "\n".join(f"User: 问题{i}\nAI: 回答{i}" for i in range(turn % 5)),
+    }
+
+
+def legacy_turn(inputs: dict) -> Crew:
+    """旧方式：每轮以本轮取值新建全部 Task 与 Crew (Agent 为共享对象)。"""
+    decision_task = _build_decision_task(legal_coordinator)
+    tool_task = _build_tool_execution_task(legal_tool_executor_agent, decision_task)
+    synthesis_task = _build_synthesis_task(legal_response_synthesizer_agent, tool_task)
+    tasks = [decision_task, tool_task, synthesis_task]
+    for task in tasks:
+        task.description = render_template(task.description, inputs)
+    return Crew(
+        agents=[legal_coordinator, legal_tool_executor_agent, legal_response_synthesizer_agent],
+        tasks=tasks,
+        llm=get_llm(),
+        process=Process.sequential,
+        verbose=True,
+    )
+
+
+def template_turn(inputs: dict) -> Crew:
+    """新方式：复用当前线程的模板实例，只做运行时输入插值。"""
+    crew = legal_crew_template.instance()
+    if hasattr(crew, "_interpolate_inputs"):
+        crew._interpolate_inputs(inputs)
+    else:
+        for task in crew.tasks:
+            task.interpolate_inputs(inputs)
+    return crew
+
+
+def bench(label: str, fn, turns: int) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(_sample_inputs(0))  # 预热 (模板方式在此完成一次性构建)
+        start = time.perf_counter()
+        for turn in range(turns):
+            fn(_sample_inputs(turn))
+        elapsed = time.perf_counter() - start
+    rate = turns / elapsed if elapsed > 0 else float("inf")
+    print(f"  {label:<16} {turns} 轮, 耗时 {elapsed * 1000:.1f} ms, {elapsed / turns * 1e6:.1f} µs/轮, {rate:,.0f} 轮/秒")
+    return rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crew 模板复用的构建开销微基准 (不调用 LLM)。")
+    parser.add_argument("--turns", type=int, default=200, help="每种方式的测量轮数。")
+    args = parser.parse_args()
+
+    print(f"--- Crew 构建开销微基准 ({args.turns} 轮) ---")
+    legacy_rate = bench("每轮重建 (旧)", legacy_turn, args.turns)
+    template_rate = bench("复用模板 (新)", template_turn, args.turns)
+    print(f"  加速比: {template_rate / legacy_rate:.1f}x")
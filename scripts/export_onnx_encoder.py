@@ -0,0 +1,36 @@
+# scripts/export_onnx_encoder.py
+# 把 m3e-base (sentence-transformers 模型目录) 导出为 ONNX 并做动态 int8 量化，供 EMBEDDING_BACKEND=onnx 的纯 CPU 检索节点使用。
+# 导出机器需要 torch、transformers 与 onnxruntime；运行检索的节点只需要 onnxruntime 与 tokenizers。
+#
+# 用法:
+#   python scripts/export_onnx_encoder.py                                   # 默认读取 /data/sj/models/m3e-base，输出到 <模型目录>-onnx-int8
+#   python scripts/export_onnx_encoder.py --model-path ../models/m3e-base --out-dir ../models/m3e-base-onnx-int8
+#   导出后用 scripts/verify_onnx_encoder.py 检查与 PyTorch 向量的一致性以及延迟 / 内存
+import os
+import sys
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+from tools.onnx_encoder import FP32_MODEL_FILENAME, INT8_MODEL_FILENAME, export_quantized  # noqa: E402
+
+DEFAULT_MODEL_PATH = "/data/sj/models/m3e-base"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出动态 int8 量化的 ONNX 句向量编码器。")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH, help="sentence-transformers 模型目录。")
+    parser.add_argument("--out-dir", default=None, help="输出目录 (默认: <模型目录>-onnx-int8)。")
+    parser.add_argument("--opset", type=int, default=14, help="ONNX 算子集版本。")
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or args.model_path.rstrip(os.sep) + "-onnx-int8"
+    print(f"📦 正在导出: {args.model_path} -> {out_dir}")
+    start = time.perf_counter()
+    info = export_quantized(args.model_path, out_dir, opset=args.opset)
+    sizes = {name: os.path.getsize(os.path.join(out_dir, name)) / 1024 / 1024 for name in (FP32_MODEL_FILENAME, INT8_MODEL_FILENAME)}
+    print(f"✅ 导出完成 ({time.perf_counter() - start:.1f}s): 维度 {info['dim']}, 池化 {info['pooling']}, "
+          f"归一化 {info['normalize']}, 最大长度 {info['max_length']}")
+    print(f"   fp32: {sizes[FP32_MODEL_FILENAME]:.1f} MB  ->  int8: {sizes[INT8_MODEL_FILENAME]:.1f} MB")
+    print(f"   使用方法: EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_PATH={out_dir}")
@@ -0,0 +1,102 @@
+# scripts/import_time_report.py
+# 冷启动耗时报告：在全新的子进程中导入各入口模块，记录墙钟耗时，并用 `python -X importtime` 列出最耗时的依赖。
+# 用于跟踪自动扩缩容时新进程的启动时间。
+#
+# 用法:
+#   python scripts/import_time_report.py                       # 默认测量 config, tools.legal_tools, main, server
+#   python scripts/import_time_report.py --modules config main --top 15 --repeat 3
+#   python scripts/import_time_report.py --json .cache/import_time.json   # 同时写出 JSON，便于长期对比
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["config", "tools.legal_tools", "main", "server"]
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _run_import(module: str, importtime: bool):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", f"import {module}"]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, proc
+
+
+def _parse_importtime(stderr: str) -> list:
+    """解析 -X importtime 输出，返回 [(模块名, 累计微秒, 缩进层级)]。"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return entries
+
+
+def measure(module: str, repeat: int, top: int) -> dict:
+    """
+    测量单个模块的冷启动耗时。
+    :return: {"module", "ok", "wall_seconds" (多次中的最小值), "import_seconds", "heaviest": [[模块, 秒], ...], "error"}
+    """
+    walls = []
+    for _ in range(repeat):
+        wall, proc = _run_import(module, importtime=False)
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["未知错误"])[-1]
+            return {"module": module, "ok": False, "wall_seconds": round(wall, 3), "error": error}
+        walls.append(wall)
+
+    _, proc = _run_import(module, importtime=True)
+    entries = _parse_importtime(proc.stderr)
+    # -X importtime 按“子模块在前、父模块在后”输出；目标模块之前、缩进更深一层的条目即其直接依赖
+    target_index = max((i for i, entry in enumerate(entries) if entry[0] == module), default=None)
+    children = []
+    target_us = 0
+    if target_index is not None:
+        _, target_us, target_level = entries[target_index]
+        for name, cumulative, level in reversed(entries[:target_index]):
+            if level <= target_level:
+                break
+            if level == target_level + 1:
+                children.append((name, cumulative))
+    heaviest = sorted(children, key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "ok": True,
+        "wall_seconds": round(min(walls), 3),
+        "import_seconds": round(target_us / 1e6, 3),
+        "heaviest": [[name, round(us / 1e6, 3)] for name, us in heaviest],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="测量各入口模块的冷启动导入耗时。")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="要测量的模块。")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块的测量次数 (取最小值)。")
+    parser.add_argument("--top", type=int, default=10, help="列出最耗时的依赖数量。")
+    parser.add_argument("--json", dest="json_path", default=None, help="把报告写入 JSON 文件。")
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "modules": []}
+    print(f"--- 冷启动导入耗时报告 (Python {report['python']}, 每个模块测量 {args.repeat} 次) ---")
+    for module in args.modules:
+        result = measure(module, args.repeat, args.top)
+        report["modules"].append(result)
+        if not result["ok"]:
+            print(f"❌ {module}: 导入失败 ({result['wall_seconds']:.2f}s) - {result['error']}")
+            continue
+        print(f"✅ {module}: 进程启动+导入 {result['wall_seconds']:.2f}s (其中导入 {result['import_seconds']:.2f}s)")
+        for name, seconds in result["heaviest"]:
+            print(f"     {seconds:7.3f}s  {name}")
+
+    if args.json_path:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 报告已写入: {args.json_path}")
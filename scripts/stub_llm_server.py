@@ -0,0 +1,78 @@
+# scripts/stub_llm_server.py
+# 本地测试用的 Ollama 兼容 LLM 桩服务：对任何请求返回固定回复，用于在没有 GPU/模型的机器上联调 main.py 与 server.py。
+#
+# 用法:
+#   python scripts/stub_llm_server.py --port 11434
+#   LLM_BASE_URL=http://127.0.0.1:11434 python server.py
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Thought: 这是桩服务返回的固定回复。\nFinal Answer: 无需工具直接回答"
+
+
+def make_handler(reply: str, delay: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, payload: dict):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            # /api/tags: 部分客户端启动时会检查可用模型
+            self._send_json({"models": [{"name": "stub", "model": "stub"}]})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", "0") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            model = request.get("model", "stub")
+            stream = request.get("stream", True)
+            time.sleep(delay)
+            chat = self.path.startswith("/api/chat")
+
+            def frame(text: str, done: bool) -> dict:
+                body = {"model": model, "created_at": "1970-01-01T00:00:00Z", "done": done}
+                if chat:
+                    body["message"] = {"role": "assistant", "content": text}
+                else:
+                    body["response"] = text
+                if done:
+                    body.update({"done_reason": "stop", "prompt_eval_count": 1, "eval_count": len(reply)})
+                return body
+
+            if not stream:
+                return self._send_json(frame(reply, True))
+
+            # 流式：按 Ollama 的 NDJSON 格式逐字输出
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for ch in reply:
+                self.wfile.write((json.dumps(frame(ch, False), ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write((json.dumps(frame("", True), ensure_ascii=False) + "\n").encode("utf-8"))
+
+    return StubHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama 兼容的 LLM 桩服务。")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--reply", default=DEFAULT_REPLY, help="对所有请求返回的固定文本。")
+    parser.add_argument("--delay", type=float, default=0.0, help="每个请求的模拟延迟 (秒)。")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.reply, args.delay))
+    print(f"✅ LLM 桩服务已在 http://{args.host}:{args.port} 启动 (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,194 @@
+# scripts/verify_onnx_encoder.py
+# 验证 ONNX int8 编码器 (scripts/export_onnx_encoder.py 导出) 能否替代 PyTorch 编码器：
+#   1. 一致性：从现有 legal_db 抽样文本块，用 ONNX 重新编码，与库中 (建库时 PyTorch 计算的) 向量逐条比较余弦相似度，
+#      并比较两种向量在整库上检索 top-k 的重合率。
+#   2. 开销：在两个全新的子进程中分别只加载 PyTorch / ONNX 编码器，测量加载耗时、单条查询编码延迟与进程常驻内存 (RSS)。
+#
+# 用法:
+#   python scripts/verify_onnx_encoder.py
+#   python scripts/verify_onnx_encoder.py --onnx-dir /data/sj/models/m3e-base-onnx-int8 --samples 1000 --json .cache/onnx_verify.json
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_MODEL_PATH = "/data/sj/models/m3e-base"
+DEFAULT_DB_DIR = os.path.join(PROJECT_ROOT, "docs", "legal_db")
+# 延迟测试用的查询长度 (字符)：与用户提问的长度相当
+QUERY_CHARS = 80
+GET_PAGE_SIZE = 100
+
+
+def _rss_mb() -> float:
+    """当前进程常驻内存 (MB)，读取 /proc/self/status。"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def sample_collection(db_dir: str, samples: int, seed: int) -> tuple:
+    """从向量库随机抽取若干页，返回 (文本列表, 库中向量 float32 数组, collection)。"""
+    from langchain_community.vectorstores import Chroma
+    collection = Chroma(persist_directory=db_dir)._collection
+    total = collection.count()
+    if total == 0:
+        raise SystemExit(f"❌ 向量库 '{db_dir}' 为空。")
+    rng = np.random.default_rng(seed)
+    offsets = sorted(set(rng.integers(0, max(1, total - GET_PAGE_SIZE), size=max(1, samples // GET_PAGE_SIZE)).tolist()))
+    texts, vectors = [], []
+    for offset in offsets:
+        batch = collection.get(include=["documents", "embeddings"], limit=GET_PAGE_SIZE, offset=int(offset))
+        texts += batch["documents"]
+        vectors += list(batch["embeddings"])
+    return texts[:samples], np.asarray(vectors[:samples], dtype=np.float32), collection
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+
+
+def check_agreement(args) -> dict:
+    from tools.onnx_encoder import OnnxEmbeddings
+    texts, stored, collection = sample_collection(args.db_dir, args.samples, args.seed)
+    encoder = OnnxEmbeddings(args.onnx_dir, threads=args.threads, quantized=not args.fp32)
+    if encoder.dim != stored.shape[1]:
+        raise SystemExit(f"❌ 维度不一致: ONNX {encoder.dim} vs 向量库 {stored.shape[1]}")
+    start = time.perf_counter()
+    onnx_vectors = encoder.encode(texts)
+    encode_secs = time.perf_counter() - start
+    cosine = _cosine_rows(onnx_vectors, stored)
+
+    # 检索一致性：同一文本分别用库中向量 (PyTorch) 与 ONNX 向量在整库检索 top-k，比较结果集合的重合率
+    n_queries = min(args.retrieval_queries, len(texts))
+    torch_hits = collection.query(query_embeddings=stored[:n_queries].tolist(), n_results=args.k, include=[])["ids"]
+    onnx_hits = collection.query(query_embeddings=onnx_vectors[:n_queries].tolist(), n_results=args.k, include=[])["ids"]
+    overlap = [len(set(a) & set(b)) / max(1, len(a)) for a, b in zip(torch_hits, onnx_hits)]
+    top1 = [bool(a) and bool(b) and a[0] == b[0] for a, b in zip(torch_hits, onnx_hits)]
+    return {
+        "samples": len(texts),
+        "dim": encoder.dim,
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_p1": round(float(np.percentile(cosine, 1)), 5),
+        "retrieval_queries": n_queries,
+        f"overlap@{args.k}": round(float(np.mean(overlap)), 4),
+        "top1_agreement": round(float(np.mean(top1)), 4),
+        "batch_encode_docs_per_sec": round(len(texts) / encode_secs, 1),
+    }
+
+
+def measure_backend(backend: str, args, queries: list) -> dict:
+    """在当前 (全新) 进程中只加载一种编码器，测量加载耗时、单条查询延迟与 RSS。"""
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(args.threads or torch.get_num_threads())
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model_path, device="cpu")
+        encode = lambda text: model.encode([text], show_progress_bar=False)  # noqa: E731
+    else:
+        from tools.onnx_encoder import OnnxEmbeddings
+        encoder = OnnxEmbeddings(args.onnx_dir, threads=args.threads, quantized=not args.fp32)
+        encode = lambda text: encoder.encode([text])  # noqa: E731
+    load_secs = time.perf_counter() - start
+    rss_loaded = _rss_mb()
+    for text in queries[:3]:
+        encode(text)
+    latencies = []
+    for text in queries:
+        start = time.perf_counter()
+        encode(text)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "backend": backend,
+        "load_secs": round(load_secs, 2),
+        "rss_start_mb": round(rss_start, 1),
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "rss_after_mb": round(_rss_mb(), 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+    }
+
+
+def _measure_in_subprocess(backend: str, args, query_file: str) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--measure", backend, "--query-file", query_file,
+           "--model-path", args.model_path, "--onnx-dir", args.onnx_dir, "--threads", str(args.threads)]
+    if args.fp32:
+        cmd.append("--fp32")
+    proc = subprocess.run(cmd, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        error = (proc.stderr.strip().splitlines() or ["未知错误"])[-1]
+        return {"backend": backend, "error": error}
+    return json.loads(lines[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="验证 ONNX int8 编码器与 PyTorch 编码器的一致性与开销。")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH, help="原 sentence-transformers 模型目录。")
+    parser.add_argument("--onnx-dir", default=None, help="ONNX 模型目录 (默认: <模型目录>-onnx-int8)。")
+    parser.add_argument("--db-dir", default=DEFAULT_DB_DIR, help="用于比较的向量库 (其中向量由 PyTorch 编码器在建库时计算)。")
+    parser.add_argument("--samples", type=int, default=500, help="一致性检查抽样的文本块数。")
+    parser.add_argument("--retrieval-queries", type=int, default=100, help="检索一致性检查的查询数。")
+    parser.add_argument("--latency-queries", type=int, default=100, help="延迟测试的查询数。")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="计算线程数 (0 表示各后端默认值)。")
+    parser.add_argument("--fp32", action="store_true", help="验证未量化的 fp32 ONNX 模型。")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="把报告写入该 JSON 文件。")
+    # 内部参数：在子进程中测量单个后端
+    parser.add_argument("--measure", choices=["torch", "onnx"], default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--query-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.onnx_dir = args.onnx_dir or args.model_path.rstrip(os.sep) + "-onnx-int8"
+
+    if args.measure:
+        with open(args.query_file, "r", encoding="utf-8") as f:
+            print(json.dumps(measure_backend(args.measure, args, json.load(f)), ensure_ascii=False))
+        sys.exit(0)
+
+    print(f"🔍 一致性检查: {args.onnx_dir} vs {args.db_dir}")
+    report = {"agreement": check_agreement(args)}
+    for key, value in report["agreement"].items():
+        print(f"   {key}: {value}")
+
+    texts, _, _ = sample_collection(args.db_dir, args.latency_queries, args.seed + 1)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump([t.replace("\n", " ")[:QUERY_CHARS] for t in texts], f, ensure_ascii=False)
+        query_file = f.name
+    try:
+        print(f"⏱️ 单条查询延迟与内存 ({len(texts)} 条查询，每个后端在独立子进程中测量):")
+        report["latency"] = [_measure_in_subprocess(backend, args, query_file) for backend in ("torch", "onnx")]
+    finally:
+        os.remove(query_file)
+    for row in report["latency"]:
+        if "error" in row:
+            print(f"   {row['backend']:<6} ❌ {row['error']}")
+            continue
+        print(f"   {row['backend']:<6} 加载 {row['load_secs']:.2f}s | p50 {row['query_p50_ms']:.2f}ms p95 {row['query_p95_ms']:.2f}ms | "
+              f"RSS 加载后 {row['rss_loaded_mb']:.0f}MB, 编码后 {row['rss_after_mb']:.0f}MB")
+    torch_row, onnx_row = report["latency"]
+    if "error" not in torch_row and "error" not in onnx_row:
+        print(f"   ONNX / PyTorch: 延迟 p50 {onnx_row['query_p50_ms'] / torch_row['query_p50_ms']:.2f}x, "
+              f"RSS {onnx_row['rss_after_mb'] / torch_row['rss_after_mb']:.2f}x")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 报告已写入 {args.json}")
@@ -0,0 +1,364 @@
+# server.py
+# 异步 HTTP 服务入口：每个会话独立保存对话历史，工作流在线程池中执行，进程内共享嵌入模型与向量库。
+#
+# 接口:
+#   GET    /healthz                        -> 服务状态
+#   GET    /metrics                        -> Prometheus 文本格式的各阶段耗时与 token 指标 (需 TRACING_ENABLED=true)
+#   POST   /sessions                       -> 创建会话，返回 {"session_id": ...}
+#   POST   /sessions/{id}/messages         -> 发送消息 {"message": "..."}，返回 {"answer": ...}
+#                                             (超出时间预算而降级时附带 "degradations": [...])
+#                                             加上 ?stream=1 时以 chunked 纯文本逐块返回回复
+#                                             (降级记录放在 X-Degradations 尾部字段中)
+#   DELETE /sessions/{id}                  -> 删除会话
+import json
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import traceback
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit, parse_qs
+
+from config import (
+    print_config_summary,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_MAX_CONCURRENCY,
+    SERVER_QUEUE_TIMEOUT,
+    SERVER_SESSION_TTL,
+    SERVER_MAX_SESSIONS,
+    SERVER_SHUTDOWN_TIMEOUT,
+    WARMUP_ENABLED,
+    TRACING_ENABLED,
+)
+from main import execute_workflow
+from workflow.conversation_memory import ConversationMemory
+from tools.warmup import start_warmup, warmup_status, is_ready
+from tools.deadline import new_request_deadline
+from tools.tracing import render_metrics
+
+MAX_BODY_BYTES = 64 * 1024
+_REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Session:
+    """单个咨询会话：对话历史 + 对话记忆 (带预算的历史视图) + 串行化同一会话内请求的锁。"""
+    session_id: str
+    history: list = field(default_factory=list)
+    memory: ConversationMemory = field(default_factory=ConversationMemory)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_active: float = field(default_factory=time.time)
+
+
+class SessionStore:
+    """进程内会话存储，按空闲时间 (TTL) 和数量上限淘汰会话。"""
+
+    def __init__(self, ttl: float = SERVER_SESSION_TTL, max_sessions: int = SERVER_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self) -> Session:
+        self.expire()
+        if len(self._sessions) >= self.max_sessions:
+            # 淘汰最久未活跃且当前空闲的会话
+            idle = [s for s in self._sessions.values() if not s.lock.locked()]
+            if not idle:
+                raise HTTPError(503, "会话数量已达上限，请稍后再试。")
+            oldest = min(idle, key=lambda s: s.last_active)
+            del self._sessions[oldest.session_id]
+        session = Session(session_id=uuid.uuid4().hex)
+        self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None or (time.time() - session.last_active > self.ttl and not session.lock.locked()):
+            self._sessions.pop(session_id, None)
+            raise HTTPError(404, f"会话 '{session_id}' 不存在或已过期。")
+        return session
+
+    def delete(self, session_id: str):
+        if self._sessions.pop(session_id, None) is None:
+            raise HTTPError(404, f"会话 '{session_id}' 不存在。")
+
+    def expire(self):
+        now = time.time()
+        for sid in [sid for sid, s in self._sessions.items() if now - s.last_active > self.ttl and not s.lock.locked()]:
+            del self._sessions[sid]
+
+
+class LegalConsultationServer:
+    """基于 asyncio 的 HTTP 服务。工作流调用在线程池中执行，并发数受信号量限制。"""
+
+    def __init__(self, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                 workers: int = SERVER_WORKERS, max_concurrency: int = SERVER_MAX_CONCURRENCY):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.sessions = SessionStore()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workflow")
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._server = None
+        self._active_requests = set()
+        self._stopping = asyncio.Event()
+        self.ready = False
+
+    # --- 生命周期 ---
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if WARMUP_ENABLED:
+            # 嵌入模型与向量库在后台加载 (每个进程只加载一次)，服务立即开始监听；
+            # 预热完成前到达的工具调用会等待同一次加载完成，/healthz 在预热完成后才返回 200
+            start_warmup()
+        self.ready = True
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"✅ [服务] 已在 http://{self.host}:{self.port} 启动 (工作线程: {self.workers}, 最大并发: {self.max_concurrency})")
+
+    async def serve_forever(self):
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stopping.set)
+            except NotImplementedError:
+                pass  # Windows 不支持 add_signal_handler，依赖 KeyboardInterrupt
+        await self._stopping.wait()
+        await self.shutdown()
+
+    async def shutdown(self, timeout: float = SERVER_SHUTDOWN_TIMEOUT):
+        """优雅停机：停止接收新连接，等待进行中的请求完成 (最多 timeout 秒)，再关闭线程池。"""
+        print("\n--- [服务] 正在停止，不再接收新请求 ---")
+        self.ready = False
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._active_requests:
+            print(f"--- [服务] 等待 {len(self._active_requests)} 个进行中的请求完成 (最多 {timeout:.0f}s) ---")
+            _, pending = await asyncio.wait(self._active_requests, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        print("👋 [服务] 已停止。")
+
+    # --- 连接处理 ---
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._active_requests.add(task)
+        try:
+            try:
+                method, path, query, body = await self._read_request(reader)
+                await self._dispatch(method, path, query, body, writer)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {"error": e.message})
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            except Exception as e:
+                print(f"❌ [服务] 处理请求时发生未预期错误: {e}")
+                traceback.print_exc()
+                await self._send_json(writer, 500, {"error": "服务器内部错误。"})
+        finally:
+            self._active_requests.discard(task)
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, "无效的请求行。")
+        method, target, _ = parts
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "请求体过大。")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), body
+
+    async def _dispatch(self, method: str, path: str, query: dict, body: bytes, writer: asyncio.StreamWriter):
+        segments = [s for s in path.split("/") if s]
+        if segments == ["healthz"] and method == "GET":
+            warmup = warmup_status()
+            warmed = not WARMUP_ENABLED or is_ready()
+            if not self.ready:
+                state = "unavailable"
+            elif not warmed:
+                state = "warming_up"
+            else:
+                state = "degraded" if warmup["status"] == "degraded" else "ok"
+            return await self._send_json(writer, 200 if self.ready and warmed else 503, {
+                "status": state,
+                "warmup": warmup,
+                "sessions": len(self.sessions),
+                "active_requests": len(self._active_requests),
+            })
+        if segments == ["metrics"] and method == "GET":
+            if not TRACING_ENABLED:
+                raise HTTPError(404, "未开启追踪 (TRACING_ENABLED=false)，没有可导出的指标。")
+            return await self._send(writer, 200, render_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        if segments == ["sessions"] and method == "POST":
+            session = self.sessions.create()
+            return await self._send_json(writer, 201, {"session_id": session.session_id})
+        if len(segments) == 2 and segments[0] == "sessions" and method == "DELETE":
+            self.sessions.delete(segments[1])
+            return await self._send_json(writer, 200, {"deleted": segments[1]})
+        if len(segments) == 3 and segments[0] == "sessions" and segments[2] == "messages" and method == "POST":
+            stream = query.get("stream", ["0"])[0] in ("1", "true", "yes")
+            return await self._handle_message(self.sessions.get(segments[1]), body, stream, writer)
+        if segments and segments[0] in ("healthz", "metrics", "sessions"):
+            raise HTTPError(405, f"不支持的方法: {method}")
+        raise HTTPError(404, f"未找到路径: {path}")
+
+    async def _handle_message(self, session: Session, body: bytes, stream: bool, writer: asyncio.StreamWriter):
+        if self._stopping.is_set():
+            raise HTTPError(503, "服务正在停止。")
+        try:
+            payload = json.loads(body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HTTPError(400, "请求体必须是 JSON。")
+        user_input = str(payload.get("message", "")).strip()
+        if not user_input:
+            raise HTTPError(400, "字段 'message' 不能为空。")
+        if session.lock.locked():
+            raise HTTPError(409, "该会话上一条消息仍在处理中。")
+
+        # 端到端时间预算从请求到达时开始计算 (包含排队等待)
+        deadline = new_request_deadline()
+        async with session.lock:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=SERVER_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HTTPError(503, "服务繁忙，请稍后再试。")
+            try:
+                session.last_active = time.time()
+                history = session.history + [f"User: {user_input}"]
+                start = time.perf_counter()
+                if stream:
+                    answer = await self._run_streaming(user_input, history, session.memory, writer, deadline)
+                else:
+                    loop = asyncio.get_running_loop()
+                    answer = await loop.run_in_executor(
+                        self.executor, partial(execute_workflow, user_input, history, memory=session.memory, deadline=deadline))
+                    response = {
+                        "session_id": session.session_id,
+                        "answer": answer,
+                        "elapsed": round(time.perf_counter() - start, 3),
+                    }
+                    if deadline is not None and deadline.degradations:
+                        response["degradations"] = deadline.record()["degradations"]
+                    await self._send_json(writer, 200, response)
+                session.history = history + [f"AI: {answer}"]
+                session.last_active = time.time()
+            finally:
+                self._semaphore.release()
+
+    async def _run_streaming(self, user_input: str, history: list, memory: ConversationMemory,
+                             writer: asyncio.StreamWriter, deadline=None) -> str:
+        """
+        以 chunked 编码逐块返回回复：工作线程通过 on_token 回调把片段投递到事件循环的队列中。
+        工作流未产出任何片段就结束时 (例如出错)，把返回的整段回复作为唯一的块写出；
+        超出时间预算而降级时，降级记录以 JSON 形式放在 X-Degradations 尾部字段 (trailer) 中。
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def on_token(piece: str):
+            loop.call_soon_threadsafe(queue.put_nowait, piece)
+
+        future = loop.run_in_executor(self.executor, partial(execute_workflow, user_input, history, on_token, memory, deadline))
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, done))
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                     b"Transfer-Encoding: chunked\r\nTrailer: X-Degradations\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        written = False
+        while True:
+            piece = await queue.get()
+            if piece is done:
+                break
+            if piece:
+                await self._write_chunk(writer, piece)
+                written = True
+        try:
+            answer = await future
+        except Exception:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            raise
+        if not written and answer:
+            await self._write_chunk(writer, answer)
+        trailer = b""
+        if deadline is not None and deadline.degradations:
+            # 头部字段只能是 latin-1，JSON 中的中文按 \uXXXX 转义
+            trailer = f"X-Degradations: {json.dumps(deadline.record()['degradations'])}\r\n".encode("latin-1")
+        writer.write(b"0\r\n" + trailer + b"\r\n")
+        await writer.drain()
+        return answer
+
+    @staticmethod
+    async def _write_chunk(writer: asyncio.StreamWriter, piece: str):
+        data = piece.encode("utf-8")
+        writer.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, data: bytes, content_type: str):
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    @classmethod
+    async def _send_json(cls, writer: asyncio.StreamWriter, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await cls._send(writer, status, data, "application/json; charset=utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI 法律咨询助手 HTTP 服务。")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="执行工作流的线程数。")
+    parser.add_argument("--max-concurrency", type=int, default=SERVER_MAX_CONCURRENCY, help="同时执行的工作流数量上限。")
+    args = parser.parse_args()
+
+    print_config_summary()
+    server = LegalConsultationServer(args.host, args.port, args.workers, args.max_concurrency)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+# multi_agent/tools/ann_index.py
+
+import os
+import json
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from tools.mmap_store import MmapVectorStore
+
+ANN_FORMAT_VERSION = 1
+ANN_KINDS = ("hnsw", "ivfpq")
+# 建索引时每次从内存映射库读出 (并转换为 float32) 的行数
+BUILD_BLOCK_ROWS = 65536
+# IVF-PQ 训练时每个聚类中心对应的样本数
+TRAIN_POINTS_PER_CENTROID = 64
+
+# 各类索引的默认建索引参数；命令行 / 基准脚本可以逐项覆盖
+DEFAULT_BUILD_PARAMS = {
+    "hnsw": {"m": 32, "ef_construction": 200},
+    # nlist=0 表示按库大小自动选择 (约 4·√n)
+    "ivfpq": {"nlist": 0, "pq_m": 48, "nbits": 8},
+}
+# 默认查询参数 (在线服务时由 config.py 的 CASE_ANN_* 覆盖)；rerank>1 时取 k·rerank 个候选用原向量精确重排
+DEFAULT_SEARCH_PARAMS = {"ef_search": 64, "nprobe": 16, "rerank": 0}
+
+
+def load_faiss():
+    """faiss 为可选依赖，只在构建 / 加载 ANN 索引时导入。"""
+    try:
+        import faiss
+    except ImportError as e:
+        raise ImportError("ANN 索引需要 faiss，请先安装: pip install faiss-cpu") from e
+    return faiss
+
+
+def index_paths(ann_dir: str, name: str) -> Tuple[str, str]:
+    """索引文件与其说明文件的路径: <ann_dir>/<name>.faiss, <name>.json。"""
+    base = os.path.join(ann_dir, name)
+    return base + ".faiss", base + ".json"
+
+
+def auto_nlist(count: int) -> int:
+    """IVF 倒排桶数：约 4·√n，且保证每个桶至少有 39 条训练样本 (faiss 的最低要求)。"""
+    return int(max(1, min(4 * np.sqrt(max(count, 1)), count // 39 or 1)))
+
+
+def resolve_build_params(kind: str, count: int, dim: int, **overrides) -> dict:
+    """合并默认参数与覆盖项，并校验 (如 PQ 子空间数必须整除维度)。"""
+    if kind not in ANN_KINDS:
+        raise ValueError(f"不支持的 ANN 索引类型: {kind} (可选: {', '.join(ANN_KINDS)})")
+    params = dict(DEFAULT_BUILD_PARAMS[kind])
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    if kind == "ivfpq":
+        if not params["nlist"]:
+            params["nlist"] = auto_nlist(count)
+        if dim % params["pq_m"]:
+            raise ValueError(f"PQ 子空间数 pq_m={params['pq_m']} 必须整除向量维度 {dim}")
+    return params
+
+
+def build_index(store: MmapVectorStore, kind: str, params: dict, seed: int = 0):
+    """
+    在内存映射库的归一化向量上构建 faiss 索引 (内积度量，即余弦相似度)。行号即内存映射库的行号。
+    :return: faiss 索引对象。
+    """
+    faiss = load_faiss()
+    count, dim = len(store), store.vectors.shape[1]
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["nbits"], faiss.METRIC_INNER_PRODUCT)
+        # 训练样本：随机抽取、按行号排序后读取；粗量化与 PQ 码本都需要每个中心数十条样本
+        train_size = min(count, max(params["nlist"], 1 << params["nbits"]) * TRAIN_POINTS_PER_CENTROID)
+        sample = np.sort(np.random.default_rng(seed).choice(count, size=train_size, replace=False))
+        index.train(store.take_rows(sample))
+    for start in range(0, count, BUILD_BLOCK_ROWS):
+        index.add(np.ascontiguousarray(store.float_rows(start, start + BUILD_BLOCK_ROWS)))
+    return index
+
+
+def search_parameters(kind: str, ef_search: int = None, nprobe: int = None):
+    """单次查询的 faiss 参数对象 (不修改索引本身，多线程并发查询互不影响)。"""
+    faiss = load_faiss()
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search or DEFAULT_SEARCH_PARAMS["ef_search"]))
+    return faiss.SearchParametersIVF(nprobe=int(nprobe or DEFAULT_SEARCH_PARAMS["nprobe"]))
+
+
+def build_and_save(mmap_dir: str, ann_dir: str, kind: str, name: str = None, **overrides) -> dict:
+    """
+    为内存映射库构建 ANN 索引并保存到 ann_dir (与内存映射库目录并列，重新导出时不会被一并删除)。
+    :return: 说明信息 (索引类型、参数、条数、建索引耗时、索引大小等)，同时写入 <name>.json。
+    """
+    faiss = load_faiss()
+    store = MmapVectorStore(mmap_dir, embedding_function=None)
+    try:
+        params = resolve_build_params(kind, len(store), store.vectors.shape[1], **overrides)
+        start = time.perf_counter()
+        index = build_index(store, kind, params)
+        build_secs = time.perf_counter() - start
+        index_path, info_path = index_paths(ann_dir, name or kind)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        faiss.write_index(index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        info = {
+            "version": ANN_FORMAT_VERSION,
+            "kind": kind,
+            "params": params,
+            "count": len(store),
+            "dim": store.vectors.shape[1],
+            "build_secs": round(build_secs, 3),
+            "index_bytes": os.path.getsize(index_path),
+            "export_id": store.header.get("export_id", ""),
+        }
+        with open(info_path, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        return info
+    finally:
+        store.close()
+
+
+class AnnVectorStore(MmapVectorStore):
+    """
+    内存映射库 + faiss ANN 索引。文本与元数据仍从内存映射库按行号读取，接口与 MmapVectorStore / Chroma 一致。
+    查询参数可以逐次调用覆盖 (ef_search / nprobe / rerank)，未指定时使用构造时给定的默认值。
+    """
+
+    def __init__(self, directory: str, embedding_function, ann_dir: str, name: str = "hnsw", search_params: dict = None):
+        super().__init__(directory, embedding_function)
+        index_path, info_path = index_paths(ann_dir, name)
+        with open(info_path, "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        if self.info.get("version") != ANN_FORMAT_VERSION:
+            raise ValueError(f"ANN 索引版本不匹配 (文件: {self.info.get('version')}, 期望: {ANN_FORMAT_VERSION})，请重新构建。")
+        if self.info.get("count") != len(self) or self.info.get("export_id") != self.header.get("export_id"):
+            raise ValueError("ANN 索引与当前内存映射库不对应 (内存映射库已重新导出)，请重新运行 --build-ann。")
+        self.kind = self.info["kind"]
+        self.index = load_faiss().read_index(index_path)
+        self.search_params = {**DEFAULT_SEARCH_PARAMS, **(search_params or {})}
+
+    def search_by_vectors(self, vectors, k: int, ef_search: int = None, nprobe: int = None,
+                          rerank: int = None) -> List[List[Tuple[int, float]]]:
+        """按余弦相似度 (近似) 返回每条查询的 [(行号, 分数)]，降序。多条查询在一次 faiss 调用中完成。"""
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.vectors.shape[1])
+        if len(self) == 0 or k <= 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        ef_search = ef_search or self.search_params["ef_search"]
+        nprobe = nprobe or self.search_params["nprobe"]
+        rerank = self.search_params["rerank"] if rerank is None else rerank
+        queries = np.ascontiguousarray(queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12))
+        fetch = min(len(self), k * rerank if rerank and rerank > 1 else k)
+        # HNSW 的候选列表不能小于要返回的条数
+        params = search_parameters(self.kind, max(ef_search, fetch), nprobe)
+        scores, rows = self.index.search(queries, fetch, params=params)
+        results = []
+        for query, row_ids, row_scores in zip(queries, rows, scores):
+            hits = [(int(i), float(s)) for i, s in zip(row_ids, row_scores) if i >= 0]
+            if fetch > k and hits:
+                # PQ 距离是近似值：用内存映射库中的原向量重新计算候选的精确分数
+                candidates = sorted(i for i, _ in hits)
+                exact = self.take_rows(candidates) @ query
+                hits = sorted(zip(candidates, exact.tolist()), key=lambda hit: -hit[1])
+            results.append(hits[:k])
+        return results
+
+    def search_by_vector(self, vector, k: int, **search_params) -> List[Tuple[int, float]]:
+        return self.search_by_vectors([vector], k, **search_params)[0]
+
+    def similarity_search_by_vectors(self, vectors, k: int = 4, **search_params):
+        return [[(self._document(i), score) for i, score in hits]
+                for hits in self.search_by_vectors(vectors, k, **search_params)]
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4, **search_params):
+        vector = self.embedding_function.embed_query(query)
+        return [(self._document(i), score) for i, score in self.search_by_vector(vector, k, **search_params)]
+
+    def similarity_search(self, query: str, k: int = 4, **search_params):
+        return [doc for doc, _ in self.similarity_search_with_relevance_scores(query, k, **search_params)]
@@ -0,0 +1,204 @@
+# multi_agent/tools/batch_retrieval.py
+
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from tools.lexical_index import content_key, is_keyword_query, reciprocal_rank_fusion
+from tools.statute_index import format_location
+from tools.tracing import span
+
+# 与 LangChain Chroma 的 MMR 默认值一致
+MMR_LAMBDA = 0.5
+
+
+class VectorStoreUnavailable(RuntimeError):
+    """需要向量检索，但嵌入模型或向量库不可用。"""
+
+
+@dataclass
+class ArticleHits:
+    """单条查询的法条检索结果。source: article_table / lexical / hybrid / dense / none。"""
+    query: str
+    source: str = "none"
+    results: List[Tuple[str, dict]] = field(default_factory=list)
+    records: List[dict] = field(default_factory=list)     # 条文查找表命中的原始记录
+    missing: List[tuple] = field(default_factory=list)    # 查找表中未收录的引用
+
+
+def embed_many(embeddings, texts: List[str]) -> List[List[float]]:
+    """一次前向计算编码多条查询；共享嵌入服务 (EmbeddingService) 还会去重并使用查询缓存。"""
+    if not texts:
+        return []
+    batch = getattr(embeddings, "embed_queries", None)
+    return batch(texts) if batch is not None else embeddings.embed_documents(texts)
+
+
+def chroma_query_by_vectors(store, vectors, n: int, with_embeddings: bool = False) -> List[List[dict]]:
+    """
+    一次 collection.query 完成多条查询向量的检索 (Chroma 在同一次调用中遍历索引)。
+    :return: 每条查询的候选 [{"text", "metadata", "distance", "embedding"}]，按距离升序。
+    """
+    include = ["documents", "metadatas", "distances"] + (["embeddings"] if with_embeddings else [])
+    with span("chroma", "vector_search", queries=len(vectors), n=n):
+        result = store._collection.query(query_embeddings=[list(v) for v in vectors], n_results=n, include=include)
+    per_query = []
+    for i in range(len(vectors)):
+        documents = (result.get("documents") or [[]])[i] or []
+        metadatas = (result.get("metadatas") or [[]])[i] or [{} for _ in documents]
+        distances = (result.get("distances") or [[]])[i] or [0.0 for _ in documents]
+        vectors_i = result["embeddings"][i] if with_embeddings else [None] * len(documents)
+        per_query.append([
+            {"text": text, "metadata": metadata or {}, "distance": distance, "embedding": embedding}
+            for text, metadata, distance, embedding in zip(documents, metadatas, distances, vectors_i)
+        ])
+    return per_query
+
+
+def mmr_search_many(store, vectors, k: int, fetch_k: int, lambda_mult: float = MMR_LAMBDA) -> List[List[Tuple[str, dict]]]:
+    """多条查询的 MMR 检索：候选一次取回，MMR 重排在本地逐条完成 (与 Chroma.max_marginal_relevance_search 等价)。"""
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+    results = []
+    for vector, candidates in zip(vectors, chroma_query_by_vectors(store, vectors, fetch_k, with_embeddings=True)):
+        if not candidates:
+            results.append([])
+            continue
+        picked = maximal_marginal_relevance(
+            np.asarray(vector, dtype=np.float32), [c["embedding"] for c in candidates], k=min(k, len(candidates)), lambda_mult=lambda_mult
+        )
+        results.append([(candidates[i]["text"], candidates[i]["metadata"]) for i in picked])
+    return results
+
+
+def search_articles_many(queries: List[str], load_dense: Callable[[], tuple],
+                         lexical=None, article_table=None, k: int = 3, fetch_k: int = 10, mode: str = "hybrid",
+                         rrf_k: int = 60, keyword_max_chars: int = 12) -> List[ArticleHits]:
+    """
+    LAS 的多查询版本，每条查询的检索路径与单条调用相同：
+    明确的条文引用直接查表；关键词式查询 (或 lexical 模式) 只走 BM25；其余查询一起编码、一起做向量检索，再与 BM25 结果 RRF 融合。
+    :param load_dense: 返回 (嵌入模型, 法条向量库) 的函数，只有存在需要向量检索的查询时才调用 (延迟加载)。
+    :return: 与 queries 顺序一致的 ArticleHits 列表。
+    """
+    hits = [ArticleHits(query) for query in queries]
+    dense_pending = []
+    for item in hits:
+        if article_table is not None:
+            found, missing = article_table.lookup(item.query)
+            if found:
+                item.source, item.records, item.missing = "article_table", found, missing
+                item.results = [(record["text"], {"location": format_location(record)}) for record in found]
+                continue
+        if lexical is not None and (mode == "lexical" or is_keyword_query(item.query, keyword_max_chars)):
+            with span("bm25", "lexical_search", k=k):
+                lexical_hits = lexical.search(item.query, k)
+            if lexical_hits:
+                item.source = "lexical"
+                item.results = [(doc["text"], doc["metadata"]) for doc, _ in lexical_hits]
+                continue
+            if mode == "lexical":
+                continue
+        dense_pending.append(item)
+
+    if not dense_pending:
+        return hits
+    embeddings, vector_store = load_dense()
+    if embeddings is None or vector_store is None:
+        raise VectorStoreUnavailable("无法访问本地法律知识库。")
+
+    # 融合时向量检索多取一些候选，给 RRF 留出排序空间
+    dense_k = max(k, min(fetch_k, 2 * k)) if lexical is not None else k
+    vectors = embed_many(embeddings, [item.query for item in dense_pending])
+    dense_lists = mmr_search_many(vector_store, vectors, dense_k, max(fetch_k, dense_k))
+    for item, dense_results in zip(dense_pending, dense_lists):
+        if lexical is None:
+            item.source, item.results = "dense", dense_results[:k]
+            continue
+        with span("bm25", "lexical_search", k=max(k, fetch_k)):
+            lexical_results = [(doc["text"], doc["metadata"]) for doc, _ in lexical.search(item.query, max(k, fetch_k))]
+        by_key, ranked_lists = {}, []
+        for candidates in (dense_results, lexical_results):
+            keys = []
+            for text, metadata in candidates:
+                key = content_key(text)
+                by_key.setdefault(key, (text, metadata))
+                keys.append(key)
+            ranked_lists.append(keys)
+        item.source = "hybrid"
+        item.results = [by_key[key] for key in reciprocal_rank_fusion(ranked_lists, rrf_k)[:k]]
+    for item in hits:
+        if not item.results:
+            item.source = "none"
+    return hits
+
+
+def case_search_by_vectors(store, vectors, n: int) -> List[list]:
+    """
+    多条查询向量的案例检索，返回每条查询的 [(文档, 相关性分数)]。
+    内存映射库 / ANN 索引自带批量接口；Chroma 用一次 collection.query，分数换算与 similarity_search_with_relevance_scores 一致。
+    """
+    batch = getattr(store, "similarity_search_by_vectors", None)
+    if batch is not None:
+        with span(type(store).__name__, "vector_search", queries=len(vectors), n=n):
+            return batch(vectors, n)
+    from langchain_core.documents import Document
+    relevance = store._select_relevance_score_fn()
+    return [
+        [(Document(page_content=c["text"], metadata=c["metadata"]), relevance(c["distance"])) for c in candidates]
+        for candidates in chroma_query_by_vectors(store, vectors, n)
+    ]
+
+
+def dedupe_cases(candidates: list, k: int) -> list:
+    """同一案例可能被切成多个文本块，旧版案例库中还可能有重复文书：按 doc_id / 内容去重后取前 k 个。"""
+    results, seen = [], set()
+    for doc, score in candidates:
+        keys = {doc.metadata.get('doc_id'), content_key(doc.page_content)} - {None}
+        if keys & seen:
+            continue
+        seen |= keys
+        results.append((doc, score))
+        if len(results) >= k:
+            break
+    return results
+
+
+def search_cases_many(queries: List[str], embeddings, store, k: int = 3, overfetch: int = 4) -> List[list]:
+    """SCM 的多查询版本：全部查询一次编码、一起检索，每条查询各自按案例去重后取前 k 个。"""
+    if not queries:
+        return []
+    vectors = embed_many(embeddings, queries)
+    return [dedupe_cases(candidates, k) for candidates in case_search_by_vectors(store, vectors, k * overfetch)]
+
+
+def merge_across_queries(per_query: List[list], key_fn: Callable) -> List[Tuple[object, List[int]]]:
+    """
+    合并多条查询的结果，跨查询去重：同一结果只保留一次，并记录命中它的查询序号。
+    按名次交错排列 (各查询的第 1 名、再各查询的第 2 名……)，每条查询的最佳结果都排在前面。
+    :return: [(结果, [查询下标, ...])]
+    """
+    merged, position = [], {}
+    depth = max((len(items) for items in per_query), default=0)
+    for rank in range(depth):
+        for query_index, items in enumerate(per_query):
+            if rank >= len(items):
+                continue
+            key = key_fn(items[rank])
+            if key in position:
+                matched = merged[position[key]][1]
+                if query_index not in matched:
+                    matched.append(query_index)
+                continue
+            position[key] = len(merged)
+            merged.append((items[rank], [query_index]))
+    return merged
+
+
+def case_key(hit) -> Optional[str]:
+    """跨查询去重用的案例键：优先使用规范案例 ID，旧版库退回内容键。"""
+    doc = hit[0]
+    return doc.metadata.get('doc_id') or content_key(doc.page_content)
+
+
+def article_key_of(hit) -> str:
+    return content_key(hit[0])
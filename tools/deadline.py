@@ -0,0 +1,168 @@
+# multi_agent/tools/deadline.py
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+from config import (
+    REQUEST_DEADLINE_SECONDS,
+    DEADLINE_SYNTHESIS_RESERVE,
+    DEADLINE_LOW_WATERMARK,
+    DEADLINE_OPTIONAL_TOOLS,
+    DEADLINE_LOW_K,
+    DEADLINE_LOW_FETCH_K,
+)
+
+# 带截止时间的阻塞调用 (如 llm.invoke) 在该线程池中执行；超时后调用方立即返回，调用本身在后台结束
+_CALL_WORKERS = 16
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的时间预算已用完。"""
+
+
+@dataclass
+class Degradation:
+    """一次降级：在哪一步 (step)、做了什么 (action)、当时剩余多少秒。"""
+    step: str
+    action: str
+    remaining: float
+
+
+class RequestDeadline:
+    """
+    单次请求的端到端时间预算。在 execute_workflow 中创建并放入上下文变量，工作流、工具与 LLM 调用通过 current_deadline() 读取。
+    预算分为两段：最后 synthesis_reserve 秒留给回复整合，之前的时间供协调员决策与工具使用；
+    剩余时间低于 low_watermark 时进入“紧张”状态，可选工具被跳过、检索数量减少。所有降级都记录在 degradations 中。
+    """
+
+    def __init__(self, budget: float, synthesis_reserve: float = DEADLINE_SYNTHESIS_RESERVE,
+                 low_watermark: float = DEADLINE_LOW_WATERMARK):
+        self.budget = budget
+        self.synthesis_reserve = min(synthesis_reserve, budget)
+        self.low_watermark = max(low_watermark, self.synthesis_reserve)
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget
+        self.degradations: List[Degradation] = []
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        """距离截止还有多少秒 (可能为负)。"""
+        return self.expires_at - time.monotonic()
+
+    def tool_time_left(self) -> float:
+        """工具与中间 LLM 调用还能使用的秒数 (扣除回复整合的预留时间)。"""
+        return self.remaining() - self.synthesis_reserve
+
+    def is_low(self) -> bool:
+        return self.remaining() < self.low_watermark
+
+    def exhausted(self) -> bool:
+        """工具阶段的预算已用完，只剩回复整合的时间。"""
+        return self.tool_time_left() <= 0
+
+    def degrade(self, step: str, action: str):
+        item = Degradation(step, action, round(self.remaining(), 2))
+        with self._lock:
+            self.degradations.append(item)
+        print(f"📉 [时间预算] {step}: {action} (剩余 {item.remaining:.1f}s)")
+
+    def record(self) -> dict:
+        """本次请求的预算使用情况与降级记录。"""
+        with self._lock:
+            degradations = [asdict(d) for d in self.degradations]
+        return {
+            "budget": self.budget,
+            "elapsed": round(self.elapsed(), 3),
+            "remaining": round(self.remaining(), 3),
+            "degradations": degradations,
+        }
+
+
+_current_deadline = contextvars.ContextVar("request_deadline", default=None)
+_call_pool = ThreadPoolExecutor(max_workers=_CALL_WORKERS, thread_name_prefix="deadline-call")
+
+
+def new_request_deadline(budget: float = REQUEST_DEADLINE_SECONDS) -> Optional[RequestDeadline]:
+    """按配置创建一次请求的截止时间；预算为 0 (不限制) 时返回 None。"""
+    return RequestDeadline(budget) if budget and budget > 0 else None
+
+
+def current_deadline() -> Optional[RequestDeadline]:
+    """当前请求的截止时间；不在请求上下文中 (或未设置预算) 时返回 None。"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[RequestDeadline]):
+    """在 with 块内把 deadline 设为当前请求的截止时间。"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def submit_with_context(pool, fn, *args, **kwargs):
+    """向线程池提交任务并带上当前上下文 (线程池默认不传递上下文变量)，使工作线程中也能读取截止时间。"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def clamp_timeout(timeout: float) -> float:
+    """把超时秒数限制在工具阶段剩余的预算内。"""
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    return max(0.0, min(timeout, deadline.tool_time_left()))
+
+
+def call_with_deadline(step: str, fn, *args, **kwargs):
+    """
+    在工具阶段剩余的预算内执行阻塞调用 (例如 llm.invoke)，超时抛出 DeadlineExceeded。
+    没有截止时间时直接在当前线程调用。
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return fn(*args, **kwargs)
+    if deadline.exhausted():
+        deadline.degrade(step, "时间预算不足，未发起调用")
+        raise DeadlineExceeded(f"{step}: 时间预算不足")
+    future = submit_with_context(_call_pool, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=max(0.0, deadline.tool_time_left()))
+    except FutureTimeoutError:
+        deadline.degrade(step, "调用超出时间预算，放弃等待")
+        raise DeadlineExceeded(f"{step}: 调用超出时间预算")
+
+
+def should_skip_tool(tool: str) -> bool:
+    """时间紧张时跳过可选工具 (DEADLINE_OPTIONAL_TOOLS，默认 WEB / SCM)；工具阶段预算用完时跳过所有工具。返回是否跳过。"""
+    deadline = current_deadline()
+    if deadline is None:
+        return False
+    if deadline.exhausted():
+        deadline.degrade(tool, "时间预算不足，跳过工具")
+        return True
+    if tool in DEADLINE_OPTIONAL_TOOLS and deadline.is_low():
+        deadline.degrade(tool, "时间紧张，跳过可选工具")
+        return True
+    return False
+
+
+def budgeted_k(tool: str, k: int, fetch_k: int = None) -> tuple:
+    """时间紧张时减少检索数量，返回 (k, fetch_k)。"""
+    deadline = current_deadline()
+    if deadline is None or not deadline.is_low():
+        return k, fetch_k
+    new_k = min(k, DEADLINE_LOW_K)
+    new_fetch_k = min(fetch_k, DEADLINE_LOW_FETCH_K) if fetch_k is not None else None
+    if (new_k, new_fetch_k) != (k, fetch_k):
+        deadline.degrade(tool, f"时间紧张，检索数量 k={k}->{new_k}" + (f", fetch_k={fetch_k}->{new_fetch_k}" if fetch_k is not None else ""))
+    return new_k, new_fetch_k
@@ -0,0 +1,90 @@
+# multi_agent/tools/embedding_service.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from tools.tracing import span
+
+# 查询向量缓存的默认容量 (条)
+QUERY_CACHE_SIZE = 2048
+
+
+class EmbeddingService(Embeddings):
+    """
+    包装底层嵌入模型的共享嵌入服务。
+    - embed_query: 查询向量带 LRU 缓存，同一轮中 LCP/LAS/SCM 对相同文本的重复编码只计算一次。
+    - embed_queries: 批量接口，去重后对未命中的查询做一次批量前向计算。
+    - embed_documents: 文档向量 (建库时使用) 直接透传，不进入查询缓存。
+    可直接作为 Chroma 的 embedding_function 使用。
+    """
+
+    def __init__(self, base: Embeddings, max_entries: int = QUERY_CACHE_SIZE):
+        self.base = base
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text: str) -> str:
+        # 近似相同的文本 (仅空白不同) 视为同一查询
+        return re.sub(r"\s+", " ", text or "").strip()
+
+    def _get(self, key: str):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return vector
+
+    def _put(self, key: str, vector: List[float]):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量编码查询文本：去重、查缓存，对未命中的文本做一次批量编码。
+        :param texts: 查询文本列表。
+        :return: 与输入顺序一致的向量列表。
+        """
+        keys = [self._key(t) for t in texts]
+        found = {}
+        pending = []
+        for key in keys:
+            if key in found or key in pending:
+                continue
+            vector = self._get(key)
+            if vector is not None:
+                found[key] = vector
+            else:
+                pending.append(key)
+
+        if pending:
+            with self._lock:
+                self.misses += len(pending)
+            with span("encode", "embedding", texts=len(pending), cache_hits=len(found)):
+                vectors = self.base.embed_documents(pending)
+            for key, vector in zip(pending, vectors):
+                vector = list(vector)
+                self._put(key, vector)
+                found[key] = vector
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
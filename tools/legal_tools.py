@@ -1,45 +1,108 @@
 # multi_agent/tools/legal_tools.py
 
 import os
-import torch
+import threading
 import traceback
 from langchain_core.messages import HumanMessage, SystemMessage
-# 关键：让工具直接使用共享的 llm 实例，并使用 @tool 装饰器
-from config import llm 
+# 关键：工具通过带缓存的 cached_llm_invoke 使用共享的 llm 实例，并使用 @tool 装饰器
 from crewai.tools import tool
-
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from duckduckgo_search import DDGS
+from tools.llm_cache import cached_llm_invoke
+from tools.embedding_service import EmbeddingService
+from tools.lexical_index import LexicalIndex
+from tools.batch_retrieval import (
+    VectorStoreUnavailable, search_articles_many, search_cases_many, dedupe_cases, merge_across_queries, case_key, article_key_of
+)
+from tools.deadline import should_skip_tool, budgeted_k
+from tools.tracing import span, traced_tool
+from tools.statute_index import ArticleTable, ARTICLE_TABLE_FILENAME, article_label, format_location
+from config import LAS_RETRIEVAL_MODE, LAS_RRF_K, LAS_KEYWORD_MAX_CHARS
+from config import CASE_STORE_BACKEND, CASE_ANN_INDEX, CASE_ANN_EF_SEARCH, CASE_ANN_NPROBE
+from config import EMBEDDING_BACKEND, EMBEDDING_ONNX_PATH, EMBEDDING_ONNX_THREADS
+from config import (
+    WEB_SEARCH_BACKEND, WEB_SEARCH_LOCAL_PATH, WEB_SEARCH_DEADLINE, WEB_SEARCH_MAX_RESULTS, WEB_SEARCH_MAX_WORKERS,
+    WEB_CACHE_ENABLED, WEB_CACHE_PATH, WEB_CACHE_TTL_SECONDS, WEB_CACHE_MAX_STALE_SECONDS,
+)
+# torch / Chroma / SentenceTransformerEmbeddings / DDGS 导入耗时较长，在首次使用对应工具时才导入
 
 # --- 路径和初始化函数部分 (保持不变) ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 EMBEDDING_MODEL_PATH = "/data/sj/models/m3e-base"
+# EMBEDDING_BACKEND=onnx 时加载的量化模型目录，由 scripts/export_onnx_encoder.py 生成
+EMBEDDING_ONNX_DIR = EMBEDDING_ONNX_PATH or EMBEDDING_MODEL_PATH.rstrip(os.sep) + "-onnx-int8"
 LEGAL_DB_PATH = os.path.join(project_root, "docs", "legal_db")
 CASE_DB_PATH = os.path.join(project_root, "docs", "case_db")
+# 案例库的内存映射导出 (CASE_STORE_BACKEND=mmap / ann 时使用)，由 docs/index_legal_docs.py --type case --export-mmap 生成
+CASE_MMAP_PATH = os.path.join(CASE_DB_PATH, "mmap")
+# 基于内存映射库构建的 faiss ANN 索引 (CASE_STORE_BACKEND=ann 时使用)，由 --build-ann 生成
+CASE_ANN_PATH = os.path.join(CASE_DB_PATH, "ann")
+CASE_MANIFEST_PATH = os.path.join(CASE_DB_PATH, "index_manifest.json")
+# 法条词法 (BM25) 索引，由 docs/index_legal_docs.py 建库时生成
+LEGAL_LEXICAL_INDEX_PATH = os.path.join(LEGAL_DB_PATH, "lexical_index.npz")
+# (法律, 条号) -> 条文 查找表，由建库脚本在 --split-mode article 下生成
+ARTICLE_TABLE_PATH = os.path.join(LEGAL_DB_PATH, ARTICLE_TABLE_FILENAME)
+# SCM 按案例去重前的候选倍数
+SCM_OVERFETCH = 4
+
+# LLM 类工具的提示词模板版本，修改对应模板后请递增，以使 LLM 结果缓存中的旧条目失效
+PROMPT_VERSIONS = {
+    "LCP": "v1",
+    "LER": "v1",
+    "LED": "v1",
+    "LTS": "v1",
+}
 
 embeddings = None
 legal_vector_store = None
 case_vector_store = None
+legal_lexical_index = None
+_legal_lexical_checked = False
+article_table = None
+_article_table_checked = False
+web_search_service = None
+
+# 初始化锁：多个线程 (并发分支、服务的工作线程、后台预热) 同时首次调用时，模型与向量库只加载一次。
+# 采用双重检查：已初始化时不加锁，直接返回。
+_embeddings_lock = threading.Lock()
+_legal_store_lock = threading.Lock()
+_case_store_lock = threading.Lock()
+_legal_lexical_lock = threading.Lock()
+_article_table_lock = threading.Lock()
+_web_search_lock = threading.Lock()
 
 def _initialize_embeddings():
     """如果嵌入模型尚未初始化，则进行初始化并设为全局变量。"""
     global embeddings
-    if embeddings is None:
+    if embeddings is not None:
+        return
+    with _embeddings_lock:
+        if embeddings is not None:
+            return
+        if EMBEDDING_BACKEND == "onnx":
+            try:
+                # 量化 ONNX 编码器只依赖 onnxruntime / tokenizers，不导入 torch
+                from tools.onnx_encoder import OnnxEmbeddings
+                embeddings = EmbeddingService(OnnxEmbeddings(EMBEDDING_ONNX_DIR, threads=EMBEDDING_ONNX_THREADS))
+                print(f"--- [RAG 初始化] ONNX int8 嵌入模型加载成功: {EMBEDDING_ONNX_DIR} ---")
+                return
+            except Exception as e:
+                print(f"⚠️ [RAG 初始化] 加载 ONNX 嵌入模型失败 ({e})，回退到 PyTorch 编码器。")
         print(f"--- [RAG 初始化] 首次加载嵌入模型: {EMBEDDING_MODEL_PATH} ---")
         if not os.path.exists(EMBEDDING_MODEL_PATH):
             print(f"⚠️ 警告：在 '{EMBEDDING_MODEL_PATH}' 未找到嵌入模型。RAG 工具将不可用。")
             return
         
+        import torch
+        from langchain_community.embeddings import SentenceTransformerEmbeddings
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"--- [RAG 初始化] 自动检测到可用设备: {device.upper()} ---")
 
         try:
-            embeddings = SentenceTransformerEmbeddings(
+            # 用共享嵌入服务包装底层模型：LCP/LAS/SCM 对相同查询的编码只计算一次
+            embeddings = EmbeddingService(SentenceTransformerEmbeddings(
                 model_name=EMBEDDING_MODEL_PATH,
                 model_kwargs={'device': device}
-            )
+            ))
         except Exception as e:
             print(f"❌ [RAG 初始化] 加载嵌入模型时出错: {e}")
             embeddings = None
@@ -47,10 +110,15 @@ def _initialize_embeddings():
 def _initialize_legal_rag():
     """初始化法条 RAG 组件。"""
     global legal_vector_store
-    if legal_vector_store is None:
-        _initialize_embeddings()
+    if legal_vector_store is not None:
+        return
+    _initialize_embeddings()
+    with _legal_store_lock:
+        if legal_vector_store is not None:
+            return
         if embeddings is None or not os.path.exists(LEGAL_DB_PATH): return
         try:
+            from langchain_community.vectorstores import Chroma
             legal_vector_store = Chroma(persist_directory=LEGAL_DB_PATH, embedding_function=embeddings)
             print("--- [RAG 初始化] 法条向量存储加载成功 ---")
         except Exception as e:
@@ -59,32 +127,118 @@ def _initialize_legal_rag():
 def _initialize_case_rag():
     """初始化案例 RAG 组件。"""
     global case_vector_store
-    if case_vector_store is None:
-        _initialize_embeddings()
+    if case_vector_store is not None:
+        return
+    _initialize_embeddings()
+    with _case_store_lock:
+        if case_vector_store is not None:
+            return
         if embeddings is None or not os.path.exists(CASE_DB_PATH): return
+        if CASE_STORE_BACKEND in ("mmap", "ann"):
+            if os.path.exists(CASE_MMAP_PATH):
+                try:
+                    if CASE_STORE_BACKEND == "ann":
+                        from tools.ann_index import AnnVectorStore
+                        case_vector_store = AnnVectorStore(
+                            CASE_MMAP_PATH, embeddings, CASE_ANN_PATH, name=CASE_ANN_INDEX,
+                            search_params={"ef_search": CASE_ANN_EF_SEARCH, "nprobe": CASE_ANN_NPROBE},
+                        )
+                        print(f"--- [RAG 初始化] 案例 ANN 索引加载成功 ({CASE_ANN_INDEX}, {case_vector_store.info['params']}) ---")
+                    else:
+                        from tools.mmap_store import MmapVectorStore
+                        case_vector_store = MmapVectorStore(CASE_MMAP_PATH, embeddings)
+                    print(f"--- [RAG 初始化] 案例内存映射库加载成功 ({len(case_vector_store)} 条, {case_vector_store.header['dtype']}) ---")
+                    if case_vector_store.is_stale(CASE_MANIFEST_PATH):
+                        print("⚠️ [RAG 初始化] 案例库在导出后又有更新，内存映射库可能已过期。可重新运行 docs/index_legal_docs.py --type case --export-mmap 更新。")
+                    return
+                except Exception as e:
+                    case_vector_store = None
+                    print(f"❌ [RAG 初始化] 加载案例内存映射库 / ANN 索引时出错: {e}，改用 Chroma。")
+            else:
+                print(f"⚠️ [RAG 初始化] 未找到案例内存映射库 '{CASE_MMAP_PATH}'，改用 Chroma。")
         try:
+            from langchain_community.vectorstores import Chroma
             case_vector_store = Chroma(persist_directory=CASE_DB_PATH, embedding_function=embeddings)
             print("--- [RAG 初始化] 案例向量存储加载成功 ---")
         except Exception as e:
             print(f"❌ [RAG 初始化] 加载案例向量存储时出错: {e}")
 
+def _initialize_legal_lexical():
+    """加载法条词法索引。索引文件不存在时只提示一次，LAS 退回纯向量检索。"""
+    global legal_lexical_index, _legal_lexical_checked
+    if _legal_lexical_checked:
+        return
+    with _legal_lexical_lock:
+        if _legal_lexical_checked:
+            return
+        if not os.path.exists(LEGAL_LEXICAL_INDEX_PATH):
+            print(f"⚠️ [RAG 初始化] 未找到法条词法索引 '{LEGAL_LEXICAL_INDEX_PATH}'，LAS 将只使用向量检索。可重新运行 docs/index_legal_docs.py --type legal 生成。")
+        else:
+            try:
+                legal_lexical_index = LexicalIndex.load(LEGAL_LEXICAL_INDEX_PATH)
+                print(f"--- [RAG 初始化] 法条词法索引加载成功 ({len(legal_lexical_index)} 个文本块) ---")
+            except Exception as e:
+                print(f"❌ [RAG 初始化] 加载法条词法索引时出错: {e}")
+        _legal_lexical_checked = True
+
+def _initialize_article_table():
+    """加载条文查找表。文件不存在 (法条库按 chunk 模式建立) 时 LAS 不做直接查表。"""
+    global article_table, _article_table_checked
+    if _article_table_checked:
+        return
+    with _article_table_lock:
+        if _article_table_checked:
+            return
+        if os.path.exists(ARTICLE_TABLE_PATH):
+            try:
+                article_table = ArticleTable.load(ARTICLE_TABLE_PATH)
+                print(f"--- [RAG 初始化] 条文查找表加载成功 ({len(article_table.laws)} 部法律, {len(article_table)} 条) ---")
+            except Exception as e:
+                print(f"❌ [RAG 初始化] 加载条文查找表时出错: {e}")
+        _article_table_checked = True
+
+def _initialize_web_search():
+    """创建网络搜索服务 (后端 + 结果缓存 + 子查询线程池)。后端创建失败时 WEB 工具返回错误。"""
+    global web_search_service
+    if web_search_service is not None:
+        return
+    with _web_search_lock:
+        if web_search_service is not None:
+            return
+        from tools.web_search_service import WebResultCache, WebSearchService, create_backend
+        try:
+            backend = create_backend(WEB_SEARCH_BACKEND, WEB_SEARCH_LOCAL_PATH, timeout=WEB_SEARCH_DEADLINE)
+        except Exception as e:
+            print(f"❌ [WEB 初始化] 创建网络搜索后端 '{WEB_SEARCH_BACKEND}' 时出错: {e}")
+            return
+        cache = WebResultCache(WEB_CACHE_PATH, WEB_CACHE_TTL_SECONDS, WEB_CACHE_MAX_STALE_SECONDS) if WEB_CACHE_ENABLED else None
+        web_search_service = WebSearchService(backend, cache, deadline=WEB_SEARCH_DEADLINE, max_workers=WEB_SEARCH_MAX_WORKERS)
+        print(f"--- [WEB 初始化] 网络搜索后端: {backend.name}, 截止时间 {WEB_SEARCH_DEADLINE:g}s, 缓存: {'开启' if cache else '关闭'} ---")
+
 # --- 工具定义区 ---
 
 @tool("相似案例查找(SCM)")
+@traced_tool("SCM")
 def similar_case_matching(query: str, k: int = 3) -> str:
     """
     当需要寻找与当前案件相似的先例时使用此工具。
     输入参数 'query' 应该是一段详细的案情描述，至少包含案件的关键事实、争议焦点等信息。
-    此工具会从本地的判例数据库中，找出语义上最接近的案例，并返回它们的来源、内容预览和相关性分数。
+    此工具会从本地的判例数据库中，找出语义上最接近的 k 个不同案例，并返回它们的来源、内容预览和相关性分数。
     例如：'被告人李四于2024年5月晚间，撬开被害人王五家门，窃取了价值五千元的笔记本电脑一台'。
     """
+    if should_skip_tool("SCM"):
+        return "<SCM status='skipped'>时间预算不足，已跳过相似案例检索。</SCM>"
+    k, _ = budgeted_k("SCM", k)
     print(f"--- [工具调用] 相似案例查找(SCM) | 检索数量: {k} ---")
     try:
         _initialize_case_rag()
         if case_vector_store is None:
             return "<SCM status='error'>无法访问本地案例知识库。请确认已成功运行索引脚本创建case_db。</SCM>"
 
-        results = case_vector_store.similarity_search_with_relevance_scores(query, k=k)
+        # 同一案例可能被切成多个文本块，旧版案例库中还可能有重复文书：多取候选，按案例去重后取前 k 个
+        with span("case_db", "vector_search", k=k * SCM_OVERFETCH, backend=CASE_STORE_BACKEND):
+            candidates = case_vector_store.similarity_search_with_relevance_scores(query, k=k * SCM_OVERFETCH)
+        results = dedupe_cases(candidates, k)
         if not results:
             return f"<SCM status='not_found'>未在案例库中找到与您描述相似的案例。</SCM>"
 
@@ -95,48 +249,160 @@ def similar_case_matching(query: str, k: int = 3) -> str:
             formatted.append(f"相似案例{i+1}(来源:{source}, 相关性得分:{score:.4f}): {preview}...")
         
         final_result = " | ".join(formatted)
-        return f"<SCM status='success'>检索到以下案例（相关性得分越低表示越相似）: {final_result}</SCM>"
+        return f"<SCM status='success'>检索到以下案例（相关性得分越高表示越相似）: {final_result}</SCM>"
     except Exception as e:
         print(f"❌ [SCM 工具错误] 检索时发生错误: {e}\n{traceback.format_exc()}")
         return f"<SCM status='error'>系统在检索相似案例时发生内部错误: {e}</SCM>"
 
 
 @tool("法条检索(LAS)")
+@traced_tool("LAS")
 def legal_article_search_rag(query: str, k: int = 3, fetch_k: int = 10) -> str:
     """
     当需要查找、引用或验证相关法律条款时使用此工具。
     输入 'query' 可以是案情描述或直接的法律问题。
-    此工具会利用MMR(最大边际相关性)算法从法条库中检索多样化且相关的法律条文。
+    此工具会结合关键词 (BM25) 检索与MMR(最大边际相关性)向量检索，从法条库中检索多样化且相关的法律条文。
+    如果 'query' 中明确引用了具体条文 (如 '劳动合同法第四十七条')，会直接返回该条原文。
     可以指定 'k' 来控制返回的法条数量。
     """
-    print(f"--- [工具调用] 法条检索(LAS) | 检索数量: {k}, MMR候选: {fetch_k} ---")
+    if should_skip_tool("LAS"):
+        return "<LAS status='skipped'>时间预算不足，已跳过法条检索。</LAS>"
+    k, fetch_k = budgeted_k("LAS", k, fetch_k)
+    print(f"--- [工具调用] 法条检索(LAS) | 检索数量: {k}, MMR候选: {fetch_k}, 方式: {LAS_RETRIEVAL_MODE} ---")
     try:
-        _initialize_legal_rag() 
-        if legal_vector_store is None:
-            return "<LAS status='error'>错误：无法访问本地法律知识库。</LAS>"
-
-        retriever = legal_vector_store.as_retriever(
-            search_type="mmr",
-            search_kwargs={'k': k, 'fetch_k': fetch_k}
-        )
-        results = retriever.get_relevant_documents(query)
-        
-        if not results:
+        hits = _search_articles([query], k, fetch_k)[0]
+        if hits.source == "article_table":
+            # 明确的条文引用：直接查表返回原文，不计算向量
+            print(f"--- [LAS] 条文查找表直接命中 {len(hits.records)} 条 ---")
+            return _format_article_results(hits.records, hits.missing)
+        if hits.source == "lexical":
+            # 快速路径：关键词式查询 (或 lexical 模式) 只走 BM25，无需计算查询向量
+            print(f"--- [LAS] 使用词法检索快速路径，命中 {len(hits.results)} 条 ---")
+        if not hits.results:
             return f"<LAS status='not_found'>未在法条库中找到与 '{query}' 相关的法律条款。</LAS>"
+        return _format_las_results(hits.results)
+    except VectorStoreUnavailable:
+        return "<LAS status='error'>错误：无法访问本地法律知识库。</LAS>"
+    except Exception as e:
+        print(f"❌ [LAS 工具错误] 检索时发生错误: {e}\n{traceback.format_exc()}")
+        return f"<LAS status='error'>检索法条时发生内部错误: {e}</LAS>"
+
+
+def _load_legal_dense():
+    _initialize_legal_rag()
+    return embeddings, legal_vector_store
+
+
+def _search_articles(queries: list, k: int, fetch_k: int) -> list:
+    """LAS 单条 / 批量检索的共同入口：按配置加载条文查找表与词法索引，向量库在确有需要时才加载。"""
+    _initialize_article_table()
+    lexical = None
+    if LAS_RETRIEVAL_MODE != "dense":
+        _initialize_legal_lexical()
+        lexical = legal_lexical_index
+    return search_articles_many(
+        queries, _load_legal_dense, lexical=lexical, article_table=article_table,
+        k=k, fetch_k=fetch_k, mode=LAS_RETRIEVAL_MODE, rrf_k=LAS_RRF_K, keyword_max_chars=LAS_KEYWORD_MAX_CHARS,
+    )
 
+
+@traced_tool("LAS")
+def legal_article_search_batch(queries: list, k: int = 3, fetch_k: int = 10) -> str:
+    """
+    LAS 的批量版本 (供工具链等程序化调用)：例如 LCP 预测出多个罪名、LER 抽取出多个要素时，每项一条查询。
+    全部查询一次编码、一起检索；多条查询命中的同一法条只输出一次，并注明对应的查询。
+    """
+    if should_skip_tool("LAS"):
+        return "<LAS status='skipped'>时间预算不足，已跳过法条检索。</LAS>"
+    k, fetch_k = budgeted_k("LAS", k, fetch_k)
+    queries = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+    print(f"--- [工具调用] 批量法条检索(LAS) | 查询数: {len(queries)}, 每条检索数量: {k}, 方式: {LAS_RETRIEVAL_MODE} ---")
+    if not queries:
+        return "<LAS status='not_found'>没有需要检索的查询。</LAS>"
+    try:
+        per_query = _search_articles(queries, k, fetch_k)
+        merged = merge_across_queries([hits.results for hits in per_query], article_key_of)
+        if not merged:
+            return f"<LAS status='not_found'>未在法条库中找到与 {'、'.join(queries)} 相关的法律条款。</LAS>"
         formatted = []
-        for i, doc in enumerate(results):
-            source = os.path.basename(doc.metadata.get('source', '未知来源'))
-            preview = doc.page_content.replace('\n', ' ').strip()
-            formatted.append(f"法条片段{i+1}(来源:{source}): {preview}")
+        for i, ((text, metadata), matched) in enumerate(merged):
+            source = (metadata or {}).get('location') or os.path.basename((metadata or {}).get('source', '未知来源'))
+            labels = "、".join(queries[j] for j in matched)
+            formatted.append(f"法条片段{i+1}(来源:{source}, 对应查询:{labels}): {text.replace(chr(10), ' ').strip()}")
+        missing = [f"{law}{article_label(number, suffix)}" for hits in per_query for law, number, suffix in hits.missing]
+        if missing:
+            formatted.append(f"未在法条库中找到: {'、'.join(dict.fromkeys(missing))}")
+        empty = [hits.query for hits in per_query if not hits.results]
+        if empty:
+            formatted.append(f"以下查询未检索到法条: {'、'.join(empty)}")
+        return f"<LAS status='success'>{' | '.join(formatted)}</LAS>"
+    except VectorStoreUnavailable:
+        return "<LAS status='error'>错误：无法访问本地法律知识库。</LAS>"
+    except Exception as e:
+        print(f"❌ [LAS 工具错误] 批量检索时发生错误: {e}\n{traceback.format_exc()}")
+        return f"<LAS status='error'>批量检索法条时发生内部错误: {e}</LAS>"
 
-        final_result = " | ".join(formatted)
-        return f"<LAS status='success'>{final_result}</LAS>"
+
+@traced_tool("SCM")
+def similar_case_matching_batch(queries: list, k: int = 3) -> str:
+    """
+    SCM 的批量版本 (供工具链等程序化调用)：全部查询一次编码、一起做向量检索，
+    每条查询各取 k 个不同案例；多条查询命中的同一案例只输出一次，并注明对应的查询。
+    """
+    if should_skip_tool("SCM"):
+        return "<SCM status='skipped'>时间预算不足，已跳过相似案例检索。</SCM>"
+    k, _ = budgeted_k("SCM", k)
+    queries = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+    print(f"--- [工具调用] 批量相似案例查找(SCM) | 查询数: {len(queries)}, 每条检索数量: {k} ---")
+    if not queries:
+        return "<SCM status='not_found'>没有需要检索的查询。</SCM>"
+    try:
+        _initialize_case_rag()
+        if case_vector_store is None:
+            return "<SCM status='error'>无法访问本地案例知识库。请确认已成功运行索引脚本创建case_db。</SCM>"
+        per_query = search_cases_many(queries, embeddings, case_vector_store, k, SCM_OVERFETCH)
+        merged = merge_across_queries(per_query, case_key)
+        if not merged:
+            return f"<SCM status='not_found'>未在案例库中找到与您描述相似的案例。</SCM>"
+        formatted = []
+        for i, ((doc, score), matched) in enumerate(merged):
+            source = os.path.basename(doc.metadata.get('source', '未知来源'))
+            preview = doc.page_content.replace('\n', ' ').strip()[:150]
+            labels = "、".join(queries[j][:30] for j in matched)
+            formatted.append(f"相似案例{i+1}(来源:{source}, 相关性得分:{score:.4f}, 对应查询:{labels}): {preview}...")
+        return f"<SCM status='success'>检索到以下案例（相关性得分越高表示越相似）: {' | '.join(formatted)}</SCM>"
     except Exception as e:
-        print(f"❌ [LAS 工具错误] 检索时发生错误: {e}\n{traceback.format_exc()}")
-        return f"<LAS status='error'>检索法条时发生内部错误: {e}</LAS>"
+        print(f"❌ [SCM 工具错误] 批量检索时发生错误: {e}\n{traceback.format_exc()}")
+        return f"<SCM status='error'>系统在批量检索相似案例时发生内部错误: {e}</SCM>"
+
+
+def _format_las_results(results: list) -> str:
+    """把 [(文本, 元数据)] 渲染为 LAS 工具的输出格式。"""
+    formatted = []
+    for i, (text, metadata) in enumerate(results):
+        metadata = metadata or {}
+        # 按条切分的法条库带有条文位置，优先展示
+        source = metadata.get('location') or os.path.basename(metadata.get('source', '未知来源'))
+        preview = text.replace('\n', ' ').strip()
+        formatted.append(f"法条片段{i+1}(来源:{source}): {preview}")
+
+    final_result = " | ".join(formatted)
+    return f"<LAS status='success'>{final_result}</LAS>"
+
+def _format_article_results(records: list, missing: list) -> str:
+    """把查表命中的条文渲染为 LAS 的输出格式；未收录的引用附在末尾说明。"""
+    formatted = []
+    for i, record in enumerate(records):
+        text = record["text"].replace('\n', ' ').strip()
+        formatted.append(f"法条{i+1}(来源:{format_location(record)}): {text}")
+    if missing:
+        labels = "、".join(f"{law}{article_label(number, suffix)}" for law, number, suffix in missing)
+        formatted.append(f"未在法条库中找到: {labels}")
+    final_result = " | ".join(formatted)
+    return f"<LAS status='success'>{final_result}</LAS>"
 
 @tool("互联网搜索(WEB)")
+@traced_tool("WEB")
 def web_search(query: str) -> str:
     """
     当需要获取最新的、非本地知识库包含的公开信息时使用此工具。
@@ -144,26 +410,78 @@ def web_search(query: str) -> str:
     输入一个清晰的搜索问题 'query'。
     """
     print(f"--- [工具调用] 互联网搜索(WEB) ---")
+    if should_skip_tool("WEB"):
+        return "<WEB status='skipped'>时间预算不足，已跳过互联网搜索。</WEB>"
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=3))
-        if not results:
+        _initialize_web_search()
+        if web_search_service is None:
+            return "<WEB status='error'>网络搜索服务不可用。</WEB>"
+        hits = web_search_service.search(query, WEB_SEARCH_MAX_RESULTS)
+        if not hits.results:
+            if hits.source == "timeout":
+                return f"<WEB status='error'>网络搜索超时 ({hits.error})，且没有可用的缓存结果。</WEB>"
+            if hits.source == "error":
+                print(f"❌ [WEB 工具错误] 搜索时发生错误: {hits.error}")
+                return f"<WEB status='error'>网络搜索失败: {hits.error}</WEB>"
             return f"<WEB status='not_found'>未找到与 '{query}' 相关的互联网信息。</WEB>"
-        
-        formatted = []
-        for r in results:
-            title = r.get('title', '')
-            snippet = r.get('body', '')
-            link = r.get('href', '')
-            formatted.append(f"标题: {title}\n摘要: {snippet}\n链接: {link}")
-            
-        final_result = "\n---\n".join(formatted)
-        return f"<WEB status='success'>\n{final_result}\n</WEB>"
+
+        final_result = "\n---\n".join(_format_web_result(r) for r in hits.results)
+        return f"<WEB status='success'>\n{_web_source_note(hits)}{final_result}\n</WEB>"
     except Exception as e:
         print(f"❌ [WEB 工具错误] 搜索时发生错误: {e}")
         return f"<WEB status='error'>网络搜索失败: {e}</WEB>"
 
+
+@traced_tool("WEB")
+def web_search_batch(queries: list) -> str:
+    """
+    WEB 的批量版本 (供工具链等程序化调用)：多条子查询在同一截止时间内并发搜索，
+    超时的子查询退回缓存结果或被略去 (部分结果)；多条查询命中的同一链接只输出一次，并注明对应的查询。
+    """
+    queries = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+    print(f"--- [工具调用] 批量互联网搜索(WEB) | 查询数: {len(queries)} ---")
+    if should_skip_tool("WEB"):
+        return "<WEB status='skipped'>时间预算不足，已跳过互联网搜索。</WEB>"
+    if not queries:
+        return "<WEB status='not_found'>没有需要搜索的查询。</WEB>"
+    try:
+        _initialize_web_search()
+        if web_search_service is None:
+            return "<WEB status='error'>网络搜索服务不可用。</WEB>"
+        per_query = web_search_service.search_many(queries, WEB_SEARCH_MAX_RESULTS)
+        merged = merge_across_queries([hits.results for hits in per_query], lambda r: r["href"] or r["title"])
+        notes = [f"{hits.query}: {_web_source_note(hits).strip()}" for hits in per_query if hits.source == "stale"]
+        failed = [hits.query for hits in per_query if hits.source in ("timeout", "error")]
+        if failed:
+            notes.append(f"以下查询超时或失败，未返回结果: {'、'.join(failed)}")
+        if not merged:
+            if failed:
+                return f"<WEB status='error'>网络搜索超时或失败: {'、'.join(failed)}</WEB>"
+            return f"<WEB status='not_found'>未找到与 {'、'.join(queries)} 相关的互联网信息。</WEB>"
+        formatted = [
+            f"{_format_web_result(result)}\n对应查询: {'、'.join(queries[j] for j in matched)}" for result, matched in merged
+        ]
+        final_result = "\n---\n".join(formatted)
+        note_text = "".join(f"注意: {note}\n" for note in notes)
+        return f"<WEB status='success'>\n{note_text}{final_result}\n</WEB>"
+    except Exception as e:
+        print(f"❌ [WEB 工具错误] 批量搜索时发生错误: {e}\n{traceback.format_exc()}")
+        return f"<WEB status='error'>批量网络搜索时发生内部错误: {e}</WEB>"
+
+
+def _format_web_result(result: dict) -> str:
+    return f"标题: {result['title']}\n摘要: {result['body']}\n链接: {result['href']}"
+
+
+def _web_source_note(hits) -> str:
+    """实时搜索超时 / 失败而退回过期缓存时，提示结果的时效。"""
+    if hits.source != "stale":
+        return ""
+    age = f"{hits.age / 3600:.1f} 小时" if hits.age >= 3600 else f"{max(1, round(hits.age / 60))} 分钟"
+    return f"实时搜索未能完成 ({hits.error})，以下为 {age}前的缓存结果。\n"
+
 @tool("罪名预测(LCP)")
+@traced_tool("LCP")
 def legal_charge_prediction(case_details: str) -> str:
     """
     输入一个详细的案情描述(case_details)，此工具会执行一个完整的RAG流程来预测最可能的罪名。
@@ -175,7 +493,8 @@ def legal_charge_prediction(case_details: str) -> str:
     try:
         _initialize_legal_rag()
         if legal_vector_store:
-            results = legal_vector_store.similarity_search(case_details, k=3)
+            with span("legal_db", "vector_search", k=3):
+                results = legal_vector_store.similarity_search(case_details, k=3)
             if results:
                 formatted = [f"相关法条片段{i+1}: {doc.page_content.strip()}" for i, doc in enumerate(results)]
                 retrieved_articles = "\n\n".join(formatted)
@@ -189,13 +508,13 @@ def legal_charge_prediction(case_details: str) -> str:
     [你的任务]: 请你综合分析上述[案情描述]，并参考[相关法律规定]，准确地判断并给出该案情最可能构成的一个或多个具体罪名。你的回答应该非常简洁，请【只返回罪名名称本身】，如果有多个，请用逗号分隔。如果信息不足以做出明确判断，请返回 '根据现有信息无法准确判断罪名'。
     """
     try:
-        response = llm.invoke(prompt)
-        final_charge = response.content.strip() if hasattr(response, 'content') else str(response).strip()
+        final_charge = cached_llm_invoke("LCP", prompt, PROMPT_VERSIONS["LCP"])
         return f"<LCP status='success'>{final_charge}</LCP>"
     except Exception as e:
         return f"<LCP status='error'>在进行罪名推理时发生内部错误: {e}</LCP>"
 
 @tool("法律要素识别(LER)")
+@traced_tool("LER")
 def legal_element_recognition(query: str) -> str:
     """
     用于从一段详细的案情描述中，抽取出结构化的法律核心要素。
@@ -213,13 +532,13 @@ def legal_element_recognition(query: str) -> str:
     主观方面: [此处填写行为人的心理状态]
     """
     try:
-        response = llm.invoke(prompt)
-        result = response.content.strip() if hasattr(response, 'content') else str(response).strip()
+        result = cached_llm_invoke("LER", prompt, PROMPT_VERSIONS["LER"])
         return f"<LER status='success'>{result}</LER>"
     except Exception as e:
         return f"<LER status='error'>在进行法律要素识别时发生内部错误: {e}</LER>"
 
 @tool("法律事件检测(LED)")
+@traced_tool("LED")
 def legal_event_detection(query: str) -> str:
     """
 
@@ -233,13 +552,13 @@ def legal_event_detection(query: str) -> str:
     [任务说明]: 你需要检测的事件类型包括但不限于：'提起诉讼', '申请仲裁', '签订合同', '提出上诉', '离婚登记', '财产分割', '工伤认定', '申请强制执行', '继承遗产', '报案' 等。请将所有识别出的事件用逗号分隔，并只输出事件名称本身。如果未检测到任何明确的法律事件，请返回'未检测到特定法律事件'。
     """
     try:
-        response = llm.invoke(prompt)
-        result = response.content.strip() if hasattr(response, 'content') else str(response).strip()
+        result = cached_llm_invoke("LED", prompt, PROMPT_VERSIONS["LED"])
         return f"<LED status='success'>{result}</LED>"
     except Exception as e:
         return f"<LED status='error'>在进行法律事件检测时发生内部错误: {e}</LER>"
 
 @tool("法律文本摘要(LTS)")
+@traced_tool("LTS")
 def legal_text_summary(query: str) -> str:
     """
     用于将长篇的法律文书、案情描述或任何法律相关文本，生成一段简洁、中立、准确的摘要。
@@ -252,8 +571,7 @@ def legal_text_summary(query: str) -> str:
     [输出要求]: 请直接输出摘要内容，不要添加“摘要如下：”等多余的引言。
     """
     try:
-        response = llm.invoke(prompt)
-        result = response.content.strip() if hasattr(response, 'content') else str(response).strip()
+        result = cached_llm_invoke("LTS", prompt, PROMPT_VERSIONS["LTS"])
         return f"<LTS status='success'>{result}</LTS>"
     except Exception as e:
         return f"<LTS status='error'>在生成法律文本摘要时发生内部错误: {e}</LTS>"
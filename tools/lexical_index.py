@@ -0,0 +1,196 @@
+# multi_agent/tools/lexical_index.py
+
+import os
+import re
+import json
+import hashlib
+from collections import Counter, defaultdict
+from typing import List, Tuple
+
+import numpy as np
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_FORMAT_VERSION = 1
+
+_CJK_RUN = re.compile(r"[一-鿿]+")
+_ALNUM_RUN = re.compile(r"[A-Za-z0-9]+")
+# 形如问句/叙述的查询不视为关键词查询
+_QUESTION_HINT = re.compile(r"[，。？！?!,；;]|怎么|如何|什么|为什么|吗|呢|是否|可以|能否|请问")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文友好的分词：汉字串切为字符二元组 (单字串保留单字)，字母数字串整体作为一个词 (小写)。
+    不依赖分词词典，对“经济补偿”“第二百六十四条”等精确用语有很好的召回。
+    """
+    tokens = []
+    for run in _CJK_RUN.findall(text or ""):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(t.lower() for t in _ALNUM_RUN.findall(text or ""))
+    return tokens
+
+
+def content_key(text: str) -> str:
+    """文本块的稳定标识，用于与向量检索结果对齐 (两者返回的是同一批文本块)。"""
+    return hashlib.sha1((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def is_keyword_query(query: str, max_chars: int) -> bool:
+    """
+    判断查询是否为“关键词式”：较短、不含问句标点或疑问词，例如 '经济补偿'、'盗窃罪 量刑'、'民法典第一千零八十四条'。
+    这类查询适合直接走词法检索的快速路径。
+    """
+    stripped = (query or "").strip()
+    if not stripped or _QUESTION_HINT.search(stripped):
+        return False
+    return len(re.sub(r"\s+", "", stripped)) <= max_chars
+
+
+class LexicalIndex:
+    """
+    基于 BM25 的倒排索引 (字符二元组)，在建库时由 docs/index_legal_docs.py 生成并保存为 .npz。
+    倒排表以扁平数组存储 (词项 i 的倒排表为 doc_ids[offsets[i]:offsets[i+1]])，加载快、占用内存小；
+    查询只涉及几个词项的倒排表，通常在 1 毫秒以内完成，不需要计算查询向量。
+    """
+
+    def __init__(self, docs: List[dict], terms: List[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray):
+        self.docs = docs                  # [{"key", "text", "metadata"}]
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs.astype(np.float32)
+        self.doc_lengths = doc_lengths
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        n = len(docs)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n else 1.0
+        # 每个文档的长度归一化项，查询时直接取用
+        self.doc_norm = (BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / (avg_length or 1.0))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def build(cls, texts: List[str], metadatas: List[dict] = None) -> "LexicalIndex":
+        """
+        由文本块构建索引。内容完全相同的文本块只保留一份。
+        :param texts: 文本块列表。
+        :param metadatas: 与 texts 对应的元数据 (可选)，检索结果中原样返回。
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        docs, doc_lengths, seen = [], [], set()
+        postings = defaultdict(list)
+        for text, metadata in zip(texts, metadatas):
+            key = content_key(text)
+            if not text or key in seen:
+                continue
+            seen.add(key)
+            counts = Counter(tokenize(text))
+            doc_index = len(docs)
+            docs.append({"key": key, "text": text, "metadata": metadata or {}})
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc_index, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.int32)
+        for i, term in enumerate(terms):
+            pairs = postings[term]
+            doc_ids[offsets[i]:offsets[i + 1]] = [doc_index for doc_index, _ in pairs]
+            tfs[offsets[i]:offsets[i + 1]] = [tf for _, tf in pairs]
+        return cls(docs, terms, offsets, doc_ids, tfs, np.array(doc_lengths, dtype=np.float32))
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.terms)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[dict, float]]:
+        """
+        BM25 检索。
+        :return: [(文档, 分数)]，按分数降序，最多 k 条。
+        """
+        if not self.docs or k <= 0:
+            return []
+        scores = None
+        for term in set(tokenize(query)):
+            i = self.term_index.get(term)
+            if i is None:
+                continue
+            if scores is None:
+                scores = np.zeros(len(self.docs), dtype=np.float32)
+            start, end = self.offsets[i], self.offsets[i + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            # 同一词项的倒排表中文档不重复，可以直接按下标累加
+            scores[ids] += self.idf[i] * tf * (BM25_K1 + 1) / (tf + self.doc_norm[ids])
+        if scores is None:
+            return []
+        k = min(k, len(self.docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.docs[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    # --- 持久化 ---
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(INDEX_FORMAT_VERSION),
+                docs=_encode_text(json.dumps(self.docs, ensure_ascii=False)),
+                terms=_encode_text("\n".join(self.terms)),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs.astype(np.int32),
+                doc_lengths=self.doc_lengths,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version != INDEX_FORMAT_VERSION:
+                raise ValueError(f"词法索引版本不匹配 (文件: {version}, 期望: {INDEX_FORMAT_VERSION})，请重新运行建库脚本。")
+            terms_text = _decode_text(data["terms"])
+            return cls(
+                json.loads(_decode_text(data["docs"])),
+                terms_text.split("\n") if terms_text else [],
+                data["offsets"],
+                data["doc_ids"],
+                data["tfs"],
+                data["doc_lengths"],
+            )
+
+
+def _encode_text(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_text(array: np.ndarray) -> str:
+    return array.tobytes().decode("utf-8")
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60) -> List[str]:
+    """
+    倒数排名融合 (RRF)：score(d) = Σ 1 / (k + rank_i(d))，rank 从 1 开始。
+    :param ranked_lists: 多路检索结果，每路为按相关性排序的文档标识列表。
+    :return: 融合后按分数降序排列的文档标识。
+    """
+    scores = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked, start=1):
+            scores[key] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: scores[key], reverse=True)
@@ -0,0 +1,154 @@
+# multi_agent/tools/llm_cache.py
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+
+from tools.deadline import call_with_deadline
+from tools.tracing import span, token_usage
+from config import (
+    get_llm,
+    LLM_MODEL_FOR_LITELLM_PROVIDER_ID,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_PATH,
+    LLM_CACHE_MEMORY_ENTRIES,
+    LLM_CACHE_DISABLED_TOOLS,
+)
+
+
+class LLMResultCache:
+    """
+    工具级 LLM 调用的两级缓存：进程内 LRU + 持久化 SQLite。
+    键由 (提示词模板版本, 模型标识, 完整提示词) 计算得到，提示词中已包含输入文本。
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+
+        self._conn = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_results (
+                    cache_key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            self._conn.commit()
+        except Exception as e:
+            print(f"⚠️ [LLM 缓存] 无法打开持久化缓存 '{path}'，仅使用进程内缓存: {e}")
+            self._conn = None
+
+    @staticmethod
+    def make_key(template_version: str, model_id: str, prompt: str) -> str:
+        payload = "\x00".join([template_version, model_id, prompt])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, tool: str, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats[tool]["memory_hits"] += 1
+                return self._memory[key]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT result FROM llm_results WHERE cache_key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.stats[tool]["disk_hits"] += 1
+                    return row[0]
+            self.stats[tool]["misses"] += 1
+            return None
+
+    def put(self, tool: str, key: str, result: str):
+        with self._lock:
+            self._remember(key, result)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_results (cache_key, tool, result, created_at) VALUES (?, ?, ?, ?)",
+                    (key, tool, result, time.time())
+                )
+                self._conn.commit()
+
+    def _remember(self, key: str, result: str):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def summary(self) -> dict:
+        """返回各工具的命中/未命中计数。"""
+        with self._lock:
+            return {tool: dict(counts) for tool, counts in self.stats.items()}
+
+
+_llm_result_cache = None
+_llm_result_cache_lock = threading.Lock()
+# 未使用缓存的调用次数 (缓存关闭或工具在 LLM_CACHE_DISABLED_TOOLS 中)，在模块内计数，不需要创建缓存
+_bypassed = defaultdict(int)
+_bypassed_lock = threading.Lock()
+
+
+def get_llm_result_cache() -> LLMResultCache:
+    """获取进程内共享的 LLM 结果缓存，首次调用时创建 (打开持久化缓存)，导入本模块没有副作用。"""
+    global _llm_result_cache
+    if _llm_result_cache is None:
+        with _llm_result_cache_lock:
+            if _llm_result_cache is None:
+                _llm_result_cache = LLMResultCache()
+    return _llm_result_cache
+
+
+def llm_cache_summary() -> dict:
+    """返回各工具的命中/未命中/绕过计数；缓存尚未创建时只包含绕过计数 (本函数不会创建缓存)。"""
+    summary = _llm_result_cache.summary() if _llm_result_cache is not None else {}
+    with _bypassed_lock:
+        for tool, count in _bypassed.items():
+            summary.setdefault(tool, {})["bypassed"] = count
+    return summary
+
+
+def _model_id() -> str:
+    return str(getattr(get_llm(), "model", None) or LLM_MODEL_FOR_LITELLM_PROVIDER_ID)
+
+
+def cached_llm_invoke(tool: str, prompt: str, template_version: str) -> str:
+    """
+    带缓存的 llm.invoke 调用，返回去除首尾空白的文本内容。
+    :param tool: 工具缩写 (例如 'LCP')，用于统计和按工具关闭缓存 (LLM_CACHE_DISABLED_TOOLS)。
+    :param prompt: 完整提示词。
+    :param template_version: 提示词模板版本；修改模板时递增即可让旧缓存失效。
+    :return: LLM 返回的文本。调用失败或超出时间预算时抛出异常，且不会写入缓存。
+    """
+    use_cache = LLM_CACHE_ENABLED and tool not in LLM_CACHE_DISABLED_TOOLS
+    with span(tool, "llm", prompt_chars=len(prompt)) as trace:
+        key = llm_result_cache = None
+        if use_cache:
+            # 只在确实使用缓存时才创建 (打开持久化文件)
+            llm_result_cache = get_llm_result_cache()
+            key = LLMResultCache.make_key(template_version, _model_id(), prompt)
+            cached = llm_result_cache.get(tool, key)
+            if cached is not None:
+                print(f"--- [LLM 缓存] {tool} 命中缓存 ---")
+                trace.set(cache="hit")
+                return cached
+        else:
+            with _bypassed_lock:
+                _bypassed[tool] += 1
+        trace.set(cache="miss" if use_cache else "bypassed")
+
+        # 在当前请求剩余的时间预算内调用，超时抛出 DeadlineExceeded (由工具转换为 error 状态)
+        response = call_with_deadline(tool, get_llm().invoke, prompt)
+        trace.add_tokens(*token_usage(response))
+        result = response.content.strip() if hasattr(response, 'content') else str(response).strip()
+        if use_cache and result:
+            llm_result_cache.put(tool, key, result)
+        return result
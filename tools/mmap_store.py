@@ -0,0 +1,214 @@
+# multi_agent/tools/mmap_store.py
+
+import os
+import json
+import shutil
+import uuid
+import hashlib
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+DTYPES = ("float16", "int8")
+_HEADER = "header.json"
+_VECTORS = "vectors.bin"
+_SCALES = "scales.npy"
+_RECORDS = "records.bin"
+_OFFSETS = "offsets.npy"
+# 打分时每次转换为 float32 的行数：块缓冲区放得进 CPU 缓存时转换与矩阵-向量乘最快，临时内存也有上限
+SCORE_BLOCK_ROWS = 4096
+
+
+@dataclass
+class StoredDocument:
+    """检索结果，字段与 LangChain Document 一致 (page_content / metadata)，供 SCM 直接使用。"""
+    page_content: str
+    metadata: dict = field(default_factory=dict)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def fingerprint_file(path: str) -> str:
+    """导出时记录源库建库清单的哈希，加载时据此判断导出是否过期。"""
+    if not path or not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def export_collection(collection, out_dir: str, dtype: str = "float16", page_size: int = 5000,
+                      source_fingerprint: str = "") -> dict:
+    """
+    把 Chroma collection 导出为只读的内存映射存储：
+      vectors.bin  (n, dim) 归一化向量，float16 或 int8 (int8 按行缩放，缩放系数存于 scales.npy)
+      records.bin  每条记录的 JSON ({"t": 文本, "m": 元数据}) 依次拼接，offsets.npy 为各条的字节偏移 (n + 1)
+      header.json  版本、条数、维度、数据类型等
+    分页读取、逐页写入，内存占用只与页大小有关。先写入临时目录，完成后整体替换，读取方不会看到半成品。
+    :return: header 内容。
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的数据类型: {dtype} (可选: {', '.join(DTYPES)})")
+    count = collection.count()
+    tmp_dir = out_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    vectors = None
+    dim = 0
+    scales = np.ones(count, dtype=np.float32)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    row = 0
+    with open(os.path.join(tmp_dir, _RECORDS), "wb") as records:
+        while row < count:
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=row)
+            embeddings = batch.get("embeddings")
+            if embeddings is None or len(embeddings) == 0:
+                break
+            page = _normalize(np.asarray(embeddings, dtype=np.float32))
+            rows = min(len(page), count - row)
+            page = page[:rows]
+            if vectors is None:
+                # 维度在读到第一页后才确定
+                dim = page.shape[1]
+                vectors = np.memmap(os.path.join(tmp_dir, _VECTORS), dtype=dtype, mode="w+", shape=(count, dim))
+            if dtype == "int8":
+                row_scale = np.abs(page).max(axis=1)
+                row_scale[row_scale == 0] = 1.0
+                vectors[row:row + rows] = np.round(page / row_scale[:, None] * 127).astype(np.int8)
+                scales[row:row + rows] = row_scale / 127
+            else:
+                vectors[row:row + rows] = page.astype(np.float16)
+            documents = batch.get("documents") or []
+            metadatas = batch.get("metadatas") or [{} for _ in documents]
+            for i in range(rows):
+                blob = json.dumps({"t": documents[i], "m": metadatas[i] or {}}, ensure_ascii=False).encode("utf-8")
+                records.write(blob)
+                offsets[row + i + 1] = offsets[row + i] + len(blob)
+            row += rows
+
+    if vectors is not None:
+        vectors.flush()
+        del vectors
+    header = {
+        "version": STORE_FORMAT_VERSION,
+        "count": row,
+        "dim": dim,
+        "dtype": dtype,
+        "source_fingerprint": source_fingerprint,
+        # 每次导出唯一：行号只在同一次导出内有意义，基于行号的 ANN 索引据此判断是否对应当前导出
+        "export_id": uuid.uuid4().hex,
+    }
+    np.save(os.path.join(tmp_dir, _OFFSETS), offsets[:row + 1])
+    np.save(os.path.join(tmp_dir, _SCALES), scales[:row])
+    with open(os.path.join(tmp_dir, _HEADER), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+
+    old_dir = out_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return header
+
+
+class MmapVectorStore:
+    """
+    只读的内存映射向量库 (由 export_collection 导出)，接口与 SCM 用到的 Chroma 方法一致。
+    打开时只映射文件、不读入数据，启动几乎不耗时；多个工作进程映射同一组文件时共享操作系统的页缓存。
+    查询为对全部归一化向量的分块矩阵-向量乘 + argpartition 取 top-k，延迟稳定、可预期。
+    int8 导出的体积为 float16 的一半，转换为 float32 也快得多，查询延迟最低 (召回略有损失)；float16 与原向量几乎无差别。
+    """
+
+    def __init__(self, directory: str, embedding_function):
+        with open(os.path.join(directory, _HEADER), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"内存映射案例库版本不匹配 (文件: {self.header.get('version')}, 期望: {STORE_FORMAT_VERSION})，请重新导出。")
+        self.directory = directory
+        self.embedding_function = embedding_function
+        count, dim, dtype = self.header["count"], self.header["dim"], self.header["dtype"]
+        self.vectors = np.memmap(os.path.join(directory, _VECTORS), dtype=dtype, mode="r", shape=(count, dim)) if count else np.zeros((0, dim), dtype=dtype)
+        self.scales = np.load(os.path.join(directory, _SCALES), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, _OFFSETS), mmap_mode="r")
+        self._records = open(os.path.join(directory, _RECORDS), "rb")
+        self._quantized = dtype == "int8"
+
+    def __len__(self):
+        return self.header["count"]
+
+    def _document(self, index: int) -> StoredDocument:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        # os.pread 不移动文件指针，多个线程可以并发读取
+        record = json.loads(os.pread(self._records.fileno(), end - start, start).decode("utf-8"))
+        return StoredDocument(page_content=record["t"], metadata=record["m"])
+
+    def float_rows(self, start: int, stop: int) -> np.ndarray:
+        """[start, stop) 行的归一化向量 (float32，int8 会乘回缩放系数)，供 ANN 建索引与重排使用。"""
+        rows = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self._quantized:
+            rows *= np.asarray(self.scales[start:stop], dtype=np.float32)[:, None]
+        return rows
+
+    def take_rows(self, indices) -> np.ndarray:
+        """按行号取归一化向量 (float32)；行号应已排序，以便顺序读取内存映射文件。"""
+        indices = np.asarray(indices, dtype=np.int64)
+        rows = np.asarray(self.vectors[indices], dtype=np.float32)
+        if self._quantized:
+            rows *= np.asarray(self.scales[indices], dtype=np.float32)[:, None]
+        return rows
+
+    def search_by_vectors(self, vectors, k: int) -> List[List[Tuple[int, float]]]:
+        """
+        多条查询一起打分：每个数据块只转换一次 float32，再与全部查询做矩阵乘。
+        :return: 每条查询的 [(行号, 分数)]，按余弦相似度降序。
+        """
+        n = len(self)
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.vectors.shape[1]))
+        if n == 0 or k <= 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        scores = np.empty((n, len(queries)), dtype=np.float32)
+        buffer = np.empty((min(SCORE_BLOCK_ROWS, n), self.vectors.shape[1]), dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = self.vectors[start:start + SCORE_BLOCK_ROWS]
+            converted = buffer[:len(block)]
+            converted[...] = block
+            np.dot(converted, queries.T, out=scores[start:start + len(block)])
+        if self._quantized:
+            scores *= np.asarray(self.scales)[:, None]
+        k = min(k, n)
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            results.append([(int(i), float(column[i])) for i in top])
+        return results
+
+    def search_by_vector(self, vector, k: int) -> List[Tuple[int, float]]:
+        """按余弦相似度返回 [(行号, 分数)]，降序。"""
+        return self.search_by_vectors([vector], k)[0]
+
+    def similarity_search_by_vectors(self, vectors, k: int = 4) -> List[List[Tuple[StoredDocument, float]]]:
+        """批量检索接口 (查询向量已由调用方一次性编码)，返回每条查询的 [(文档, 分数)]。"""
+        return [[(self._document(i), score) for i, score in hits] for hits in self.search_by_vectors(vectors, k)]
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4) -> List[Tuple[StoredDocument, float]]:
+        vector = self.embedding_function.embed_query(query)
+        return [(self._document(i), score) for i, score in self.search_by_vector(vector, k)]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[StoredDocument]:
+        return [doc for doc, _ in self.similarity_search_with_relevance_scores(query, k)]
+
+    def is_stale(self, manifest_path: str) -> bool:
+        """导出后源库是否又更新过 (比较导出时记录的建库清单哈希)。"""
+        recorded = self.header.get("source_fingerprint")
+        return bool(recorded) and recorded != fingerprint_file(manifest_path)
+
+    def close(self):
+        self._records.close()
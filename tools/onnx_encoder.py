@@ -0,0 +1,153 @@
+# multi_agent/tools/onnx_encoder.py
+
+import os
+import json
+import inspect
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+FP32_MODEL_FILENAME = "model.onnx"
+INT8_MODEL_FILENAME = "model_int8.onnx"
+ENCODER_INFO_FILENAME = "encoder_info.json"
+DEFAULT_MAX_LENGTH = 512
+# 每次送入 ONNX Runtime 的文本数；在线查询通常只有一条，批量接口 (embed_queries) 会用满
+ENCODE_BATCH_SIZE = 32
+_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def _read_json(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _sentence_transformer_settings(model_path: str) -> dict:
+    """读取 sentence-transformers 模型目录中的池化方式、是否归一化与最大长度，使 ONNX 版本与原模型输出一致。"""
+    modules = _read_json(os.path.join(model_path, "modules.json")) or []
+    pooling_dir = next((m.get("path") for m in modules if m.get("type", "").endswith("Pooling")), "1_Pooling")
+    pooling = _read_json(os.path.join(model_path, pooling_dir, "config.json"))
+    max_length = _read_json(os.path.join(model_path, "sentence_bert_config.json")).get("max_seq_length")
+    return {
+        "pooling": "cls" if pooling.get("pooling_mode_cls_token") else "mean",
+        "normalize": any(m.get("type", "").endswith("Normalize") for m in modules),
+        "max_length": int(max_length) if max_length else None,
+    }
+
+
+def export_quantized(model_path: str, out_dir: str, opset: int = 14) -> dict:
+    """
+    离线导出：transformers 模型 -> ONNX (fp32) -> ONNX Runtime 动态 int8 量化 (权重 int8，激活在推理时动态量化)。
+    需要 torch、transformers 与 onnxruntime，只在导出机器上执行一次；在线节点只需要 onnxruntime 与 tokenizers。
+    :return: 写入 encoder_info.json 的说明信息。
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path).eval()
+    sample = tokenizer(["导出样例文本", "第二条样例"], padding=True, return_tensors="pt")
+    input_names = [name for name in _INPUT_NAMES if name in sample]
+    fp32_path = os.path.join(out_dir, FP32_MODEL_FILENAME)
+
+    class _Encoder(torch.nn.Module):
+        # 以关键字参数调用并只输出 last_hidden_state，不依赖各版本 transformers forward() 的位置参数顺序
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # 新版 torch 默认使用 dynamo 导出，这里固定为 TorchScript 导出以保证动态轴与算子集稳定
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder().eval(), tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=opset, **export_kwargs,
+        )
+    quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_MODEL_FILENAME), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(out_dir)
+
+    info = {
+        "source_model": os.path.abspath(model_path),
+        "dim": int(model.config.hidden_size),
+        "input_names": input_names,
+        "quantization": "dynamic-int8",
+        **_sentence_transformer_settings(model_path),
+    }
+    if not info["max_length"]:
+        # 新版 sentence-transformers 不再写 max_seq_length，此时与其一致地使用分词器的 model_max_length
+        info["max_length"] = min(int(tokenizer.model_max_length), DEFAULT_MAX_LENGTH)
+    with open(os.path.join(out_dir, ENCODER_INFO_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    return info
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    基于 ONNX Runtime 的 CPU 句向量编码器 (export_quantized 导出的模型目录)。
+    只依赖 onnxruntime 与 tokenizers，不导入 torch；池化、归一化与最大长度和原 sentence-transformers 模型一致，向量维度不变。
+    可以替代 SentenceTransformerEmbeddings 放进 EmbeddingService。
+    """
+
+    def __init__(self, model_dir: str, threads: int = 0, quantized: bool = True, batch_size: int = ENCODE_BATCH_SIZE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.info = _read_json(os.path.join(model_dir, ENCODER_INFO_FILENAME))
+        if not self.info:
+            raise FileNotFoundError(f"'{model_dir}' 中没有 {ENCODER_INFO_FILENAME}，请先运行 scripts/export_onnx_encoder.py 导出模型。")
+        self.batch_size = batch_size
+        self.dim = self.info["dim"]
+        self.pooling = self.info.get("pooling", "mean")
+        self.normalize = self.info.get("normalize", False)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.info.get("max_length", DEFAULT_MAX_LENGTH))
+        pad_token = "[PAD]" if self.tokenizer.token_to_id("[PAD]") is not None else "<pad>"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = INT8_MODEL_FILENAME if quantized else FP32_MODEL_FILENAME
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """编码为 (n, dim) float32 数组。"""
+        chunks = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + self.batch_size]))
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(["last_hidden_state"], {k: v for k, v in feed.items() if k in self._inputs})[0]
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                weights = mask[:, :, None].astype(np.float32)
+                pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            chunks.append(pooled.astype(np.float32))
+        return np.vstack(chunks) if chunks else np.zeros((0, self.dim), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
@@ -0,0 +1,237 @@
+# multi_agent/tools/statute_index.py
+
+import os
+import re
+import json
+from typing import Dict, List, Optional, Tuple
+
+TABLE_FORMAT_VERSION = 1
+ARTICLE_TABLE_FILENAME = "article_table.json"
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000, "万": 10000}
+_NUM = "0-9０-９零〇一二两三四五六七八九十百千万"
+
+# 结构标题：第X编 / 第X分编 / 第X章 / 第X节，以及不带序号的“附则”“序言”
+_HEADING = re.compile(rf"^第([{_NUM}]+)(编|分编|章|节)(?:[\s　]+(.*))?$")
+# 条文起始：第X条 / 第X条之一，条号与正文之间通常有全角空格，个别文件没有
+_ARTICLE = re.compile(rf"^第([{_NUM}]+)条(?:之([{_NUM}]+))?[\s　]*(.*)$")
+_LEVELS = ("part", "subpart", "chapter", "section")
+_LEVEL_OF = {"编": "part", "分编": "subpart", "章": "chapter", "节": "section"}
+_TITLE_PREFIX = "中华人民共和国"
+
+
+def chinese_to_int(text: str) -> Optional[int]:
+    """
+    中文数字 (或阿拉伯数字) 转整数，如 '四十七' -> 47、'一千零八十四' -> 1084、'1084' -> 1084。
+    无法解析时返回 None。
+    """
+    text = (text or "").strip().translate(str.maketrans("０１２３４５６７８９", "0123456789"))
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+    total, section, digit = 0, 0, None
+    for char in text:
+        if char in _CN_DIGITS:
+            digit = _CN_DIGITS[char]
+        elif char in _CN_UNITS:
+            unit = _CN_UNITS[char]
+            if unit == 10000:
+                total += (section + (digit or 0)) * unit
+                section = 0
+            else:
+                # “十五”中的“十”前面省略了“一”
+                section += (1 if digit is None else digit) * unit
+            digit = None
+        else:
+            return None
+    return total + section + (digit or 0)
+
+
+def int_to_chinese(number: int) -> str:
+    """整数转条文中使用的中文数字，如 47 -> '四十七'、1084 -> '一千零八十四'、10 -> '十'。"""
+    digits = "零一二三四五六七八九"
+    if number == 0:
+        return digits[0]
+    parts, zero_pending = [], False
+    for unit_value, unit in ((1000, "千"), (100, "百"), (10, "十"), (1, "")):
+        d = number // unit_value % 10
+        if d == 0:
+            zero_pending = bool(parts)
+            continue
+        if zero_pending:
+            parts.append("零")
+            zero_pending = False
+        parts.append(("" if (d == 1 and unit == "十" and not parts) else digits[d]) + unit)
+    return "".join(parts)
+
+
+def article_key(law: str, number: int, suffix: int = 0) -> str:
+    """条文查找表的键：'劳动合同法|47'，'之一'等附加条为 '刑法|17-1'。"""
+    return f"{law}|{number}" + (f"-{suffix}" if suffix else "")
+
+
+def article_label(number: int, suffix: int = 0) -> str:
+    return f"第{int_to_chinese(number)}条" + (f"之{int_to_chinese(suffix)}" if suffix else "")
+
+
+def short_law_name(title: str) -> str:
+    """'中华人民共和国劳动合同法' -> '劳动合同法'。"""
+    title = re.sub(r"[\s　《》]", "", title or "")
+    return title[len(_TITLE_PREFIX):] if title.startswith(_TITLE_PREFIX) else title
+
+
+def parse_statute(text: str, law: str) -> List[dict]:
+    """
+    把一部法律的全文解析为逐条记录。
+    识别 编/分编/章/节 结构 (目录中的标题会被正文中的同名标题覆盖)，每条记录包含所属层级与条号；
+    条号必须递增，正文段落开头偶然出现的“第X条……”会被视为上一条的续行。宪法等的“序言”作为单独一条记录 (无条号)。
+    :param text: 全文 (按段落换行)。
+    :param law: 法律简称，如 '劳动合同法'。
+    :return: [{"law", "part", "subpart", "chapter", "section", "number", "suffix", "label", "text"}]
+    """
+    records = []
+    hierarchy = dict.fromkeys(_LEVELS, "")
+    current = None
+    last_order = (0, 0)
+
+    def _flush():
+        if current and current["lines"]:
+            record = {k: v for k, v in current.items() if k != "lines"}
+            record["text"] = "\n".join(current["lines"])
+            records.append(record)
+
+    for raw_line in (text or "").splitlines():
+        line = raw_line.strip(" 　\t")
+        if not line:
+            continue
+        compact = re.sub(r"[\s　]", "", line)
+        heading = _HEADING.match(line)
+        if heading and chinese_to_int(heading.group(1)) is not None and len(line) <= 40:
+            level = _LEVEL_OF[heading.group(2)]
+            hierarchy[level] = re.sub(r"[\s　]+", " ", line)
+            for lower in _LEVELS[_LEVELS.index(level) + 1:]:
+                hierarchy[lower] = ""
+            continue
+        if compact == "附则":
+            hierarchy.update(dict.fromkeys(_LEVELS, ""), part="附则")
+            continue
+        if compact == "序言":
+            _flush()
+            current = dict(law=law, **hierarchy, number=None, suffix=0, label="序言", lines=[])
+            continue
+
+        article = _ARTICLE.match(line)
+        if article:
+            number = chinese_to_int(article.group(1))
+            suffix = chinese_to_int(article.group(2)) if article.group(2) else 0
+            if number is not None and suffix is not None and (number, suffix) > last_order:
+                _flush()
+                last_order = (number, suffix)
+                label = article_label(number, suffix)
+                body = article.group(3).strip()
+                current = dict(law=law, **hierarchy, number=number, suffix=suffix, label=label,
+                               lines=[f"{label}　{body}" if body else label])
+                continue
+        if current is not None:
+            current["lines"].append(line)
+    _flush()
+    return records
+
+
+def format_location(record: dict) -> str:
+    """条文所在位置，如 '劳动合同法 第四章 劳动合同的解除和终止 第四十七条'。"""
+    parts = [record.get("law", "")] + [record.get(level, "") for level in _LEVELS] + [record.get("label", "")]
+    return " ".join(p for p in parts if p)
+
+
+class ArticleTable:
+    """
+    (法律, 条号) -> 条文 的直接查找表，由建库脚本在 article 切分模式下生成 (docs/legal_db/article_table.json)。
+    LAS 遇到“劳动合同法第四十七条”这类明确引用时直接查表返回，不计算向量，也不调用 LLM。
+    """
+
+    def __init__(self, laws: Dict[str, dict] = None, articles: Dict[str, dict] = None):
+        self.laws = laws or {}            # 简称 -> {"title", "aliases"}
+        self.articles = articles or {}    # article_key -> 记录
+        self._citation_pattern = None
+
+    def __len__(self):
+        return len(self.articles)
+
+    def add_law(self, law: str, title: str, records: List[dict]):
+        """加入 (或替换) 一部法律的全部条文。"""
+        self.remove_law(law)
+        aliases = sorted({law, title, short_law_name(title)} - {""}, key=len, reverse=True)
+        self.laws[law] = {"title": title or law, "aliases": aliases}
+        for record in records:
+            if record.get("number") is not None:
+                self.articles[article_key(law, record["number"], record.get("suffix", 0))] = record
+        self._citation_pattern = None
+
+    def remove_law(self, law: str):
+        """移除一部法律的全部条文 (源文件已删除时)。"""
+        for key in [key for key in self.articles if key.split("|", 1)[0] == law]:
+            del self.articles[key]
+        self.laws.pop(law, None)
+        self._citation_pattern = None
+
+    def get(self, law: str, number: int, suffix: int = 0) -> Optional[dict]:
+        return self.articles.get(article_key(law, number, suffix))
+
+    def _pattern(self) -> re.Pattern:
+        if self._citation_pattern is None:
+            alias_to_law = {alias: law for law, info in self.laws.items() for alias in info["aliases"]}
+            self._alias_to_law = alias_to_law
+            # 长的别名优先，避免“中华人民共和国刑法”只匹配到“刑法”
+            aliases = "|".join(re.escape(a) for a in sorted(alias_to_law, key=len, reverse=True)) or "(?!)"
+            self._citation_pattern = re.compile(
+                rf"(?P<law>{aliases})|第\s*(?P<num>[{_NUM}]+)\s*条(?:之(?P<suffix>[{_NUM}]+))?"
+            )
+        return self._citation_pattern
+
+    def find_citations(self, query: str) -> List[Tuple[str, int, int]]:
+        """
+        从查询中提取明确的条文引用，如 '《劳动合同法》第四十七条和第八十七条' -> [('劳动合同法', 47, 0), ('劳动合同法', 87, 0)]。
+        未写法律名称的“第X条”沿用前面最近出现的法律；之前没有出现法律名称的条号会被忽略。
+        """
+        citations, current_law = [], None
+        for match in self._pattern().finditer(query or ""):
+            if match.group("law"):
+                current_law = self._alias_to_law[match.group("law")]
+                continue
+            number = chinese_to_int(match.group("num"))
+            suffix = chinese_to_int(match.group("suffix")) if match.group("suffix") else 0
+            if current_law and number is not None and suffix is not None:
+                citation = (current_law, number, suffix)
+                if citation not in citations:
+                    citations.append(citation)
+        return citations
+
+    def lookup(self, query: str) -> Tuple[List[dict], List[Tuple[str, int, int]]]:
+        """查询中引用的条文：(命中的记录, 未收录的引用)。"""
+        found, missing = [], []
+        for citation in self.find_citations(query):
+            record = self.get(*citation)
+            if record is None:
+                missing.append(citation)
+            else:
+                found.append(record)
+        return found, missing
+
+    # --- 持久化 ---
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": TABLE_FORMAT_VERSION, "laws": self.laws, "articles": self.articles}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ArticleTable":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != TABLE_FORMAT_VERSION:
+            raise ValueError(f"条文查找表版本不匹配 (文件: {data.get('version')}, 期望: {TABLE_FORMAT_VERSION})，请重新运行建库脚本。")
+        return cls(data.get("laws"), data.get("articles"))
@@ -0,0 +1,342 @@
+# multi_agent/tools/tool_chain.py
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from config import QUERY_REWRITE_ENABLED, LAS_KEYWORD_MAX_CHARS
+from tools import legal_tools
+from tools.deadline import current_deadline, submit_with_context
+from tools.llm_cache import cached_llm_invoke
+from tools.legal_tools import (
+    similar_case_matching,
+    legal_article_search_rag,
+    legal_charge_prediction,
+    legal_element_recognition,
+    legal_event_detection,
+    legal_text_summary,
+    web_search
+)
+
+# --- 工具缩写 -> 工具对象 (与协调员指令中的缩写保持一致) ---
+TOOL_REGISTRY = {
+    "SCM": similar_case_matching,
+    "LAS": legal_article_search_rag,
+    "LCP": legal_charge_prediction,
+    "LER": legal_element_recognition,
+    "LED": legal_event_detection,
+    "LTS": legal_text_summary,
+    "WEB": web_search,
+}
+
+# 各工具主文本参数的名称，以及需要显式传入的检索参数 (与工具执行专员 Agent Goal 中的约定一致)
+TOOL_INPUT_ARG = {"LCP": "case_details"}
+TOOL_EXTRA_KWARGS = {
+    "LAS": {"k": 3, "fetch_k": 10},
+    "SCM": {"k": 3},
+}
+
+# 工具类型：检索类工具的输出是证据而非查询，不会作为后续工具的输入；
+# 抽取类 (LER/LED/LTS) 工具之间互不依赖，均以用户原始提问为输入
+TOOL_KINDS = {
+    "LAS": "retrieval",
+    "SCM": "retrieval",
+    "WEB": "retrieval",
+    "LER": "extraction",
+    "LED": "extraction",
+    "LTS": "extraction",
+    "LCP": "prediction",
+}
+# 并发执行独立分支时的最大线程数
+TOOL_CHAIN_MAX_WORKERS = 4
+
+# 检索类工具的批量版本：上一步 (LCP / LER) 的输出可以拆成多条查询时，一次编码、一起检索 (WEB 为并发子查询)，并跨查询去重
+TOOL_BATCH_FUNCS = {
+    "LAS": legal_tools.legal_article_search_batch,
+    "SCM": legal_tools.similar_case_matching_batch,
+    "WEB": legal_tools.web_search_batch,
+}
+# 单次批量检索的最多查询数
+MAX_BATCH_QUERIES = 8
+_CHARGE_SEPARATOR = re.compile(r"[,，、;；/\n]|\s+(?:和|及|与)\s+")
+_ELEMENT_LINE = re.compile(r"^\s*[-*•]?\s*([^:：\n]{1,10})[:：]\s*(.+?)\s*$", re.M)
+_UNCLEAR = ("不明确", "无法", "未检测到")
+
+# 查询重写：位于分支第一步的 LAS / SCM 先把用户提问改写为结构化事实陈述 (与工具执行专员 Agent 的做法一致)
+REWRITE_TOOLS = ("LAS", "SCM")
+# 查询重写提示词的版本，修改提示词后请递增，以使 LLM 结果缓存中的旧条目失效
+QUERY_REWRITE_PROMPT_VERSION = "v1"
+# 明确引用了条文的提问保持原样，以便 LAS 直接查表
+_ARTICLE_REFERENCE = re.compile(r"第[一二三四五六七八九十百千零〇两\d]+条")
+
+TOOL_INSTRUCTION_MARKER = "使用工具回答"
+_ABBR_PATTERN = re.compile(r"[（(]\s*([A-Za-z]{2,4})\s*[)）]")
+_STEP_SEPARATOR = re.compile(r"\s*(?:->|→|＞|>)\s*")
+_OBSERVATION_TAG = re.compile(r"^\s*<(\w+)\s+status='(\w+)'>(.*)</\w+>\s*$", re.S)
+
+
+@dataclass
+class ToolObservation:
+    """工具链中单个步骤的执行记录。"""
+    abbr: str
+    tool_name: str
+    input_text: str
+    output: str
+    status: str
+    elapsed: float = 0.0
+
+
+@dataclass
+class ObservationBundle:
+    """一次工具链执行的结构化观察结果，交给回复整合专员使用。"""
+    instruction: str
+    steps: List[ToolObservation] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        """所有步骤耗时之和 (串行执行时的总耗时)。"""
+        return sum(step.elapsed for step in self.steps)
+
+    def to_prompt_text(self) -> str:
+        """渲染为回复整合专员可直接阅读的文本。"""
+        lines = [f"协调员指令: '{self.instruction}'", "工具执行结果 (Observation):"]
+        for i, step in enumerate(self.steps, 1):
+            lines.append(f"[步骤{i}] {step.tool_name} | 状态: {step.status}")
+            lines.append(step.output)
+        return "\n".join(lines)
+
+
+def parse_tool_chain(instruction: str) -> Optional[List[str]]:
+    """
+    解析协调员的工具链指令，例如 '使用工具回答: 法律要素识别(LER) > 罪名预测(LCP) > 法条检索(LAS)'。
+    :param instruction: 协调员输出的指令字符串。
+    :return: 工具缩写列表，例如 ['LER', 'LCP', 'LAS']；如果不是工具指令则返回 None。
+    """
+    text = (instruction or "").strip().strip("'\"`“”‘’ ")
+    if TOOL_INSTRUCTION_MARKER not in text:
+        return None
+    plan = re.split(r"[:：]", text.split(TOOL_INSTRUCTION_MARKER, 1)[1], maxsplit=1)[-1]
+    plan = plan.strip().strip("'\"`“”‘’ ")
+
+    chain = []
+    for segment in _STEP_SEPARATOR.split(plan):
+        segment = segment.strip()
+        if not segment:
+            continue
+        match = _ABBR_PATTERN.search(segment)
+        if match:
+            chain.append(match.group(1).upper())
+        elif segment.upper() in TOOL_REGISTRY:
+            chain.append(segment.upper())
+        else:
+            # 兼容只写中文名的情况，例如 '法条检索'
+            abbr = next((a for a, t in TOOL_REGISTRY.items() if segment and t.name.startswith(segment)), None)
+            chain.append(abbr or segment)
+    return chain
+
+
+def _unwrap_observation(output: str):
+    """从 '<LAS status='success'>...</LAS>' 形式的工具输出中取出状态和正文。"""
+    match = _OBSERVATION_TAG.match(output or "")
+    if not match:
+        return "unknown", (output or "").strip()
+    return match.group(2), match.group(3).strip()
+
+
+def _invoke_tool(abbr: str, input_text: str) -> str:
+    """直接调用 @tool 装饰的工具函数，绕过 Agent 的 ReAct 循环。"""
+    tool_obj = TOOL_REGISTRY[abbr]
+    kwargs = {TOOL_INPUT_ARG.get(abbr, "query"): input_text}
+    kwargs.update(TOOL_EXTRA_KWARGS.get(abbr, {}))
+    func = getattr(tool_obj, "func", None)
+    if func is not None:
+        return func(**kwargs)
+    return tool_obj.run(**kwargs)
+
+
+def split_queries(prev_abbr: str, text: str) -> List[str]:
+    """
+    把上一步的输出拆成多条检索查询：LCP 的多个罪名各为一条 (如 '盗窃罪,诈骗罪')，LER 的各个要素各为一条
+    (如 '客观方面: 撬门入室窃取笔记本电脑')。无法判断的项 ('不明确' 等) 会被丢弃；其他工具的输出不拆分。
+    """
+    if prev_abbr == "LCP":
+        parts = [p.strip(" 。.'\"“”") for p in _CHARGE_SEPARATOR.split(text or "")]
+    elif prev_abbr == "LER":
+        parts = [f"{label.strip()}: {value.strip()}" for label, value in _ELEMENT_LINE.findall(text or "")]
+    else:
+        return []
+    queries = [p for p in dict.fromkeys(parts) if p and not any(marker in p for marker in _UNCLEAR)]
+    return queries[:MAX_BATCH_QUERIES]
+
+
+def _depends_on_previous(prev_abbr: str, abbr: str) -> bool:
+    """判断当前步骤是否需要消费上一步的输出。"""
+    prev_kind, kind = TOOL_KINDS.get(prev_abbr), TOOL_KINDS.get(abbr)
+    if prev_kind is None or kind is None or prev_kind == "retrieval":
+        return False
+    if prev_kind == "extraction" and kind == "extraction":
+        return False
+    return True
+
+
+def plan_branches(chain: List[str]) -> List[List[int]]:
+    """
+    将工具链划分为互相独立的分支。同一分支内的步骤依次消费上一步的输出，不同分支可以并发执行。
+    例如 LER > LCP > LAS 是一个分支；LAS > SCM 是两个分支 (两者都以用户原始提问为输入)。
+    :param chain: 工具缩写列表。
+    :return: 分支列表，每个分支是步骤下标的列表。
+    """
+    branches = []
+    for i, abbr in enumerate(chain):
+        if i > 0 and _depends_on_previous(chain[i - 1], abbr):
+            branches[-1].append(i)
+        else:
+            branches.append([i])
+    return branches
+
+
+def _run_step(abbr: str, input_text: str, queries: List[str] = None) -> ToolObservation:
+    """执行单个工具步骤并记录耗时与状态。给定多条 queries 且工具有批量版本时，改用批量检索。"""
+    if abbr not in TOOL_REGISTRY:
+        print(f"⚠️ [工具链] 未知工具 '{abbr}'，跳过该分支的后续步骤。")
+        return ToolObservation(abbr, abbr, input_text, f"未找到名为 '{abbr}' 的工具。", "error")
+
+    start = time.perf_counter()
+    try:
+        if queries and len(queries) > 1 and abbr in TOOL_BATCH_FUNCS:
+            output = TOOL_BATCH_FUNCS[abbr](queries, **TOOL_EXTRA_KWARGS.get(abbr, {}))
+        else:
+            output = _invoke_tool(abbr, input_text)
+    except Exception as e:
+        output = f"<{abbr} status='error'>工具执行时发生内部错误: {e}</{abbr}>"
+    elapsed = time.perf_counter() - start
+
+    status, _ = _unwrap_observation(output)
+    print(f"--- [工具链] {TOOL_REGISTRY[abbr].name} 完成 | 状态: {status} | 耗时: {elapsed:.2f}s ---")
+    return ToolObservation(abbr, TOOL_REGISTRY[abbr].name, input_text, output, status, elapsed)
+
+
+def rewrite_retrieval_query(user_input: str) -> str:
+    """
+    将用户口语化的提问改写为包含当事人行为、争议焦点、涉及领域的结构化事实陈述，用作 LAS / SCM 的检索查询。
+    关键词式的短查询和明确引用条文的提问不改写；改写失败 (LLM 出错、超出时间预算或返回空) 时使用原始提问。
+    """
+    text = (user_input or "").strip()
+    if len(text) <= LAS_KEYWORD_MAX_CHARS or _ARTICLE_REFERENCE.search(text):
+        return user_input
+    prompt = f"""
+    作为一名精通中国法律的检索专家，请将下面[用户提问]改写为一段用于检索法条和类似案例的法律事实陈述。
+    [用户提问]: {text}
+    [改写要求]:
+    1. 保留当事人及其行为、金额、时间等关键事实，点明争议焦点和涉及的法律领域；
+    2. 保留提问中出现的法律名称和罪名原文，不要编造提问中没有的事实，不要给出法律意见；
+    3. 使用简洁的陈述句，不超过150字，只输出改写后的陈述本身。
+    """
+    try:
+        result = cached_llm_invoke("QRW", prompt, QUERY_REWRITE_PROMPT_VERSION)
+    except Exception as e:
+        print(f"⚠️ [工具链] 检索查询重写失败，使用原始提问: {e}")
+        return user_input
+    # 部分模型会输出 <think> 思考块，只保留其后的正文
+    rewritten = result.split("</think>")[-1].strip()
+    if not rewritten:
+        return user_input
+    print(f"--- [工具链] 检索查询重写: '{rewritten}' ---")
+    return rewritten
+
+
+def _branch_inputs(chain: List[str], branches: List[List[int]], user_input: str) -> List[str]:
+    """各分支第一步的输入：以 LAS / SCM 开头的分支使用重写后的查询 (只改写一次，各分支共用)，其余使用用户原始提问。"""
+    needs_rewrite = QUERY_REWRITE_ENABLED and any(chain[branch[0]] in REWRITE_TOOLS for branch in branches)
+    rewritten = rewrite_retrieval_query(user_input) if needs_rewrite else user_input
+    return [rewritten if chain[branch[0]] in REWRITE_TOOLS else user_input for branch in branches]
+
+
+def _run_branch(chain: List[str], branch: List[int], user_input: str, results: dict = None) -> dict:
+    """
+    顺序执行一个分支：第一步使用 user_input (用户原始提问，检索类开头的分支为重写后的查询)，后续步骤使用上一步 Observation 的正文。
+    出错 (或因时间预算被跳过) 即停止该分支。
+    检索类步骤接在 LCP / LER 之后时，上一步输出按罪名 / 要素拆成多条查询批量检索。
+    :param results: (可选) 写入步骤结果的字典；每完成一步即写入，超出时间预算时调用方可以取走已完成的部分。
+    """
+    results = {} if results is None else results
+    current_input = user_input
+    for position, index in enumerate(branch):
+        queries = split_queries(chain[branch[position - 1]], current_input) if position > 0 else None
+        step = _run_step(chain[index], current_input, queries)
+        results[index] = step
+        if step.status in ("error", "skipped"):
+            break
+        current_input = _unwrap_observation(step.output)[1]
+    return results
+
+
+def _prefetch_query_embedding(chain: List[str], branches: List[List[int]], inputs: List[str]):
+    """
+    在并发分支启动前预先编码各分支第一步的查询，使 LAS/SCM/LCP 等分支直接复用嵌入服务中的缓存向量，
+    避免多个分支同时未命中缓存而重复编码。
+    """
+    queries = [text for branch, text in zip(branches, inputs) if chain[branch[0]] in ("LAS", "SCM", "LCP")]
+    if not queries:
+        return
+    try:
+        legal_tools._initialize_embeddings()
+        if legal_tools.embeddings is not None:
+            legal_tools.embeddings.embed_queries(list(dict.fromkeys(queries)))
+    except Exception as e:
+        print(f"⚠️ [工具链] 预编码查询向量失败，将由各工具自行编码: {e}")
+
+
+def execute_tool_chain(chain: List[str], user_input: str, instruction: str = "") -> ObservationBundle:
+    """
+    按依赖关系执行工具链：互相独立的分支在线程池中并发执行，存在依赖的步骤 (如 LCP > LAS) 保持先后顺序。
+    整体耗时约等于最长分支的耗时，而不是所有步骤耗时之和。
+    :param chain: parse_tool_chain 返回的工具缩写列表。
+    :param user_input: 用户原始提问 (以 LAS / SCM 开头的分支先改写为结构化事实陈述，见 rewrite_retrieval_query)。
+    :param instruction: 原始协调员指令，仅用于记录。
+    :return: 结构化的 ObservationBundle，步骤顺序与指令中的顺序一致。
+    """
+    bundle = ObservationBundle(instruction=instruction)
+    branches = plan_branches(chain)
+    start = time.perf_counter()
+
+    results = {}
+    deadline = current_deadline()
+    inputs = _branch_inputs(chain, branches, user_input)
+    _prefetch_query_embedding(chain, branches, inputs)
+    if len(branches) == 1 and deadline is None:
+        results.update(_run_branch(chain, branches[0], inputs[0]))
+    elif deadline is None:
+        print(f"--- [工具链] 并发执行 {len(branches)} 个独立分支: {[[chain[i] for i in b] for b in branches]} ---")
+        with ThreadPoolExecutor(max_workers=min(len(branches), TOOL_CHAIN_MAX_WORKERS)) as pool:
+            futures = [pool.submit(_run_branch, chain, branch, text) for branch, text in zip(branches, inputs)]
+            for future in futures:
+                results.update(future.result())
+    else:
+        # 有时间预算时分支总在线程池中执行，最多等到工具阶段的预算用完；未完成的步骤记为超时，
+        # 回复整合只使用已完成的结果 (未完成的线程在后台结束，结果被丢弃)
+        if len(branches) > 1:
+            print(f"--- [工具链] 并发执行 {len(branches)} 个独立分支: {[[chain[i] for i in b] for b in branches]} ---")
+        shared = {}
+        pool = ThreadPoolExecutor(max_workers=min(len(branches), TOOL_CHAIN_MAX_WORKERS))
+        futures = [submit_with_context(pool, _run_branch, chain, branch, text, shared) for branch, text in zip(branches, inputs)]
+        _, pending = wait(futures, timeout=max(0.0, deadline.tool_time_left()))
+        pool.shutdown(wait=False)
+        for future in futures:
+            if future not in pending:
+                future.result()  # 与无时间预算时一致：分支内的异常向上抛出
+        results.update(shared)
+        if pending:
+            unfinished = [i for branch, future in zip(branches, futures) if future in pending for i in branch if i not in results]
+            deadline.degrade("工具链", f"超出时间预算，放弃未完成的步骤 {[chain[i] for i in unfinished]}，使用已完成的结果")
+            for i in unfinished:
+                abbr = chain[i]
+                name = TOOL_REGISTRY[abbr].name if abbr in TOOL_REGISTRY else abbr
+                results[i] = ToolObservation(abbr, name, "", f"<{abbr} status='timeout'>时间预算内未完成，已略过。</{abbr}>", "timeout")
+
+    bundle.steps = [results[i] for i in sorted(results)]
+    bundle.wall_time = time.perf_counter() - start
+    return bundle
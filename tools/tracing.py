@@ -0,0 +1,336 @@
+# multi_agent/tools/tracing.py
+
+import os
+import re
+import json
+import time
+import threading
+import contextvars
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from config import TRACING_ENABLED, TRACE_JSONL_PATH
+
+# span 类型：request (整轮请求)、task (Crew 工作流 / 其中的任务)、tool (工具)、llm (LLM 调用)、
+# embedding (查询编码)、vector_search (向量检索)、lexical_search (BM25)、web (网络搜索后端)
+
+# 耗时直方图的桶上界 (秒)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 错误信息写入 span 时的最大长度
+_ERROR_MAX_CHARS = 300
+_TOOL_STATUS = re.compile(r"^\s*<\w+\s+status='(\w+)'>")
+
+
+class Span:
+    """
+    一段计时区间。同一请求内的 span 共享 trace_id，并通过 parent_id 组成树；attrs 中记录检索数量、缓存命中、token 数等。
+    通常用 span(...) 上下文管理器创建，结束时 (end) 汇总到指标并写入 JSON Lines 文件。
+    """
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attrs", "start_time", "duration",
+                 "status", "error", "_start", "_lap", "_root", "_children")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"] = None, attrs: dict = None):
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attrs = dict(attrs or {})
+        self.start_time = time.time()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+        self._start = self._lap = time.perf_counter()
+        self._root = parent._root if parent is not None else self
+        self._children = []               # 仅根 span 使用：本轮所有已结束的子 span，用于打印耗时分解
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def add_tokens(self, prompt: int = None, completion: int = None) -> "Span":
+        """累加 token 数 (None 表示未知，不记录)。"""
+        if prompt is not None:
+            self.attrs["prompt_tokens"] = self.attrs.get("prompt_tokens", 0) + int(prompt)
+        if completion is not None:
+            self.attrs["completion_tokens"] = self.attrs.get("completion_tokens", 0) + int(completion)
+        return self
+
+    def fail(self, error) -> "Span":
+        self.status = "error"
+        self.error = (f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error))[:_ERROR_MAX_CHARS]
+        return self
+
+    def end(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if self._root is not self:
+            self._root._children.append(self)
+        _collector.record(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start_time, 6),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时返回的空 span：所有操作都不做任何事。"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        return self
+
+    def add_tokens(self, prompt=None, completion=None):
+        return self
+
+    def fail(self, error):
+        return self
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class MetricsRegistry:
+    """按 (kind, name) 汇总 span 的耗时直方图与错误数，按 (kind, name, 方向) 汇总 token 数，渲染为 Prometheus 文本格式。"""
+
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._durations = OrderedDict()   # (kind, name) -> [各桶计数..., 总数, 耗时之和]
+        self._errors = OrderedDict()      # (kind, name) -> 错误数
+        self._tokens = OrderedDict()      # (kind, name, 'prompt'/'completion') -> token 数
+
+    def observe(self, span: Span):
+        key = (span.kind, span.name)
+        with self._lock:
+            row = self._durations.get(key)
+            if row is None:
+                row = self._durations[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += span.duration
+            if span.status == "error":
+                self._errors[key] = self._errors.get(key, 0) + 1
+            for direction in ("prompt", "completion"):
+                tokens = span.attrs.get(f"{direction}_tokens")
+                if tokens:
+                    token_key = key + (direction,)
+                    self._tokens[token_key] = self._tokens.get(token_key, 0) + tokens
+
+    def render(self) -> str:
+        with self._lock:
+            durations = [(key, list(row)) for key, row in self._durations.items()]
+            errors = list(self._errors.items())
+            tokens = list(self._tokens.items())
+
+        lines = [
+            "# HELP legal_span_duration_seconds 各阶段 (任务、工具、LLM 调用、嵌入、检索) 的耗时",
+            "# TYPE legal_span_duration_seconds histogram",
+        ]
+        for (kind, name), row in durations:
+            labels = f'kind="{_escape(kind)}",name="{_escape(name)}"'
+            for bound, count in zip(self.buckets, row):
+                lines.append(f'legal_span_duration_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'legal_span_duration_seconds_bucket{{{labels},le="+Inf"}} {row[-2]}')
+            lines.append(f"legal_span_duration_seconds_sum{{{labels}}} {row[-1]:.6f}")
+            lines.append(f"legal_span_duration_seconds_count{{{labels}}} {row[-2]}")
+        lines += ["# HELP legal_span_errors_total 以错误结束的 span 数", "# TYPE legal_span_errors_total counter"]
+        for (kind, name), count in errors:
+            lines.append(f'legal_span_errors_total{{kind="{_escape(kind)}",name="{_escape(name)}"}} {count}')
+        lines += ["# HELP legal_llm_tokens_total LLM 调用消耗的 token 数", "# TYPE legal_llm_tokens_total counter"]
+        for (kind, name, direction), count in tokens:
+            lines.append(f'legal_llm_tokens_total{{kind="{_escape(kind)}",name="{_escape(name)}",type="{direction}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class JsonlExporter:
+    """把结束的 span 逐行追加到 JSON Lines 文件 (每行一个 span)。文件在第一次写入时打开，打开失败后不再尝试。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                if self._failed:
+                    return
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                except OSError as e:
+                    self._failed = True
+                    print(f"⚠️ [追踪] 无法打开 span 文件 '{self.path}'，只汇总指标: {e}")
+                    return
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+class _Collector:
+    def __init__(self, path: str):
+        self.metrics = MetricsRegistry()
+        self.exporter = JsonlExporter(path) if path else None
+
+    def record(self, span: Span):
+        self.metrics.observe(span)
+        if self.exporter is not None:
+            self.exporter.export(span)
+        if span._root is span and span._children:
+            print(f"⏱️ [追踪] {format_breakdown(span)}")
+
+
+_collector = _Collector(TRACE_JSONL_PATH)
+
+
+def format_breakdown(root: Span) -> str:
+    """根 span 的耗时分解：按 (类型, 名称) 累计各子 span 的耗时与次数 (并发执行的 span 会重叠计入)。"""
+    totals = OrderedDict()
+    for child in root._children:
+        entry = totals.setdefault((child.kind, child.name), [0.0, 0])
+        entry[0] += child.duration
+        entry[1] += 1
+    parts = [f"{kind}:{name} {secs:.2f}s" + (f" x{count}" if count > 1 else "") for (kind, name), (secs, count) in totals.items()]
+    return f"{root.name} 共 {root.duration:.2f}s | " + " | ".join(parts)
+
+
+def current_span():
+    """当前上下文中的 span；追踪关闭或不在任何 span 内时返回空 span (可以直接调用 set / add_tokens)。"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name: str, kind: str, **attrs):
+    """
+    创建一个以当前 span 为父节点、但不设为当前 span 的 span，需要调用方自行 end()。
+    用于生成器等跨越多次调用的区间 (其中不会再创建子 span)。追踪关闭时返回空 span。
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return Span(name, kind, _current_span.get(), attrs)
+
+
+def record_lap(name: str, kind: str, **attrs):
+    """
+    在当前 span 下补记一个已结束的子 span，区间从上一次 record_lap (或当前 span 开始) 到现在。
+    用于只在阶段结束时得到回调的场景，例如 Crew 的 task_callback。追踪关闭或不在 span 内时不做任何事。
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    now = time.perf_counter()
+    item = Span(name, kind, parent, attrs)
+    item.start_time -= now - parent._lap
+    item._start, parent._lap = parent._lap, now
+    item.end()
+
+
+@contextmanager
+def _span_scope(name: str, kind: str, attrs: dict):
+    item = Span(name, kind, _current_span.get(), attrs)
+    token = _current_span.set(item)
+    try:
+        yield item
+    except Exception as e:
+        item.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        item.end()
+
+
+def span(name: str, kind: str, **attrs):
+    """
+    with span("LAS", "tool", k=3) as s: ... —— 记录 with 块的耗时，块内创建的 span 成为其子节点，异常会记为错误。
+    名称应取自有限集合 (工具缩写、模板名等)，它会成为 Prometheus 指标的标签。追踪关闭时直接返回空 span。
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return _span_scope(name, kind, attrs)
+
+
+def traced(name: str, kind: str):
+    """函数装饰器版本的 span。追踪关闭时原样返回被装饰的函数，没有任何额外开销。"""
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span_scope(name, kind, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_tool(abbr: str):
+    """
+    工具函数的装饰器：记录 kind='tool' 的 span，并从 '<ABBR status='x'>' 形式的输出中取出状态；状态为 error 时记为错误。
+    放在 @tool 之下 (紧贴函数定义)，保留原函数的签名与文档字符串。
+    """
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span_scope(abbr, "tool", {}) as item:
+                output = fn(*args, **kwargs)
+                match = _TOOL_STATUS.match(output) if isinstance(output, str) else None
+                if match:
+                    item.set(status=match.group(1))
+                    if match.group(1) == "error":
+                        item.fail(output[match.end():match.end() + _ERROR_MAX_CHARS])
+                return output
+        return wrapper
+    return decorator
+
+
+def token_usage(message) -> tuple:
+    """
+    从 LangChain 消息中读取 (输入 token 数, 输出 token 数)，未知的一项为 None。
+    依次尝试 usage_metadata (标准字段)、Ollama 的 prompt_eval_count / eval_count 与 OpenAI 兼容接口的 token_usage。
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    meta = getattr(message, "response_metadata", None) or {}
+    if "prompt_eval_count" in meta or "eval_count" in meta:
+        return meta.get("prompt_eval_count"), meta.get("eval_count")
+    usage = meta.get("token_usage") or meta.get("usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+def render_metrics() -> str:
+    """Prometheus 文本格式的指标 (HTTP 服务的 GET /metrics)。"""
+    return _collector.metrics.render()
@@ -0,0 +1,122 @@
+# multi_agent/tools/warmup.py
+
+import os
+import time
+import threading
+import traceback
+
+from config import WARMUP_QUERY
+from tools import legal_tools
+
+# 预热状态: idle (未开始) -> running -> ready (全部成功) / degraded (部分组件不可用) / failed (预热过程出错)
+_state = {
+    "status": "idle",
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},      # 步骤名 -> {"ok": bool, "seconds": float, "error": str (可选)}
+}
+_state_lock = threading.Lock()
+_done = threading.Event()
+_thread = None
+
+
+def _record(step: str, ok: bool, seconds: float, error: str = None):
+    entry = {"ok": ok, "seconds": round(seconds, 3)}
+    if error:
+        entry["error"] = error
+    with _state_lock:
+        _state["steps"][step] = entry
+
+
+def _timed_step(step: str, fn) -> bool:
+    start = time.perf_counter()
+    try:
+        ok = fn() is not False
+        _record(step, ok, time.perf_counter() - start, None if ok else "组件不可用")
+        return ok
+    except Exception as e:
+        _record(step, False, time.perf_counter() - start, str(e))
+        print(f"⚠️ [预热] 步骤 '{step}' 失败: {e}")
+        return False
+
+
+def _warm_store(store_name: str):
+    """对向量库执行一次示例检索，使索引与底层存储被加载进内存。"""
+    store = getattr(legal_tools, store_name)
+    if store is None:
+        return False
+    store.similarity_search(WARMUP_QUERY, k=1)
+    return True
+
+
+def _run_warmup():
+    print("--- [预热] 后台加载嵌入模型与向量库 ---")
+    start = time.perf_counter()
+    try:
+        results = [
+            _timed_step("embeddings", lambda: legal_tools._initialize_embeddings() or legal_tools.embeddings is not None),
+            _timed_step("legal_store", lambda: legal_tools._initialize_legal_rag() or legal_tools.legal_vector_store is not None),
+            _timed_step("case_store", lambda: legal_tools._initialize_case_rag() or legal_tools.case_vector_store is not None),
+            _timed_step("legal_lexical", lambda: legal_tools._initialize_legal_lexical() or legal_tools.legal_lexical_index is not None),
+            # 条文查找表只在按条建库时存在，缺失不算降级
+            _timed_step("article_table", lambda: legal_tools._initialize_article_table() or legal_tools.article_table is not None
+                        or not os.path.exists(legal_tools.ARTICLE_TABLE_PATH)),
+        ]
+        # 示例查询：触发模型的首次前向计算 (CUDA 内核/线程池初始化) 与向量库索引加载
+        if legal_tools.embeddings is not None:
+            results.append(_timed_step("query_embedding", lambda: legal_tools.embeddings.embed_query(WARMUP_QUERY) and True))
+        results.append(_timed_step("legal_search", lambda: _warm_store("legal_vector_store")))
+        results.append(_timed_step("case_search", lambda: _warm_store("case_vector_store")))
+        status = "ready" if all(results) else "degraded"
+    except Exception as e:
+        print(f"❌ [预热] 发生未预期错误: {e}\n{traceback.format_exc()}")
+        status = "failed"
+    with _state_lock:
+        _state["status"] = status
+        _state["finished_at"] = time.time()
+    _done.set()
+    print(f"--- [预热] 完成，状态: {status}，耗时 {time.perf_counter() - start:.2f}s ---")
+
+
+def start_warmup(block: bool = False) -> dict:
+    """
+    启动后台预热 (幂等：重复调用不会重复加载)。
+    模型与向量库的初始化函数带锁，预热期间到达的工具调用会等待同一次加载完成，而不会重复加载。
+    :param block: 为 True 时等待预热完成再返回。
+    :return: 当前预热状态，见 warmup_status。
+    """
+    global _thread
+    with _state_lock:
+        if _thread is None:
+            _state["status"] = "running"
+            _state["started_at"] = time.time()
+            _thread = threading.Thread(target=_run_warmup, name="rag-warmup", daemon=True)
+            _thread.start()
+    if block:
+        _done.wait()
+    return warmup_status()
+
+
+def wait_until_ready(timeout: float = None) -> bool:
+    """等待预热结束 (无论成功与否)。预热未启动时立即返回 False。"""
+    if _thread is None:
+        return False
+    return _done.wait(timeout)
+
+
+def warmup_status() -> dict:
+    """返回预热状态的快照：status、各步骤耗时与错误、已运行秒数。"""
+    with _state_lock:
+        snapshot = {
+            "status": _state["status"],
+            "steps": {name: dict(entry) for name, entry in _state["steps"].items()},
+        }
+        if _state["started_at"] is not None:
+            end = _state["finished_at"] or time.time()
+            snapshot["elapsed"] = round(end - _state["started_at"], 3)
+    return snapshot
+
+
+def is_ready() -> bool:
+    """预热是否已结束 ('ready' 或 'degraded'：后者表示部分 RAG 组件不可用，相关工具会返回错误提示)。"""
+    return warmup_status()["status"] in ("ready", "degraded")
@@ -0,0 +1,278 @@
+# multi_agent/tools/web_search_service.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import importlib
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from tools.deadline import clamp_timeout, submit_with_context
+from tools.lexical_index import tokenize
+from tools.tracing import span
+
+# 进程内缓存的条目数上限 (持久化缓存不受此限制，按 max_stale 清理)
+WEB_CACHE_MEMORY_ENTRIES = 512
+# 写入多少次后清理一次超过 max_stale 的持久化条目
+_PRUNE_EVERY = 100
+
+
+def _normalize_result(item: dict) -> dict:
+    """统一为 {"title", "body", "href"}，兼容 duckduckgo_search 与本地替身的字段。"""
+    return {
+        "title": str(item.get("title") or ""),
+        "body": str(item.get("body") or item.get("snippet") or ""),
+        "href": str(item.get("href") or item.get("url") or item.get("link") or ""),
+    }
+
+
+class DuckDuckGoBackend:
+    """
+    duckduckgo_search 后端。每个线程复用同一个 DDGS 会话 (连接与 cookie 保持)，而不是每次调用都新建；
+    请求失败时丢弃该线程的会话，下次调用重建。timeout 为单次 HTTP 请求的超时秒数。
+    """
+    name = "duckduckgo"
+
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            from duckduckgo_search import DDGS
+            ddgs = self._local.ddgs = DDGS(timeout=max(1, int(round(self.timeout))))
+        return ddgs
+
+    def search(self, query: str, max_results: int) -> List[dict]:
+        try:
+            results = self._session().text(query, max_results=max_results)
+        except Exception:
+            self._local.ddgs = None
+            raise
+        return [_normalize_result(r) for r in results or []]
+
+
+class LocalBackend:
+    """
+    离线部署与测试用的本地替身：从 JSON 数组或 JSONL 文件读取 {"title", "body", "href"} 条目 (可选 "keywords")，
+    按查询与条目文本的词 (字符二元组) 重合度排序返回。文件在构造时读入，不访问网络。
+    """
+    name = "local"
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read().strip()
+        if text.startswith("["):
+            entries = json.loads(text)
+        else:
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+        self.path = path
+        self.entries = [
+            (_normalize_result(entry), set(tokenize(" ".join([entry.get("keywords", ""), entry.get("title", ""), entry.get("body", "")]))))
+            for entry in entries
+        ]
+
+    def search(self, query: str, max_results: int) -> List[dict]:
+        terms = set(tokenize(query))
+        scored = [(len(terms & tokens), i) for i, (_, tokens) in enumerate(self.entries)]
+        ranked = sorted((s for s in scored if s[0] > 0), key=lambda s: (-s[0], s[1]))
+        return [dict(self.entries[i][0]) for _, i in ranked[:max_results]]
+
+
+def create_backend(spec: str, local_path: str = None, timeout: float = 10):
+    """
+    按名称创建搜索后端：'duckduckgo'、'local' (读取 local_path)，
+    或 'package.module:factory' 形式的自定义后端 (factory 无参调用，返回带 name 属性与 search(query, max_results) 方法的对象)。
+    """
+    spec = (spec or "duckduckgo").strip()
+    if spec.lower() == "duckduckgo":
+        return DuckDuckGoBackend(timeout=timeout)
+    if spec.lower() == "local":
+        return LocalBackend(local_path)
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"未知的网络搜索后端 '{spec}' (可选 duckduckgo / local / package.module:factory)")
+    backend = getattr(importlib.import_module(module_name), attr)()
+    if not hasattr(backend, "name"):
+        backend.name = spec
+    return backend
+
+
+class WebResultCache:
+    """
+    网络搜索结果的两级缓存：进程内 LRU + 持久化 SQLite，键由 (后端名, 结果条数, 规范化查询) 计算。
+    条目在 ttl 内视为新鲜；过期但未超过 max_stale 的条目仍会保留，在搜索超时或失败时作为降级结果返回。
+    """
+
+    def __init__(self, path: str, ttl: float, max_stale: float, memory_entries: int = WEB_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self._conn = None
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS web_results (
+                    cache_key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            self._conn.commit()
+        except Exception as e:
+            print(f"⚠️ [WEB 缓存] 无法打开持久化缓存 '{path}'，仅使用进程内缓存: {e}")
+            self._conn = None
+
+    @staticmethod
+    def make_key(backend_name: str, max_results: int, query: str) -> str:
+        payload = "\x00".join([backend_name, str(max_results), " ".join(query.split()).lower()])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, allow_stale: bool = False):
+        """
+        :return: (结果列表, 缓存时长秒数)；没有可用条目时返回 None。
+                 allow_stale=False 只返回 ttl 内的条目，True 时返回 max_stale 内的任意条目。
+        """
+        limit = self.max_stale if allow_stale else self.ttl
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT results, created_at FROM web_results WHERE cache_key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+            if entry is None:
+                return None
+            age = time.time() - entry[1]
+            if age > limit:
+                return None
+            self._memory.move_to_end(key)
+            return entry[0], age
+
+    def put(self, key: str, query: str, results: List[dict]):
+        entry = (results, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO web_results (cache_key, query, results, created_at) VALUES (?, ?, ?, ?)",
+                (key, query, json.dumps(results, ensure_ascii=False), entry[1])
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM web_results WHERE created_at < ?", (time.time() - self.max_stale,))
+            self._conn.commit()
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+@dataclass
+class WebHits:
+    """
+    单条查询的网络搜索结果。
+    source: live (实时搜索) / cache (新鲜缓存) / stale (超时或失败，退回过期缓存) / timeout (超时且无缓存) / error (失败且无缓存)。
+    """
+    query: str
+    source: str = "live"
+    results: List[dict] = field(default_factory=list)
+    age: float = 0.0                  # 缓存结果的时长 (秒)
+    error: Optional[str] = None
+
+
+class WebSearchService:
+    """
+    带缓存、截止时间与并发子查询的网络搜索服务。
+    同一批查询中未命中缓存的部分在线程池中并发执行；到达截止时间时立即返回：已完成的用实时结果，
+    未完成的退回过期缓存 (没有则标记超时)。超时的请求在后台继续执行，完成后仍会写入缓存，供后续调用使用；
+    同一查询已有请求在途时不会重复发起。
+    """
+
+    def __init__(self, backend, cache: Optional[WebResultCache] = None, deadline: float = 8.0, max_workers: int = 4):
+        self.backend = backend
+        self.cache = cache
+        self.deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="web-search")
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.stats = defaultdict(int)
+
+    def _fetch(self, key: str, query: str, max_results: int) -> List[dict]:
+        try:
+            with span(self.backend.name, "web", max_results=max_results):
+                results = self.backend.search(query, max_results)
+            if self.cache is not None:
+                self.cache.put(key, query, results)
+            return results
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _submit(self, key: str, query: str, max_results: int):
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = submit_with_context(self._pool, self._fetch, key, query, max_results)
+            return future
+
+    def _fallback(self, hits: WebHits, key: str, source: str, error: str):
+        stale = self.cache.get(key, allow_stale=True) if self.cache is not None else None
+        if stale is not None:
+            hits.source, (hits.results, hits.age) = "stale", stale
+        else:
+            hits.source = source
+        hits.error = error
+
+    def search_many(self, queries: List[str], max_results: int = 3, deadline: float = None) -> List[WebHits]:
+        """
+        :param deadline: 本次调用最多等待的秒数，默认使用构造时的 deadline；还会被限制在当前请求剩余的时间预算内。
+        :return: 与 queries 顺序一致的 WebHits 列表。
+        """
+        deadline = clamp_timeout(self.deadline if deadline is None else deadline)
+        start = time.perf_counter()
+        hits = [WebHits(query) for query in queries]
+        keys = [WebResultCache.make_key(self.backend.name, max_results, query) for query in queries]
+        pending = {}
+        for item, key in zip(hits, keys):
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                item.source, (item.results, item.age) = "cache", cached
+            else:
+                pending[key] = self._submit(key, item.query, max_results)
+
+        if pending:
+            wait(list(pending.values()), timeout=max(0.0, deadline - (time.perf_counter() - start)))
+        for item, key in zip(hits, keys):
+            future = pending.get(key)
+            if future is None:
+                continue
+            if not future.done():
+                self._fallback(item, key, "timeout", f"超过 {deadline:g}s 未返回")
+            elif future.exception() is not None:
+                self._fallback(item, key, "error", str(future.exception()))
+            else:
+                item.results = future.result()
+        for item in hits:
+            self.stats[item.source] += 1
+        return hits
+
+    def search(self, query: str, max_results: int = 3, deadline: float = None) -> WebHits:
+        return self.search_many([query], max_results, deadline)[0]
@@ -0,0 +1,148 @@
+# multi_agent/workflow/answer_cleaning.py
+
+# --- 最终回复的清理规则 (原 main.py 中的清理逻辑，供整段清理和流式清理共用) ---
+PREFIXES_TO_REMOVE = [
+    "根据协调员的决策指令，我需要进行澄清。", "根据协调员的决策指令\"需要澄清\"，我将进一步询问用户以获取更多信息。",
+    "协调员，您需要我澄清什么具体信息吗？请提供更多细节，以便我能够更好地帮助您。", "根据协调员的决策指令，需要进行澄清。",
+    "根据协调员的决策指令，我需要", "根据协调员的决策指令 ",
+    "为了更好地理解用户的问题，我需要进一步了解以下信息：", "为了更好地理解您的问题，我需要进一步了解以下信息：",
+    "为了更好地帮助您，我需要了解以下信息：", "为了更好地帮助您，请您提供以下信息：",
+    "进行澄清。",
+]
+FALLBACK_CLARIFICATION = "为了更好地帮助您，请您提供更多关于情况的细节。"
+_QUESTION_KEYWORDS = ["为了更好", "请问", "能否提供", "需要了解", "请您提供", "什么信息", "哪些细节"]
+
+_THINK_OPEN, _THINK_CLOSE = "<think>", "</think>"
+_THOUGHT_MARKER, _FINAL_MARKER = "Thought:", "Final Answer:"
+
+
+def clean_final_answer(final_answer: str) -> str:
+    """
+    对整段最终回复做清理：移除“根据协调员的决策指令…”等前缀，清理后为空时回退到原文或通用澄清语。
+    :param final_answer: 回复整合专员的原始输出。
+    :return: 面向用户的纯净回复。
+    """
+    # --- 改进的清理逻辑 (移除了正则表达式部分) ---
+    cleaned_answer = final_answer
+    original_cleaned_answer_before_any_cleaning = cleaned_answer
+    for prefix in PREFIXES_TO_REMOVE:
+        # 前缀移除逻辑保持不变 (这部分不使用正则表达式)
+        if cleaned_answer.strip().startswith(prefix):
+            prefix_len = len(prefix)
+            cleaned_answer = cleaned_answer[cleaned_answer.find(prefix) + prefix_len:].strip()
+            cleaned_answer = cleaned_answer.lstrip('，').lstrip(':：').lstrip()
+            print(f"  移除了前缀 '{prefix[:30]}...'")
+            break
+
+    if not cleaned_answer.strip():
+        if any(kw in original_cleaned_answer_before_any_cleaning for kw in _QUESTION_KEYWORDS):
+            print("  ⚠️ 清理后结果为空，但原始输出似乎包含有效问题，尝试回退并仅移除首要前缀。")
+            cleaned_answer = original_cleaned_answer_before_any_cleaning
+            possible_prefixes = [
+                "根据协调员的决策指令，我需要进行澄清。", "为了更好地理解用户的问题，我需要进一步了解以下信息："
+            ]
+            restored = False
+            for pp in possible_prefixes:
+                if cleaned_answer.startswith(pp):
+                    cleaned_answer = cleaned_answer[len(pp):].strip().lstrip(':：').lstrip()
+                    if cleaned_answer.strip():
+                        restored = True
+                        break
+            if not restored or not cleaned_answer.strip():
+                cleaned_answer = FALLBACK_CLARIFICATION
+        else:
+            cleaned_answer = FALLBACK_CLARIFICATION
+    # --- 清理逻辑结束 ---
+    return cleaned_answer
+
+
+class StreamingAnswerCleaner:
+    """
+    流式版本的回复清理器：逐块接收 LLM 输出，只在能够确定不属于需移除内容时才放行文本。
+    依次处理：<think>...</think> 思考块 -> 'Thought: ... Final Answer:' 标签 -> PREFIXES_TO_REMOVE 前缀。
+    前缀判定完成后，后续文本直接透传，因此首个 token 的延迟只增加几个字符的缓冲。
+    """
+
+    def __init__(self, prefixes: list = None):
+        self.prefixes = prefixes or PREFIXES_TO_REMOVE
+        self._stage = "think"       # think -> react -> prefix -> passthrough
+        self._pending = ""
+        self._strip_leading = True  # 放行前去除开头的空白、引号及 '，:：'
+        self._raw_parts = []
+        self._emitted_parts = []
+
+    @property
+    def raw_text(self) -> str:
+        return "".join(self._raw_parts)
+
+    @property
+    def emitted_text(self) -> str:
+        return "".join(self._emitted_parts)
+
+    def feed(self, chunk: str) -> str:
+        """输入一块原始输出，返回此刻可以安全展示给用户的文本 (可能为空字符串)。"""
+        if not chunk:
+            return ""
+        self._raw_parts.append(chunk)
+        self._pending += chunk
+        return self._advance(final=False)
+
+    def finish(self) -> str:
+        """输入结束，返回剩余可展示的文本。若整段回复清理后为空，回退到整段清理的结果。"""
+        tail = self._advance(final=True)
+        if not (self.emitted_text + tail).strip():
+            tail = clean_final_answer(self.raw_text.split(_THINK_CLOSE)[-1].strip())
+            self._emitted_parts.append(tail)
+        return tail
+
+    def _emit(self, text: str) -> str:
+        if self._strip_leading:
+            text = text.lstrip().lstrip("'").lstrip('，').lstrip(':：').lstrip()
+            if not text:
+                return ""
+            self._strip_leading = False
+        self._emitted_parts.append(text)
+        return text
+
+    def _advance(self, final: bool) -> str:
+        if self._stage == "think":
+            head = self._pending.lstrip()
+            if not head and not final:
+                return ""
+            if head.startswith(_THINK_OPEN):
+                if _THINK_CLOSE not in head:
+                    if final:
+                        self._pending = ""
+                    return ""
+                self._pending = head.split(_THINK_CLOSE, 1)[1]
+            elif _THINK_OPEN.startswith(head) and not final:
+                return ""
+            self._stage = "react"
+
+        if self._stage == "react":
+            head = self._pending.lstrip()
+            if not head and not final:
+                return ""
+            if head.startswith(_THOUGHT_MARKER) or head.startswith(_FINAL_MARKER):
+                if _FINAL_MARKER not in head:
+                    if not final:
+                        return ""
+                else:
+                    self._pending = head.split(_FINAL_MARKER, 1)[1]
+            elif not final and (_THOUGHT_MARKER.startswith(head) or _FINAL_MARKER.startswith(head)):
+                return ""
+            self._stage = "prefix"
+
+        if self._stage == "prefix":
+            head = self._pending.lstrip()
+            if not final and (not head or any(p.startswith(head) and p != head for p in self.prefixes)):
+                return ""
+            for prefix in self.prefixes:
+                if head.startswith(prefix):
+                    head = head[len(prefix):]
+                    break
+            self._pending = head
+            self._stage = "passthrough"
+
+        text, self._pending = self._pending, ""
+        return self._emit(text)
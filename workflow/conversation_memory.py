@@ -0,0 +1,251 @@
+# multi_agent/workflow/conversation_memory.py
+
+import re
+import threading
+from collections import OrderedDict
+
+from config import (
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_RECENT_TURNS,
+    MEMORY_ENTRY_MAX_TOKENS,
+    MEMORY_SUMMARY_MAX_TOKENS,
+    MEMORY_SUMMARY_MODE,
+)
+from tools.llm_cache import cached_llm_invoke
+
+SUMMARY_PROMPT_VERSION = "v1"
+FACTS_PER_KIND = 6      # 每类关键事实最多保留的条数 (保留最近出现的)
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+# --- 关键事实抽取规则 (只从用户发言中抽取，AI 回复中的金额/日期多为法条内容，不属于案情) ---
+_FACT_PATTERNS = OrderedDict([
+    ("当事人", re.compile(
+        r"(?:[一-鿿]{2,12}(?:有限责任公司|股份有限公司|有限公司|公司|银行|医院|学校))"
+        r"|(?:[一-鿿](?:某某|某)(?:某)?)"
+        r"|(?:[一-鿿](?:先生|女士))"
+        r"|(?:原告|被告|甲方|乙方|出借人|借款人|房东|租客|雇主|用人单位|老板|前夫|前妻|丈夫|妻子|邻居|开发商|物业)"
+    )),
+    ("金额", re.compile(
+        r"(?:\d+(?:[,，]\d{3})*(?:\.\d+)?\s*(?:多|余)?\s*(?:万|千|百|亿)?\s*(?:元|块钱|块|人民币))"
+        r"|(?:[一二两三四五六七八九十百千万亿]+\s*(?:多|余)?\s*(?:元|块钱|块))"
+    )),
+    ("日期", re.compile(
+        r"(?:\d{4}\s*年\s*\d{1,2}\s*月(?:\s*\d{1,2}\s*[日号])?)"
+        r"|(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2})"
+        r"|(?:\d{1,2}\s*月\s*\d{1,2}\s*[日号])"
+        r"|(?:\d{4}\s*年)"
+    )),
+])
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数：中文字符按 1 个 token 计，其余字符按 4 个字符 1 个 token 计。
+    只用于预算控制，不需要与具体分词器完全一致。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    按估算 token 数截断文本。
+    :param keep: 'head' 保留开头，'tail' 保留结尾。被截去的部分以 '…' 表示。
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    # 逐步收缩，直到估算值落入预算 (文本通常较短，二分即可)
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        piece = text[:mid] if keep == "head" else text[len(text) - mid:]
+        if estimate_tokens(piece) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…" if keep == "head" else "…" + text[len(text) - low:]
+
+
+def extract_facts(entries: list) -> dict:
+    """
+    从对话条目中抽取关键事实 (当事人、金额、日期)，按首次出现顺序去重。
+    :param entries: 对话条目列表 (例如 ["User: xxx", "AI: yyy", ...])，只处理用户发言。
+    :return: {类别: [事实, ...]}
+    """
+    facts = OrderedDict((kind, []) for kind in _FACT_PATTERNS)
+    for entry in entries:
+        if not entry.startswith("User:"):
+            continue
+        for kind, pattern in _FACT_PATTERNS.items():
+            for match in pattern.findall(entry):
+                value = re.sub(r"\s+", "", match)
+                if value and value not in facts[kind]:
+                    facts[kind].append(value)
+    return facts
+
+
+class ConversationMemory:
+    """
+    带 token 预算的对话记忆，为 Agent 生成有界的对话历史视图：
+    - 最近 N 轮对话原样保留 (过长的单条会被截断)；
+    - 更早的对话被增量合并进一段滚动摘要 (LLM 摘要，失败时回退到抽取式摘要)，每条对话只会被合并一次；
+    - 从用户发言中抽取的关键事实 (当事人、金额、日期) 始终置顶，不会因摘要而丢失。
+    历史较短、能完整放入预算时，视图与原始历史完全相同。
+    每个会话持有一个实例；传入的历史应只在末尾追加，否则摘要状态会被重置。
+    """
+
+    def __init__(self, token_budget: int = MEMORY_TOKEN_BUDGET, recent_turns: int = MEMORY_RECENT_TURNS,
+                 entry_max_tokens: int = MEMORY_ENTRY_MAX_TOKENS, summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS,
+                 summary_mode: str = MEMORY_SUMMARY_MODE):
+        self.token_budget = token_budget
+        self.recent_entries = max(1, recent_turns * 2)
+        self.entry_max_tokens = entry_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_mode = summary_mode
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空摘要与关键事实。"""
+        self.summary = ""
+        self.facts = OrderedDict((kind, []) for kind in _FACT_PATTERNS)
+        self._summarized = []   # 已合并进摘要的条目 (用于检测历史是否被改写)
+        self._fact_scanned = 0  # 已抽取过事实的条目数
+
+    # --- 对外接口 ---
+    def render(self, history_list: list) -> str:
+        """
+        生成传给 Agent 的对话历史视图。
+        :param history_list: 完整对话历史 (最后一条通常是用户当前提问)。
+        :return: 不超过 token 预算 (估算值) 的历史文本 (关键事实与摘要的上限本身超出预算的配置除外)。
+        """
+        with self._lock:
+            entries = list(history_list or [])
+            if entries[:len(self._summarized)] != self._summarized or len(entries) < self._fact_scanned:
+                print("ℹ️ [对话记忆] 对话历史与已有摘要不一致，重置记忆。")
+                self.reset()
+
+            self._update_facts(entries)
+            full_text = "\n".join(entries)
+            if not self._summarized and estimate_tokens(full_text) <= self.token_budget:
+                return full_text
+
+            boundary = self._fold_boundary(entries)
+            if boundary > len(self._summarized):
+                self._fold(entries[len(self._summarized):boundary])
+            view = self._compose(entries[boundary:])
+            print(f"🧠 [对话记忆] 历史 {len(entries)} 条 (约 {estimate_tokens(full_text)} tokens) -> "
+                  f"视图约 {estimate_tokens(view)} tokens，已摘要 {len(self._summarized)} 条")
+            return view
+
+    # --- 内部实现 ---
+    def _update_facts(self, entries: list):
+        new_facts = extract_facts(entries[self._fact_scanned:])
+        self._fact_scanned = len(entries)
+        for kind, values in new_facts.items():
+            kept = self.facts[kind]
+            for value in values:
+                if value in kept:
+                    kept.remove(value)
+                kept.append(value)
+            del kept[:-FACTS_PER_KIND]
+
+    def _facts_text(self) -> str:
+        lines = [f"- {kind}: {'、'.join(values)}" for kind, values in self.facts.items() if values]
+        return "\n".join(lines)
+
+    def _clip_entry(self, entry: str) -> str:
+        return truncate_to_tokens(entry, self.entry_max_tokens)
+
+    def _fold_boundary(self, entries: list) -> int:
+        """
+        计算摘要与原样保留部分的分界下标：最近 N 轮原样保留，若仍超出预算则继续把较早的条目并入摘要。
+        最后一条 (当前提问) 总是保留，过长时与其他条目一样截断 (完整提问另以 {user_input} 传给任务)；
+        分界只会向后移动，已摘要的条目不会再次出现。
+        """
+        boundary = max(len(self._summarized), len(entries) - self.recent_entries)
+        reserved = estimate_tokens(self._facts_text()) + self.summary_max_tokens + 20
+        recent_budget = max(0, self.token_budget - reserved)
+        used = 0
+        for index in range(len(entries) - 1, boundary - 1, -1):
+            used += estimate_tokens(self._clip_entry(entries[index]))
+            if used > recent_budget and index < len(entries) - 1:
+                return index + 1
+        return min(boundary, len(entries) - 1) if entries else 0
+
+    def _fold(self, new_entries: list):
+        """把新滑出窗口的条目增量合并进摘要。"""
+        if not new_entries:
+            return
+        summary = None
+        if self.summary_mode == "llm":
+            try:
+                summary = self._llm_summary(new_entries)
+            except Exception as e:
+                print(f"⚠️ [对话记忆] LLM 摘要失败，回退到抽取式摘要: {e}")
+        if not summary:
+            summary = self._extractive_summary(new_entries)
+        # 超出上限时优先整行丢弃最早的内容，仍超出时再截断
+        lines = summary.split("\n")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+        self.summary = truncate_to_tokens("\n".join(lines), self.summary_max_tokens, keep="tail")
+        self._summarized.extend(new_entries)
+
+    def _llm_summary(self, new_entries: list) -> str:
+        prompt = f"""
+        你是一名法律咨询记录员。请将“已有摘要”与“新增对话”合并为一段新的对话摘要。
+        要求：
+        1. 保留当事人、金额、日期、地点、用户的诉求，以及已经给出的法律意见要点；
+        2. 不要编造对话中没有的信息，不要给出新的法律意见；
+        3. 使用简洁的中文陈述句，总长度不超过 {self.summary_max_tokens} 字；
+        4. 只输出摘要正文，不要包含标题或任何解释。
+
+        已有摘要：
+        {self.summary or "无"}
+
+        新增对话：
+        {chr(10).join(self._clip_entry(entry) for entry in new_entries)}
+        """
+        result = cached_llm_invoke("MEM", prompt, SUMMARY_PROMPT_VERSION)
+        # 部分模型会输出 <think> 思考块，只保留其后的正文
+        return result.split("</think>")[-1].strip()
+
+    def _extractive_summary(self, new_entries: list) -> str:
+        """不调用 LLM 的摘要：每条对话只保留开头一句。"""
+        lines = [self.summary] if self.summary else []
+        for entry in new_entries:
+            speaker, _, content = entry.partition(":")
+            first_sentence = re.split(r"(?<=[。！？!?\n])", content.strip(), maxsplit=1)[0]
+            lines.append(f"{speaker.strip()}: {truncate_to_tokens(first_sentence.strip(), 60)}")
+        return "\n".join(lines)
+
+    def _compose(self, recent_entries: list) -> str:
+        sections = []
+        facts_text = self._facts_text()
+        if facts_text:
+            sections.append(f"【关键事实】\n{facts_text}")
+        if self.summary:
+            sections.append(f"【早先对话摘要】\n{self.summary}")
+        clipped = [self._clip_entry(entry) for entry in recent_entries]
+        if clipped:
+            # 当前提问只能使用其余部分剩下的预算 (按各部分估算值之和计，换行各算 1 个 token，不会低估)
+            used = sum(estimate_tokens(section) + 1 for section in sections) + estimate_tokens("【最近对话】") + 1
+            used += sum(estimate_tokens(entry) + 1 for entry in clipped[:-1])
+            clipped[-1] = truncate_to_tokens(clipped[-1], max(0, self.token_budget - used))
+        sections.append("【最近对话】\n" + "\n".join(clipped))
+        return "\n".join(sections)
+
+
+def render_history(history_list: list, memory: ConversationMemory = None) -> str:
+    """
+    生成传给 Agent 的对话历史视图。未提供会话记忆时使用一次性的抽取式记忆 (不调用 LLM)。
+    """
+    if memory is None:
+        memory = ConversationMemory(summary_mode="extractive")
+    return memory.render(history_list)
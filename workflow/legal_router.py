@@ -0,0 +1,200 @@
+# multi_agent/workflow/legal_router.py
+
+import re
+import math
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+from config import ROUTER_MODE, WARMUP_ENABLED
+
+# --- 协调员的四种标准指令 ---
+INSTRUCTION_CLARIFY = "需要澄清"
+INSTRUCTION_DIRECT = "无需工具直接回答"
+INSTRUCTION_END = "生成结束语"
+TOOL_INSTRUCTION_PREFIX = "使用工具回答: "
+
+# --- 分类器阈值：最高相似度需超过阈值，且领先第二名标签足够多，才视为“有把握” ---
+CLASSIFIER_MIN_SIMILARITY = 0.86
+CLASSIFIER_MIN_MARGIN = 0.04
+
+# --- 规则定义 (按顺序匹配，先命中者生效) ---
+_EXIT_PATTERN = re.compile(r"^(好的)?[，,]?(谢谢|多谢|感谢|再见|拜拜|没有了|没有其他问题了?|不用了|就这样吧?)(你|您)?(的帮助)?[。！!.～~]*$")
+_ARTICLE_PATTERN = re.compile(r"第[一二三四五六七八九十百千零〇两\d]+条")
+_CHARGE_PATTERN = re.compile(r"(构成|算|属于|涉嫌|犯了?|定|判)(了)?(什么|哪个|哪种|何种|啥)(罪名|罪|犯罪)|什么罪名|是否(构成|涉嫌).{0,8}罪")
+_WEB_PATTERN = re.compile(r"(最新|最近|今年|近期).{0,10}(修正案|修订|司法解释|出台|颁布|新规)")
+
+# --- 分类器的标注样例 (取自协调员 Agent Goal 中的典型问法) ---
+LABELLED_EXAMPLES = {
+    f"{TOOL_INSTRUCTION_PREFIX}法条检索(LAS) > 相似案例查找(SCM)": [
+        "请问《民法典》第一千零八十四条具体规定了什么？",
+        "我涉及家暴、百万财产分割、子女抚养的离婚纠纷，需要相关法律依据和类似案例。",
+        "公司拖欠我三个月工资，有什么法律规定可以维权，有没有类似的判例？",
+        "房东不退押金，法律上怎么规定的，有类似案例吗？",
+    ],
+    f"{TOOL_INSTRUCTION_PREFIX}罪名预测(LCP)": [
+        "我上司收受贿赂100万，这算什么罪？",
+        "他贪污贿赂200万。",
+        "朋友偷了别人的电动车，会被定什么罪？",
+        "在网上骗了别人五万块钱，构成什么犯罪？",
+    ],
+    f"{TOOL_INSTRUCTION_PREFIX}法律要素识别(LER)": [
+        "请帮我分析一下这个案件的犯罪构成要素。",
+        "帮我分析这段案情的主体、客体、主观方面和客观方面。",
+    ],
+    f"{TOOL_INSTRUCTION_PREFIX}法律事件检测(LED)": [
+        "请看看这段描述里包含哪些法律事件。",
+        "这段对话记录里涉及哪些法律程序？",
+    ],
+    f"{TOOL_INSTRUCTION_PREFIX}法律文本摘要(LTS)": [
+        "请帮我总结一下这份合同的主要内容。",
+        "帮我把这份判决书概括一下。",
+    ],
+    f"{TOOL_INSTRUCTION_PREFIX}互联网搜索(WEB)": [
+        "最近的离婚法修正案是什么？",
+        "最高人民法院关于P2P的最新司法解释是什么？",
+    ],
+    INSTRUCTION_DIRECT: [
+        "法定结婚年龄是多少岁？",
+        "什么是诉讼时效？",
+        "未成年人的年龄标准是多少？",
+    ],
+    INSTRUCTION_CLARIFY: [
+        "我想咨询一个法律问题。",
+        "我遇到点麻烦，怎么办？",
+        "能帮帮我吗？",
+    ],
+}
+
+_example_vectors = None  # [(指令, 向量, 模长), ...]，首次分类时计算
+_example_vectors_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """快速路由的判定结果。"""
+    instruction: str
+    source: str        # 命中来源，例如 'rule:article' 或 'classifier'
+    confidence: float
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text or "").strip("'\"“”")
+
+
+def _match_rules(text: str) -> Optional[RouteDecision]:
+    """关键词/正则规则匹配。"""
+    if _EXIT_PATTERN.match(text) or text.lower() in ("exit", "quit", "bye"):
+        return RouteDecision(INSTRUCTION_END, "rule:exit", 1.0)
+    if _ARTICLE_PATTERN.search(text):
+        return RouteDecision(f"{TOOL_INSTRUCTION_PREFIX}法条检索(LAS)", "rule:article", 1.0)
+    if _CHARGE_PATTERN.search(text):
+        return RouteDecision(f"{TOOL_INSTRUCTION_PREFIX}罪名预测(LCP)", "rule:charge", 1.0)
+    if _WEB_PATTERN.search(text):
+        return RouteDecision(f"{TOOL_INSTRUCTION_PREFIX}互联网搜索(WEB)", "rule:web", 1.0)
+    return None
+
+
+def _cosine(a: List[float], norm_a: float, b: List[float], norm_b: float) -> float:
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return sum(x * y for x, y in zip(a, b)) / (norm_a * norm_b)
+
+
+def _get_embeddings():
+    """
+    复用工具模块中共享的嵌入模型，但不在请求线程上触发加载：
+    模型尚未加载或后台预热尚未结束时返回 None (回退到 LLM 协调员)，避免首个问题等待模型加载或阻塞在初始化锁上。
+    """
+    from tools import legal_tools
+    from tools.warmup import is_ready
+    if legal_tools.embeddings is None or (WARMUP_ENABLED and not is_ready()):
+        return None
+    return legal_tools.embeddings
+
+
+def _load_example_vectors(embeddings) -> list:
+    global _example_vectors
+    if _example_vectors is None:
+        with _example_vectors_lock:
+            # 双重检查：并发的首批请求只有一个会编码标注样例
+            if _example_vectors is None:
+                labels, texts = [], []
+                for instruction, examples in LABELLED_EXAMPLES.items():
+                    labels.extend([instruction] * len(examples))
+                    texts.extend(examples)
+                vectors = embeddings.embed_documents(texts)
+                _example_vectors = [
+                    (label, vec, math.sqrt(sum(x * x for x in vec)))
+                    for label, vec in zip(labels, vectors)
+                ]
+    return _example_vectors
+
+
+def _classify(text: str) -> Optional[RouteDecision]:
+    """基于标注样例的嵌入相似度分类器 (最近邻)。不确定时返回 None。"""
+    embeddings = _get_embeddings()
+    if embeddings is None:
+        return None
+    examples = _load_example_vectors(embeddings)
+    query_vec = embeddings.embed_query(text)
+    query_norm = math.sqrt(sum(x * x for x in query_vec))
+
+    best_per_label = {}
+    for label, vec, norm in examples:
+        score = _cosine(query_vec, query_norm, vec, norm)
+        if score > best_per_label.get(label, -1.0):
+            best_per_label[label] = score
+
+    ranked = sorted(best_per_label.items(), key=lambda item: item[1], reverse=True)
+    top_label, top_score = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+    if top_score >= CLASSIFIER_MIN_SIMILARITY and top_score - runner_up >= CLASSIFIER_MIN_MARGIN:
+        return RouteDecision(top_label, "classifier", top_score)
+    return None
+
+
+def normalize_instruction(raw_output: str) -> str:
+    """
+    将协调员 LLM 的原始输出规整为标准指令字符串 (去除引号、反引号及多余文字)。
+    :param raw_output: 协调员任务的原始输出。
+    :return: 标准指令字符串；无法识别时原样返回去除首尾引号后的文本。
+    """
+    text = (raw_output or "").strip().strip("'\"`“”‘’ ")
+    marker = TOOL_INSTRUCTION_PREFIX.rstrip(": ")
+    if marker in text:
+        return text[text.index(marker):].strip("'\"`“”‘’ ")
+    for instruction in (INSTRUCTION_END, INSTRUCTION_CLARIFY, INSTRUCTION_DIRECT):
+        if instruction in text:
+            return instruction
+    return text
+
+
+def route_request(user_input: str, history_list: Optional[list] = None, mode: str = ROUTER_MODE) -> Optional[RouteDecision]:
+    """
+    在启动 Crew 之前尝试本地判定协调员指令。
+    :param user_input: 用户当前的输入。
+    :param history_list: 对话历史列表 (例如 ["User: xxx", "AI: yyy", ...])。
+    :param mode: 'hybrid' (规则 + 分类器)、'rules' (仅规则) 或 'off' (关闭，总是交给 LLM 协调员)。
+    :return: 有把握时返回 RouteDecision，否则返回 None 表示需要回退到 LLM 协调员。
+    """
+    if mode == "off":
+        return None
+    text = _normalize(user_input)
+    if not text:
+        return None
+
+    decision = _match_rules(text)
+    if decision is not None:
+        return decision
+
+    # 多轮对话中的追问（如“是的，他拿了5000元”）依赖上下文，交给 LLM 协调员判断更稳妥
+    has_history = any(str(item).startswith("AI:") for item in (history_list or []))
+    if mode != "hybrid" or has_history:
+        return None
+
+    try:
+        return _classify(text)
+    except Exception as e:
+        print(f"⚠️ [快速路由] 分类器执行失败，回退到 LLM 协调员: {e}")
+        return None
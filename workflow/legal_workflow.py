@@ -1,24 +1,20 @@
 # workflow/legal_workflow.py
-from config import llm # 导入llm实例
+import re
+import threading
+from typing import Callable, Iterator
+import math
+from config import get_llm, DEADLINE_LOW_MAX_ITER, TRACING_ENABLED # 共享的 llm 实例在首次使用时创建
 from crewai import Task, Crew, Process
-from agents.legal_agents import (
-    legal_coordinator,
-    legal_tool_executor_agent,
-    legal_response_synthesizer_agent
-)
+from langchain_core.messages import HumanMessage, SystemMessage
+from workflow.answer_cleaning import StreamingAnswerCleaner
+from tools.deadline import current_deadline
+from tools.tracing import span, start_span, record_lap, token_usage
 
-def create_legal_crew(user_input: str, conversation_history: str = "无历史对话") -> Crew:
-    """
-    创建并配置用于处理单个法律咨询请求的 Crew。
-    采用三Agent结构：协调员 -> (条件性)工具执行员 -> 回复整合员。
-    :param user_input: 用户当前的法律问题输入。
-    :param conversation_history: (可选) 此前的对话历史记录。
-    :return: 配置好的 Crew 实例。
-    """
-
-    # 任务1: 由协调员执行，分析输入并做出决策
-    decision_task = Task(
-        description=f"""
+# --- 任务描述模板 ---
+# 每轮变化的取值 ({user_input}、{conversation_history} 等) 以占位符形式保留，由 Crew.kickoff(inputs=...) 在运行时插值，
+# 因此任务与 Crew 只需构建一次。模板中不能出现其他 {xxx} 形式的文本，否则插值时会因缺少对应输入而报错，
+# 上游任务的输出统一称为“上下文 (context)”。
+DECISION_TASK_TEMPLATE = """
         作为法律咨询协调员，请严格遵循你在 Agent Goal 中定义的行动决策强制规则和最终输出格式要求。
         分析以下用户提问和对话历史：
         ---
@@ -28,16 +24,10 @@ def create_legal_crew(user_input: str, conversation_history: str = "无历史对
         ---
         你的任务是：基于你在 Agent Goal 中被设定的详细判断标准，精确判断处理该用户提问的最佳下一步策略，并输出相应的标准指令字符串。
         【特别注意】：你的整个回复**只能是**你在 Agent Goal 中被告知的那四种标准指令字符串之一。不要包含任何其他文字、解释或思考过程。
-        """,
-        agent=legal_coordinator,
-        expected_output="一个标准指令字符串，例如：`'使用工具回答: LAS'` 或 `'需要澄清'` 或 `'无需工具直接回答'` 或 `'生成结束语'`。"
-    )
+        """
 
-    # 任务2: 由工具执行专员处理，根据协调员的决策决定是否调用工具
-    # 它会接收 decision_task 的输出作为 {context}
-    conditional_tool_execution_task = Task(
-        description=f"""
-        现在，你（法律工具执行专员）需要严格根据协调员给出的决策指令（包含在 {{context}} 中）来行动。
+TOOL_EXECUTION_TASK_TEMPLATE = """
+        现在，你（法律工具执行专员）需要严格根据{instruction_source}来行动。
         用户的原始提问是: "{user_input}"
         对话历史是: "{conversation_history}"
 
@@ -45,57 +35,313 @@ def create_legal_crew(user_input: str, conversation_history: str = "无历史对
         - 如果协调员指令是 `'使用工具回答: TOOL_ABBR'`，则解析并执行相应的工具，输出工具调用所需的 Thought/Action/Action Input 格式。
         - 如果协调员指令是 `'需要澄清'`、`'无需工具直接回答'` 或 `'生成结束语'`，则直接将该指令作为你的 `Final Answer` 输出，以便传递给下一个Agent。
         严格遵循你在 Agent Goal 中关于这两种情况的输出格式要求。
-        """,
-        agent=legal_tool_executor_agent,
-        context=[decision_task], # 接收来自协调员决策任务的上下文
-        expected_output="如果调用工具，则是工具调用格式；否则是协调员的原始指令字符串（如 `'需要澄清'`）作为Final Answer。"
-    )
+        """
+# 工具执行任务的指令来源：来自上游协调员任务的上下文，或由快速路由预先给出 (运行时输入 {preset_instruction})
+_INSTRUCTION_FROM_CONTEXT = "协调员给出的决策指令（包含在上下文 context 中）"
+_INSTRUCTION_FROM_INPUT = "协调员给出的决策指令是: '{preset_instruction}'"
 
-    # 任务3: 由回复整合与生成专员生成最终回复
-    # 它会接收 conditional_tool_execution_task 的输出作为 {context}
-    # 注意：如果上一步是工具调用，CrewAI 会自动将 Observation 传递过来，
-    # 如果上一步是 Final Answer (传递指令)，则那个 Final Answer 的内容就是这里的 {context}。
-    # legal_response_synthesizer_agent 的 prompt 需要能够处理这两种输入。
-    final_response_generation_task = Task(
-        description=f"""
-        现在，你（法律回复整合与生成专员）需要根据上一个Agent（工具执行专员）的输出结果（包含在 {{context}} 中），以及最初协调员的指令（也隐含在{{context}}中，如果它是被传递下来的指令的话）、用户的原始提问和对话历史，来生成最终的、直接面向用户的回复。
+SYNTHESIS_TASK_TEMPLATE = """
+        现在，你（法律回复整合与生成专员）需要根据上一个Agent（工具执行专员）的输出结果（包含在上下文 context 中），以及最初协调员的指令（也隐含在上下文中，如果它是被传递下来的指令的话）、用户的原始提问和对话历史，来生成最终的、直接面向用户的回复。
         用户的原始提问是: "{user_input}"
         对话历史是: "{conversation_history}"
-        协调员最初的指令意图需要你从 {{context}} 中判断：
-        - 如果 {{context}} 是 `'需要澄清'`、`'无需工具直接回答'` 或 `'生成结束语'`，则按这些指令生成回复。
-        - 如果 {{context}} 是工具执行后的 `Observation` (通常是一个字典或结构化文本)，则你需要结合原始用户问题和协调员的工具使用意图（例如，如果调用了LAS工具，说明协调员想查找法条），来整合 `Observation` 并生成回复。
+        协调员最初的指令意图需要你从上下文中判断：
+        - 如果上下文是 `'需要澄清'`、`'无需工具直接回答'` 或 `'生成结束语'`，则按这些指令生成回复。
+        - 如果上下文是工具执行后的 `Observation` (通常是一个字典或结构化文本)，则你需要结合原始用户问题和协调员的工具使用意图（例如，如果调用了LAS工具，说明协调员想查找法条），来整合 `Observation` 并生成回复。
 
         你的任务是严格按照你在 Agent Goal 中被设定的指令处理规则（特别是关于判断输入是“非工具指令”还是“工具执行结果Observation”并据此生成不同类型回复的逻辑）来执行。
         确保你的最终输出给用户的文本是纯净的，不包含任何内部处理标签。
-        """,
-        agent=legal_response_synthesizer_agent,
-        context=[conditional_tool_execution_task], # 接收来自工具执行任务的上下文
+        {context_block}
+        """
+# 工具链已由 Python 执行器完成时，上游输出作为运行时输入 {tool_context} 直接写入任务描述
+_TOOL_CONTEXT_BLOCK = """
+        上一个Agent（工具执行专员）的输出结果如下，它就是你需要处理的上下文：
+        ---
+        {tool_context}
+        ---"""
+
+_PLACEHOLDER_PATTERN = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+def render_template(template: str, inputs: dict) -> str:
+    """
+    用 inputs 填充模板中的 {key} 占位符 (单遍替换，取值中的花括号不会被再次解释)。
+    未提供的占位符保持原样，便于分两步填充 (先固定结构，再在 kickoff 时填入每轮取值)。
+    """
+    return _PLACEHOLDER_PATTERN.sub(lambda m: str(inputs[m.group(1)]) if m.group(1) in inputs else m.group(0), template)
+
+
+def _build_decision_task(agent) -> Task:
+    """任务1: 由协调员执行，分析输入并做出决策。"""
+    return Task(
+        description=DECISION_TASK_TEMPLATE,
+        agent=agent,
+        expected_output="一个标准指令字符串，例如：`'使用工具回答: LAS'` 或 `'需要澄清'` 或 `'无需工具直接回答'` 或 `'生成结束语'`。"
+    )
+
+
+def _build_tool_execution_task(agent, decision_task: Task = None) -> Task:
+    """
+    任务2: 由工具执行专员处理，根据协调员的决策决定是否调用工具。
+    :param decision_task: 协调员决策任务，其输出会作为上下文传入；为 None 时指令由运行时输入 {preset_instruction} 给出。
+    """
+    instruction_source = _INSTRUCTION_FROM_CONTEXT if decision_task else _INSTRUCTION_FROM_INPUT
+    return Task(
+        description=render_template(TOOL_EXECUTION_TASK_TEMPLATE, {"instruction_source": instruction_source}),
+        agent=agent,
+        context=[decision_task] if decision_task else [], # 接收来自协调员决策任务的上下文
+        expected_output="如果调用工具，则是工具调用格式；否则是协调员的原始指令字符串（如 `'需要澄清'`）作为Final Answer。"
+    )
+
+
+def _synthesis_template(with_tool_context: bool) -> str:
+    """回复整合任务的描述模板。Crew 任务与流式生成共用同一份提示词。"""
+    return render_template(SYNTHESIS_TASK_TEMPLATE, {"context_block": _TOOL_CONTEXT_BLOCK if with_tool_context else ""})
+
+
+def _build_synthesis_task(agent, context_task: Task = None) -> Task:
+    """
+    任务3: 由回复整合与生成专员生成最终回复。
+    :param context_task: 上游任务 (工具执行任务)，其输出会作为上下文传入；为 None 时上游输出由运行时输入 {tool_context} 给出。
+    """
+    # 它会接收 conditional_tool_execution_task 的输出作为上下文
+    # 注意：如果上一步是工具调用，CrewAI 会自动将 Observation 传递过来，
+    # 如果上一步是 Final Answer (传递指令)，则那个 Final Answer 的内容就是这里的上下文。
+    # legal_response_synthesizer_agent 的 prompt 需要能够处理这两种输入。
+    return Task(
+        description=_synthesis_template(with_tool_context=context_task is None),
+        agent=agent,
+        context=[context_task] if context_task else [], # 接收来自工具执行任务的上下文
         expected_output="最终的、直接面向用户的纯净文本回复。"
     )
 
-    # --- 创建工作组 (Crew) ---
+
+def _trace_task_output(output):
+    """Crew 的 task_callback：每个任务完成时记录一个以执行该任务的 Agent 命名的 span。"""
+    record_lap(str(getattr(output, "agent", None) or "task"), "task")
+
+
+def _assemble_crew(name: str, agents: list, tasks: list) -> Crew:
+    """创建工作组 (Crew) 并打印概览。"""
     legal_crew = Crew(
-        agents=[
-            legal_coordinator,
-            legal_tool_executor_agent,
-            legal_response_synthesizer_agent
-        ],
-        tasks=[
-            decision_task,
-            conditional_tool_execution_task,
-            final_response_generation_task
-        ],
-        llm=llm,
+        agents=agents,
+        tasks=tasks,
+        llm=get_llm(),
         process=Process.sequential,
         verbose=True,
+        # 追踪开启时按任务记录耗时 (见 tools/tracing.py)
+        task_callback=_trace_task_output if TRACING_ENABLED else None,
         # memory=True # 按需启用
     )
 
     print("-" * 30)
-    print("工作流 (Crew) 创建完成。")
+    print(f"工作流模板 [{name}] 创建完成。")
     print(f"  -包含 Agents: {[agent.role for agent in legal_crew.agents]}")
     print(f"  -包含 Tasks: {[task.description.split('---')[0].strip() for task in legal_crew.tasks]}") # 调整打印，避免过长
     print(f"  -流程类型: {legal_crew.process}")
     print("-" * 30)
 
-    return legal_crew
\ No newline at end of file
+    return legal_crew
+
+
+def _agents():
+    """
+    延迟导入 Agent 定义模块：Agent 创建时需要绑定 LLM (会创建 LLM 客户端并写入 LiteLLM 环境变量)，
+    因此推迟到首次构建 Crew 模板 (或首次流式整合) 时才导入，导入本模块、main 与 server 本身没有这些副作用。
+    """
+    from agents import legal_agents
+    return legal_agents
+
+
+def _copy_agent(agent):
+    """为模板实例复制一份 Agent：kickoff 期间 Agent 会挂载自己的执行器，共享同一对象的并发 kickoff 会互相覆盖。"""
+    try:
+        return agent.copy()
+    except Exception as e:
+        print(f"⚠️ 无法复制 Agent '{agent.role}'，将直接共享原对象: {e}")
+        return agent
+
+
+def _full_crew_parts():
+    """完整工作流：协调员 -> (条件性)工具执行员 -> 回复整合员。"""
+    coordinator = _copy_agent(_agents().legal_coordinator)
+    executor = _copy_agent(_agents().legal_tool_executor_agent)
+    synthesizer = _copy_agent(_agents().legal_response_synthesizer_agent)
+    decision_task = _build_decision_task(coordinator)
+    tool_task = _build_tool_execution_task(executor, decision_task)
+    return [coordinator, executor, synthesizer], [decision_task, tool_task, _build_synthesis_task(synthesizer, tool_task)]
+
+
+def _preset_crew_parts():
+    """快速路由已给出指令时，协调员及其决策任务不再参与执行：工具执行员 -> 回复整合员。"""
+    executor = _copy_agent(_agents().legal_tool_executor_agent)
+    synthesizer = _copy_agent(_agents().legal_response_synthesizer_agent)
+    tool_task = _build_tool_execution_task(executor)
+    return [executor, synthesizer], [tool_task, _build_synthesis_task(synthesizer, tool_task)]
+
+
+def _decision_crew_parts():
+    """只包含协调员决策任务，用于 Python 工具链执行模式下获取协调员指令。"""
+    coordinator = _copy_agent(_agents().legal_coordinator)
+    return [coordinator], [_build_decision_task(coordinator)]
+
+
+def _synthesis_crew_parts():
+    """只包含回复整合任务。工具链已由 Python 执行器直接完成，这里只需整合结果。"""
+    synthesizer = _copy_agent(_agents().legal_response_synthesizer_agent)
+    return [synthesizer], [_build_synthesis_task(synthesizer)]
+
+
+class LegalCrewTemplate:
+    """
+    预构建、可复用的 Crew 模板。
+    任务描述中只保留 {user_input} 等占位符，每轮的取值通过 kickoff 的 inputs 在运行时插值，因此每轮请求不再重建 Task/Crew。
+    Crew 在 kickoff 期间会写入执行状态 (任务输出、Agent 执行器等)，所以每个线程持有一份独立的实例 (Agent 为副本)，
+    实例在线程内首次使用时构建一次，服务模式下的并发会话互不干扰。
+    """
+
+    def __init__(self, name: str, parts_builder: Callable[[], tuple], input_keys: tuple):
+        self.name = name
+        self.input_keys = tuple(input_keys)
+        self._parts_builder = parts_builder
+        self._local = threading.local()
+
+    def build(self) -> Crew:
+        """构建一份新的 Crew 实例 (通常无需直接调用，见 instance)。"""
+        agents, tasks = self._parts_builder()
+        return _assemble_crew(self.name, agents, tasks)
+
+    def instance(self) -> Crew:
+        """返回当前线程的 Crew 实例，首次调用时构建。"""
+        crew = getattr(self._local, "crew", None)
+        if crew is None:
+            crew = self._local.crew = self.build()
+            # 记下各 Agent 的默认迭代次数与执行时限，每次 kickoff 按当前请求的时间预算重新设置
+            self._local.defaults = [(agent.max_iter, agent.max_execution_time) for agent in crew.agents]
+        return crew
+
+    def _apply_deadline(self, crew: Crew):
+        """
+        把当前请求剩余的时间预算传给本次执行的各个 Agent：执行时限不超过剩余时间；
+        时间紧张时减少 ReAct 最大迭代次数。没有时间预算时恢复默认值。
+        """
+        deadline = current_deadline()
+        for agent, (max_iter, max_execution_time) in zip(crew.agents, self._local.defaults):
+            agent.max_iter, agent.max_execution_time = max_iter, max_execution_time
+            if deadline is None:
+                continue
+            limit = max(1, math.ceil(deadline.remaining()))
+            agent.max_execution_time = min(limit, max_execution_time) if max_execution_time else limit
+            if deadline.is_low() and max_iter > DEADLINE_LOW_MAX_ITER:
+                agent.max_iter = DEADLINE_LOW_MAX_ITER
+                deadline.degrade(self.name, f"时间紧张，{agent.role} 的最大迭代次数 {max_iter}->{DEADLINE_LOW_MAX_ITER}")
+
+    def kickoff(self, **inputs):
+        """
+        以本轮取值执行模板。
+        :param inputs: 模板占位符的取值，必须覆盖 input_keys。
+        :return: crew.kickoff() 的返回值。
+        """
+        missing = [key for key in self.input_keys if key not in inputs]
+        if missing:
+            raise ValueError(f"工作流模板 [{self.name}] 缺少输入: {missing}")
+        crew = self.instance()
+        self._apply_deadline(crew)
+        with span(self.name, "task") as trace:
+            result = crew.kickoff(inputs={key: str(inputs[key]) for key in self.input_keys})
+            usage = getattr(result, "token_usage", None)
+            trace.add_tokens(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+            return result
+
+
+_BASE_INPUTS = ("user_input", "conversation_history")
+
+# 完整工作流 (CrewAI 工具执行模式)
+legal_crew_template = LegalCrewTemplate("完整工作流", _full_crew_parts, _BASE_INPUTS)
+# 快速路由已给出指令时的工作流 (CrewAI 工具执行模式)
+preset_crew_template = LegalCrewTemplate("预设指令工作流", _preset_crew_parts, _BASE_INPUTS + ("preset_instruction",))
+# 仅协调员决策 (Python 工具链执行模式)
+decision_crew_template = LegalCrewTemplate("协调员决策", _decision_crew_parts, _BASE_INPUTS)
+# 仅回复整合 (Python 工具链执行模式)
+synthesis_crew_template = LegalCrewTemplate("回复整合", _synthesis_crew_parts, _BASE_INPUTS + ("tool_context",))
+
+
+def run_legal_crew(user_input: str, conversation_history: str = "无历史对话", preset_instruction: str = None):
+    """
+    执行处理单个法律咨询请求的完整工作流。
+    :param user_input: 用户当前的法律问题输入。
+    :param conversation_history: (可选) 此前的对话历史记录。
+    :param preset_instruction: (可选) 快速路由已确定的协调员指令。提供时跳过协调员任务，省去一次 LLM 调用。
+    :return: crew.kickoff() 的返回值。
+    """
+    if preset_instruction:
+        return preset_crew_template.kickoff(
+            user_input=user_input, conversation_history=conversation_history, preset_instruction=preset_instruction
+        )
+    return legal_crew_template.kickoff(user_input=user_input, conversation_history=conversation_history)
+
+
+def run_decision_crew(user_input: str, conversation_history: str = "无历史对话"):
+    """执行协调员决策任务，返回 crew.kickoff() 的结果，其输出为标准指令字符串。"""
+    return decision_crew_template.kickoff(user_input=user_input, conversation_history=conversation_history)
+
+
+def run_synthesis_crew(user_input: str, conversation_history: str, tool_context: str):
+    """
+    执行回复整合任务。
+    :param tool_context: 协调员的非工具指令，或 ObservationBundle 渲染出的工具执行结果。
+    :return: crew.kickoff() 的返回值。
+    """
+    return synthesis_crew_template.kickoff(
+        user_input=user_input, conversation_history=conversation_history, tool_context=tool_context
+    )
+
+
+def stream_synthesis(user_input: str, conversation_history: str, tool_context: str) -> Iterator[str]:
+    """
+    流式生成最终回复：绕过 Crew，直接以回复整合专员的角色设定调用 llm.stream，逐块产出清理后的文本。
+    前缀清理 (StreamingAnswerCleaner) 在流上增量执行，因此用户看到的内容与整段清理的结果一致。
+    :param tool_context: 协调员的非工具指令，或 ObservationBundle 渲染出的工具执行结果。
+    :return: 逐块产出面向用户的回复文本的迭代器。
+    """
+    agent = _agents().legal_response_synthesizer_agent
+    description = render_template(_synthesis_template(with_tool_context=True), {
+        "user_input": user_input, "conversation_history": conversation_history, "tool_context": tool_context,
+    })
+    messages = [
+        SystemMessage(content=f"你是{agent.role}。{agent.backstory}\n你的目标：{agent.goal}"),
+        HumanMessage(content=description
+                     + "\n请直接输出你的 Final Answer 的正文内容，不要输出 Thought/Final Answer 等任何标签。"),
+    ]
+    llm = get_llm()
+    cleaner = StreamingAnswerCleaner()
+    deadline = current_deadline()
+    # 生成器在调用方的多次迭代之间执行，span 不设为当前 span，由 finally 结束 (调用方提前停止迭代时也会结束)
+    trace = start_span("synthesis", "llm", streaming=hasattr(llm, "stream"))
+    try:
+        if hasattr(llm, "stream"):
+            for chunk in llm.stream(messages):
+                # 流式接口的 token 数通常只出现在最后一块中
+                trace.add_tokens(*token_usage(chunk))
+                piece = cleaner.feed(getattr(chunk, "content", None) or "")
+                if piece:
+                    yield piece
+                if deadline is not None and deadline.remaining() <= 0:
+                    # 超过整轮的截止时间：停止生成，已输出的部分作为回复
+                    deadline.degrade("回复整合", "超出时间预算，回复被截断")
+                    trace.set(truncated=True)
+                    yield cleaner.finish() + "\n\n(已达到本轮响应时间上限，回复未完整生成。)"
+                    return
+        else:
+            response = llm.invoke(messages)
+            trace.add_tokens(*token_usage(response))
+            piece = cleaner.feed(getattr(response, "content", None) or str(response))
+            if piece:
+                yield piece
+        tail = cleaner.finish()
+        if tail:
+            yield tail
+    except Exception as e:
+        trace.fail(e)
+        raise
+    finally:
+        trace.end()
@@ -0,0 +1,251 @@
+# multi_agent/workflow/response_cache.py
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+
+from config import (
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_AGE_SECONDS,
+    RESPONSE_CACHE_HISTORY_TURNS,
+)
+from workflow.conversation_memory import extract_facts
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+# 法条索引的建库清单 (含各文件内容哈希)：其内容变化即代表法条库已更新，缓存的回答需要作废。
+# 旧版建库只有处理日志 (文件名列表)，清单不存在时退回使用该日志。
+LEGAL_INDEX_MANIFEST_PATH = os.path.join(project_root, "docs", "legal_db", "index_manifest.json")
+LEGAL_INDEX_LOG_PATH = os.path.join(project_root, "docs", "legal_db", "processed_files.log")
+
+# 这些回复不应被缓存 (错误或兜底信息)
+_UNCACHEABLE_PREFIXES = ("抱歉，处理您的请求时遇到了内部错误", "抱歉，处理过程中未能获取明确的回复")
+
+
+@dataclass
+class CacheHit:
+    """缓存命中结果。"""
+    answer: str
+    match_type: str     # 'exact' 或 'semantic'
+    similarity: float
+    question: str       # 命中条目对应的原始问题
+
+
+def normalize_question(text: str) -> str:
+    """问题归一化：全角转半角、小写、去除空白与标点。"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if not ch.isspace() and not unicodedata.category(ch).startswith("P"))
+
+
+def history_fingerprint(history_list: list, user_input: str, turns: int = RESPONSE_CACHE_HISTORY_TURNS) -> str:
+    """
+    计算“相关历史”的指纹：取当前提问之前的最近若干条历史记录，归一化后做哈希。
+    更早的对话不原样参与计算，但其中的关键事实 (当事人、金额、日期) 会被对话记忆置顶传给 Agent、影响回答，
+    因此一并计入指纹：最近几轮相同而早先案情不同的两个会话不会共用回答。
+    没有历史时返回 'none'，这样首轮提问可以跨会话共享缓存。
+    """
+    history = list(history_list or [])
+    if history and history[-1] == f"User: {user_input}":
+        history = history[:-1]
+    if turns > 0:
+        earlier, relevant = history[:-turns], history[-turns:]
+    else:
+        earlier, relevant = history, []
+    if not relevant and not earlier:
+        return "none"
+    parts = [normalize_question(item) for item in relevant]
+    earlier_facts = [f"{kind}:{'、'.join(values)}" for kind, values in extract_facts(earlier).items() if values]
+    if earlier_facts:
+        parts.append("facts|" + "|".join(earlier_facts))
+    joined = "\n".join(parts)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    位于 execute_workflow 之前的回答缓存。
+    查找顺序：先按 (归一化问题 + 历史指纹) 精确匹配，再在相同历史指纹的条目中做 m3e 向量相似度匹配。
+    存储在 SQLite 中，按条目数和存活时间淘汰；法条索引更新后自动清空。
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH,
+                 similarity_threshold: float = RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_age_seconds: float = RESPONSE_CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._index_stat = None
+        self._index_version = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                cache_key TEXT PRIMARY KEY,
+                history_fp TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_fp ON answers(history_fp)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    # --- 索引版本与失效 ---
+    def _current_index_version(self) -> str:
+        """根据建库清单 (或旧版 processed_files.log) 的内容计算法条索引版本；文件未变化时复用上次结果。"""
+        path = LEGAL_INDEX_MANIFEST_PATH if os.path.exists(LEGAL_INDEX_MANIFEST_PATH) else LEGAL_INDEX_LOG_PATH
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return "missing"
+        stat_key = (path, stat.st_mtime_ns, stat.st_size)
+        if stat_key != self._index_stat:
+            with open(path, "rb") as f:
+                self._index_version = hashlib.sha1(f.read()).hexdigest()
+            self._index_stat = stat_key
+        return self._index_version
+
+    def _check_index_version(self):
+        version = self._current_index_version()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+        if row is None or row[0] != version:
+            if row is not None:
+                print("--- [回答缓存] 检测到法条索引已更新，清空已缓存的回答 ---")
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('index_version', ?)", (version,))
+            self._conn.commit()
+
+    # --- 向量工具 ---
+    def _embed(self, normalized: str):
+        # lookup 之后 store 时再次编码同一问题会命中共享嵌入服务 (EmbeddingService) 的查询缓存，不会重复计算；
+        # 这里不另存“上一个向量”，服务模式下多个工作线程共用同一个 ResponseCache
+        import numpy as np
+        from tools import legal_tools
+        legal_tools._initialize_embeddings()
+        if legal_tools.embeddings is None:
+            return None
+        vector = np.asarray(legal_tools.embeddings.embed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @staticmethod
+    def _cache_key(normalized: str, fingerprint: str) -> str:
+        return hashlib.sha1(f"{normalized}|{fingerprint}".encode("utf-8")).hexdigest()
+
+    # --- 对外接口 ---
+    def lookup(self, user_input: str, history_list: list) -> Optional[CacheHit]:
+        """
+        查找缓存的回答。
+        :param user_input: 用户当前提问。
+        :param history_list: 对话历史列表。
+        :return: 命中时返回 CacheHit，否则返回 None。
+        """
+        normalized = normalize_question(user_input)
+        if not normalized:
+            return None
+        fingerprint = history_fingerprint(history_list, user_input)
+        now = time.time()
+
+        with self._lock:
+            self._check_index_version()
+            min_created = now - self.max_age_seconds
+            key = self._cache_key(normalized, fingerprint)
+            row = self._conn.execute(
+                "SELECT answer, question FROM answers WHERE cache_key = ? AND created_at >= ?", (key, min_created)
+            ).fetchone()
+            if row is not None:
+                self._touch(key, now)
+                return CacheHit(row[0], "exact", 1.0, row[1])
+
+            candidates = self._conn.execute(
+                "SELECT cache_key, answer, question, embedding FROM answers "
+                "WHERE history_fp = ? AND created_at >= ? AND embedding IS NOT NULL", (fingerprint, min_created)
+            ).fetchall()
+        if not candidates:
+            return None
+
+        import numpy as np
+        query_vec = self._embed(normalized)
+        if query_vec is None:
+            return None
+        matrix = np.vstack([np.frombuffer(c[3], dtype=np.float32) for c in candidates])
+        scores = matrix @ query_vec
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        with self._lock:
+            self._touch(candidates[best][0], now)
+        return CacheHit(candidates[best][1], "semantic", float(scores[best]), candidates[best][2])
+
+    def store(self, user_input: str, history_list: list, answer: str):
+        """写入一条回答，并执行淘汰。错误信息等兜底回复不会被缓存。"""
+        normalized = normalize_question(user_input)
+        if not normalized or not answer or answer.startswith(_UNCACHEABLE_PREFIXES):
+            return
+        fingerprint = history_fingerprint(history_list, user_input)
+        try:
+            vector = self._embed(normalized)
+        except Exception as e:
+            print(f"⚠️ [回答缓存] 计算问题向量失败，仅支持精确匹配: {e}")
+            vector = None
+        blob = vector.tobytes() if vector is not None else None
+        now = time.time()
+
+        with self._lock:
+            self._check_index_version()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (cache_key, history_fp, question, answer, embedding, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (self._cache_key(normalized, fingerprint), fingerprint, user_input, answer, blob, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def _touch(self, key: str, now: float):
+        self._conn.execute("UPDATE answers SET last_access = ?, hits = hits + 1 WHERE cache_key = ?", (now, key))
+        self._conn.commit()
+
+    def _evict(self, now: float):
+        """淘汰过期条目，并在超出容量时按最近访问时间淘汰最旧的条目。"""
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.max_age_seconds,))
+        self._conn.execute(
+            "DELETE FROM answers WHERE cache_key IN ("
+            "SELECT cache_key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程内共享的回答缓存实例；初始化失败时返回 None (缓存不可用不影响主流程)。"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                try:
+                    _response_cache = ResponseCache()
+                except Exception as e:
+                    print(f"⚠️ [回答缓存] 初始化失败，本次运行将不使用缓存: {e}")
+                    return None
+    return _response_cache